@@ -12,6 +12,10 @@ from datetime import timedelta
 from src.database import db
 from src.models.auth import User, UserSession
 from src.models.patient import Patient, MedicalRecord, HealthSystem, DataQualityIssue, DashboardMetrics
+from src.models.quality import PatientBlockingKey, DuplicateCandidate, IssueMetricsRollup, QualitySnapshot, DepartmentSnapshot
+from src.models.integration import SyncLog, SyncLogDaily
+from src.utils.migrations import apply_migrations
+from src.utils.sync_scheduler import start_sync_scheduler
 
 # Importar blueprints
 from src.routes.user import user_bp
@@ -21,6 +25,7 @@ from src.routes.patients import patients_bp
 from src.routes.issues import issues_bp
 from src.routes.integrations import integrations_bp
 from src.routes.analytics import analytics_bp
+from src.routes.exports import exports_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -28,6 +33,9 @@ app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'sta
 app.config['SECRET_KEY'] = 'healthgraph-radar-secret-key-2024'
 app.config['JWT_SECRET_KEY'] = 'healthgraph-jwt-secret-key-2024'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=8)
+app.config['DASHBOARD_SNAPSHOT_TTL'] = int(os.environ.get('DASHBOARD_SNAPSHOT_TTL', 30))  # segundos
+app.config['SYNC_SCHEDULER_ENABLED'] = os.environ.get('SYNC_SCHEDULER_ENABLED', '0') == '1'
+app.config['SYNC_WORKERS'] = int(os.environ.get('SYNC_WORKERS', 4))
 
 # Configurar CORS
 CORS(app, origins="*")
@@ -43,6 +51,7 @@ app.register_blueprint(patients_bp, url_prefix='/api/patients')
 app.register_blueprint(issues_bp, url_prefix='/api/issues')
 app.register_blueprint(integrations_bp, url_prefix='/api/integrations')
 app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+app.register_blueprint(exports_bp, url_prefix='/api/exports')
 
 # Configurar banco de dados
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(os.path.dirname(__file__)), 'healthgraph.db')}"
@@ -51,9 +60,14 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 # Inicializar bancos de dados
 db.init_app(app)
 
-# Criar tabelas se não existirem
+# Criar tabelas se não existirem e aplicar migrações em bancos existentes
 with app.app_context():
     db.create_all()
+    apply_migrations(db.engine)
+
+# Sincronizações agendadas pela frequência de cada sistema
+if app.config['SYNC_SCHEDULER_ENABLED']:
+    start_sync_scheduler(app)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
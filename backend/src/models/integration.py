@@ -0,0 +1,65 @@
+from src.database import db
+from datetime import datetime
+
+class SyncLog(db.Model):
+    __tablename__ = 'sync_logs'
+    __table_args__ = (
+        # Logs de um sistema em ordem cronológica (detalhes do sistema e filtro por system_id)
+        db.Index('ix_sync_logs_system_timestamp', 'system_id', 'timestamp'),
+        # Logs de todos os sistemas em uma janela de tempo
+        db.Index('ix_sync_logs_timestamp', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    system_id = db.Column(db.Integer, db.ForeignKey('health_systems.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    event = db.Column(db.String(20), nullable=False, default='sync')  # sync, test, ingest
+    status = db.Column(db.String(20), nullable=False)  # success, warning, error
+    message = db.Column(db.String(200), nullable=False)
+    details = db.Column(db.Text)
+    records_synced = db.Column(db.Integer, nullable=False, default=0)
+    duration_ms = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'system_id': self.system_id,
+            'timestamp': self.timestamp.isoformat() if self.timestamp else None,
+            'event': self.event,
+            'status': self.status,
+            'message': self.message,
+            'details': self.details,
+            'records_synced': self.records_synced,
+            'duration_ms': self.duration_ms
+        }
+
+class SyncLogDaily(db.Model):
+    __tablename__ = 'sync_log_daily'
+    __table_args__ = (
+        db.UniqueConstraint('system_id', 'day', 'event', name='uq_sync_log_daily_key'),
+    )
+
+    # Totais diários dos logs compactados (removidos de sync_logs pela política de retenção)
+    id = db.Column(db.Integer, primary_key=True)
+    system_id = db.Column(db.Integer, db.ForeignKey('health_systems.id'), nullable=False)
+    day = db.Column(db.Date, nullable=False)
+    event = db.Column(db.String(20), nullable=False)
+    success_count = db.Column(db.Integer, nullable=False, default=0)
+    warning_count = db.Column(db.Integer, nullable=False, default=0)
+    error_count = db.Column(db.Integer, nullable=False, default=0)
+    records_synced = db.Column(db.Integer, nullable=False, default=0)
+    duration_sum = db.Column(db.Integer, nullable=False, default=0)  # ms
+    duration_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def to_dict(self):
+        return {
+            'system_id': self.system_id,
+            'day': self.day.isoformat() if self.day else None,
+            'event': self.event,
+            'success_count': self.success_count,
+            'warning_count': self.warning_count,
+            'error_count': self.error_count,
+            'records_synced': self.records_synced,
+            'duration_sum': self.duration_sum,
+            'duration_count': self.duration_count
+        }
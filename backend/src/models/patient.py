@@ -4,6 +4,11 @@ import json
 
 class Patient(db.Model):
     __tablename__ = 'patients'
+    __table_args__ = (
+        db.Index('ix_patients_name', 'name'),
+        # Execuções incrementais da detecção de duplicidades
+        db.Index('ix_patients_updated_at', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.String(50), unique=True, nullable=False)
@@ -38,6 +43,16 @@ class Patient(db.Model):
 
 class MedicalRecord(db.Model):
     __tablename__ = 'medical_records'
+    __table_args__ = (
+        # Contagens por paciente e timeline ordenada por data
+        db.Index('ix_medical_records_patient_date', 'patient_id', 'record_date'),
+        # Fragmentos por sistema na visão 360 (agregação coberta pelo índice)
+        db.Index('ix_medical_records_patient_system', 'patient_id', 'system_source', 'created_at'),
+        # Pacientes por departamento na análise comparativa
+        db.Index('ix_medical_records_department_patient', 'department', 'patient_id'),
+        # Upsert da ingestão incremental (ID do registro no sistema de origem)
+        db.Index('ux_medical_records_source_external', 'system_source', 'external_id', unique=True),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
@@ -46,6 +61,7 @@ class MedicalRecord(db.Model):
     doctor_name = db.Column(db.String(100))
     department = db.Column(db.String(50))
     system_source = db.Column(db.String(50), nullable=False)
+    external_id = db.Column(db.String(100))  # ID no sistema de origem (registros ingeridos)
     record_date = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -58,6 +74,7 @@ class MedicalRecord(db.Model):
             'doctor_name': self.doctor_name,
             'department': self.department,
             'system_source': self.system_source,
+            'external_id': self.external_id,
             'record_date': self.record_date.isoformat() if self.record_date else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
@@ -72,6 +89,12 @@ class HealthSystem(db.Model):
     last_sync = db.Column(db.DateTime)
     sync_frequency = db.Column(db.Integer, default=60)  # minutes
     description = db.Column(db.Text)
+    # Base FHIR da integração testada pelo verificador de conectividade
+    endpoint_url = db.Column(db.String(255))
+    auth_token = db.Column(db.String(255))  # não exposto em to_dict
+    # Marca d'água da ingestão: último (updated_at, id) de origem já gravado
+    sync_watermark = db.Column(db.DateTime)
+    sync_watermark_id = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relacionamentos
@@ -86,15 +109,34 @@ class HealthSystem(db.Model):
             'last_sync': self.last_sync.isoformat() if self.last_sync else None,
             'sync_frequency': self.sync_frequency,
             'description': self.description,
+            'endpoint_url': self.endpoint_url,
+            'sync_watermark': self.sync_watermark.isoformat() if self.sync_watermark else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
 class DataQualityIssue(db.Model):
     __tablename__ = 'data_quality_issues'
+    __table_args__ = (
+        # Listagem do centro de resolução e alertas do dashboard (status + prioridade, mais recentes primeiro)
+        db.Index('ix_dqi_status_priority_detected', 'status', 'priority', 'detected_at'),
+        # Contagens por tipo (duplicidades, campos ausentes) e filtro por tipo
+        db.Index('ix_dqi_status_type_detected', 'status', 'issue_type', 'detected_at'),
+        # Histórico de resoluções e métricas do mês
+        db.Index('ix_dqi_status_resolved', 'status', 'resolved_at'),
+        db.Index('ix_dqi_detected', 'detected_at'),
+        # Problemas abertos por paciente e por sistema
+        db.Index('ix_dqi_patient_status', 'patient_id', 'status'),
+        # Timeline do paciente (problemas mais recentes primeiro)
+        db.Index('ix_dqi_patient_detected', 'patient_id', 'detected_at'),
+        db.Index('ix_dqi_system_status', 'system_id', 'status'),
+        # Problemas em aberto de um registro (detectores da ingestão)
+        db.Index('ix_dqi_record_status', 'record_id', 'status'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=True)
     system_id = db.Column(db.Integer, db.ForeignKey('health_systems.id'), nullable=False)
+    record_id = db.Column(db.Integer, db.ForeignKey('medical_records.id'), nullable=True)
     issue_type = db.Column(db.String(50), nullable=False)  # duplicate, missing, conflict, format
     priority = db.Column(db.String(20), default='medium')  # high, medium, low
     title = db.Column(db.String(200), nullable=False)
@@ -109,6 +151,7 @@ class DataQualityIssue(db.Model):
             'id': self.id,
             'patient_id': self.patient_id,
             'system_id': self.system_id,
+            'record_id': self.record_id,
             'issue_type': self.issue_type,
             'priority': self.priority,
             'title': self.title,
@@ -121,6 +164,10 @@ class DataQualityIssue(db.Model):
 
 class DashboardMetrics(db.Model):
     __tablename__ = 'dashboard_metrics'
+    __table_args__ = (
+        # Leitura do valor mais recente de cada métrica
+        db.Index('ix_dashboard_metrics_name_dept', 'metric_name', 'department', 'calculated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     metric_name = db.Column(db.String(100), nullable=False)
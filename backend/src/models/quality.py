@@ -0,0 +1,142 @@
+from src.database import db
+from datetime import datetime
+
+class PatientBlockingKey(db.Model):
+    __tablename__ = 'patient_blocking_keys'
+    __table_args__ = (
+        # Busca dos membros de um bloco (key_type + key_value)
+        db.Index('ix_blocking_keys_key', 'key_type', 'key_value'),
+        db.Index('ix_blocking_keys_patient', 'patient_id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    key_type = db.Column(db.String(20), nullable=False)  # cpf, phonetic, birth_gender
+    key_value = db.Column(db.String(100), nullable=False)
+    patient_updated_at = db.Column(db.DateTime)  # versão do paciente usada para gerar a chave
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'key_type': self.key_type,
+            'key_value': self.key_value,
+            'patient_updated_at': self.patient_updated_at.isoformat() if self.patient_updated_at else None
+        }
+
+class DuplicateCandidate(db.Model):
+    __tablename__ = 'duplicate_candidates'
+    __table_args__ = (
+        db.UniqueConstraint('patient_id', 'duplicate_patient_id', name='uq_duplicate_candidates_pair'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    duplicate_patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    matched_keys = db.Column(db.String(100))
+    issue_id = db.Column(db.Integer, db.ForeignKey('data_quality_issues.id'))
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'patient_id': self.patient_id,
+            'duplicate_patient_id': self.duplicate_patient_id,
+            'score': self.score,
+            'matched_keys': self.matched_keys,
+            'issue_id': self.issue_id,
+            'detected_at': self.detected_at.isoformat() if self.detected_at else None
+        }
+
+class IssueMetricsRollup(db.Model):
+    __tablename__ = 'issue_metrics_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'system_id', 'issue_type', 'priority', 'status', name='uq_issue_metrics_rollup_key'),
+        db.Index('ix_issue_metrics_rollup_status_day', 'status', 'day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    # Dia da detecção (status detected/open/in_progress) ou da resolução (status resolved)
+    day = db.Column(db.Date, nullable=False)
+    system_id = db.Column(db.Integer, nullable=False)
+    issue_type = db.Column(db.String(50), nullable=False)
+    priority = db.Column(db.String(20), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # detected (todas as detecções), open, in_progress, resolved
+    issue_count = db.Column(db.Integer, nullable=False, default=0)
+    resolution_count = db.Column(db.Integer, nullable=False, default=0)
+    resolution_time_sum = db.Column(db.Integer, nullable=False, default=0)  # minutes
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'system_id': self.system_id,
+            'issue_type': self.issue_type,
+            'priority': self.priority,
+            'status': self.status,
+            'issue_count': self.issue_count,
+            'resolution_count': self.resolution_count,
+            'resolution_time_sum': self.resolution_time_sum
+        }
+
+class QualitySnapshot(db.Model):
+    __tablename__ = 'quality_snapshots'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False, unique=True)
+    # Pontuações capturadas pelo job no próprio dia (nulas em dias reconstruídos do histórico)
+    quality_score = db.Column(db.Float)
+    completeness_rate = db.Column(db.Float)
+    consistency_rate = db.Column(db.Float)
+    system_availability = db.Column(db.Float)
+    # Contagens de problemas do dia, recalculadas a partir do rollup
+    open_issues = db.Column(db.Integer, nullable=False, default=0)  # em aberto ao final do dia
+    detected_issues = db.Column(db.Integer, nullable=False, default=0)
+    resolved_issues = db.Column(db.Integer, nullable=False, default=0)
+    calculated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'quality_score': self.quality_score,
+            'completeness_rate': self.completeness_rate,
+            'consistency_rate': self.consistency_rate,
+            'system_availability': self.system_availability,
+            'open_issues': self.open_issues,
+            'detected_issues': self.detected_issues,
+            'resolved_issues': self.resolved_issues,
+            'calculated_at': self.calculated_at.isoformat() if self.calculated_at else None
+        }
+
+class DepartmentSnapshot(db.Model):
+    __tablename__ = 'department_snapshots'
+    __table_args__ = (
+        db.UniqueConstraint('department', 'day', name='uq_department_snapshots_department_day'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    department = db.Column(db.String(50), nullable=False)
+    total_records = db.Column(db.Integer, nullable=False, default=0)
+    completeness_rate = db.Column(db.Float)
+    open_issues = db.Column(db.Integer, nullable=False, default=0)
+    # Totais acumulados até o dia: a diferença entre dois dias dá o movimento do período
+    detected_total = db.Column(db.Integer, nullable=False, default=0)
+    resolved_total = db.Column(db.Integer, nullable=False, default=0)
+    resolution_time_sum = db.Column(db.Integer, nullable=False, default=0)  # minutes
+    resolution_count = db.Column(db.Integer, nullable=False, default=0)
+    calculated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'day': self.day.isoformat() if self.day else None,
+            'department': self.department,
+            'total_records': self.total_records,
+            'completeness_rate': self.completeness_rate,
+            'open_issues': self.open_issues,
+            'detected_total': self.detected_total,
+            'resolved_total': self.resolved_total,
+            'resolution_time_sum': self.resolution_time_sum,
+            'resolution_count': self.resolution_count,
+            'calculated_at': self.calculated_at.isoformat() if self.calculated_at else None
+        }
@@ -1,70 +1,73 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.patient import Patient, DataQualityIssue, HealthSystem, DashboardMetrics, db
+from src.utils.department_analytics import get_department_metrics, refresh_department_metrics
+from src.utils.kpi_engine import get_kpis
+from src.utils.report_jobs import get_report_queue
+from src.utils.report_writers import REPORT_WRITERS
+from src.utils.quality_snapshots import get_quality_trends, run_snapshot_job, series
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
-import random
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def _own_report_job(job_id):
+    """Job de relatório do usuário autenticado (None se não existe ou é de outro usuário)"""
+    job = get_report_queue(current_app._get_current_object()).get(job_id)
+    if job is None or str(job.requested_by) != str(get_jwt_identity()):
+        return None
+    return job
+
 @analytics_bp.route('/trends', methods=['GET'])
 @jwt_required()
 def get_trends():
     """Endpoint para obter tendências temporais"""
     try:
         days = request.args.get('days', 30, type=int)
+        bucket = request.args.get('bucket')
+        
+        # Série diária de snapshots, agrupada em dia/semana/mês conforme o intervalo
+        trends = get_quality_trends(days, bucket)
         
-        # Simular dados de tendências dos últimos N dias
         trends_data = {
-            'quality_evolution': [],
-            'issues_resolved': [],
-            'system_availability': [],
-            'data_completeness': []
+            'quality_evolution': series(trends, 'quality_score', 'quality_score'),
+            'issues_resolved': series(trends, 'resolved_issues', 'count'),
+            'system_availability': series(trends, 'system_availability', 'availability'),
+            'data_completeness': series(trends, 'completeness_rate', 'completeness')
         }
         
-        current_date = datetime.utcnow().date()
+        return jsonify({'trends': trends_data, 'bucket': trends['bucket']}), 200
         
-        for i in range(days):
-            date = current_date - timedelta(days=i)
-            
-            # Simular evolução da qualidade (com tendência de melhoria)
-            base_quality = 70 + (i * 0.2) + random.uniform(-3, 3)
-            quality_score = min(100, max(0, base_quality))
-            
-            # Simular problemas resolvidos (variação realística)
-            resolved_count = random.randint(15, 35)
-            
-            # Simular disponibilidade do sistema
-            availability = random.uniform(97, 99.9)
-            
-            # Simular completude de dados
-            completeness = random.uniform(75, 85)
-            
-            trends_data['quality_evolution'].append({
-                'date': date.isoformat(),
-                'quality_score': round(quality_score, 1)
-            })
-            
-            trends_data['issues_resolved'].append({
-                'date': date.isoformat(),
-                'count': resolved_count
-            })
-            
-            trends_data['system_availability'].append({
-                'date': date.isoformat(),
-                'availability': round(availability, 1)
-            })
-            
-            trends_data['data_completeness'].append({
-                'date': date.isoformat(),
-                'completeness': round(completeness, 1)
-            })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@analytics_bp.route('/snapshots', methods=['POST'])
+@jwt_required()
+def run_quality_snapshot():
+    """Endpoint para executar o job de snapshot diário de qualidade"""
+    try:
+        data = request.get_json(silent=True) or {}
+        history_days = data.get('history_days')
+        if history_days is not None:
+            if not str(history_days).isdigit() or int(history_days) < 1:
+                return jsonify({'error': 'history_days deve ser um inteiro positivo'}), 400
+            history_days = int(history_days)
         
-        # Reverter para ordem cronológica
-        for key in trends_data:
-            trends_data[key].reverse()
+        result = run_snapshot_job(
+            history_days=history_days,
+            refresh_scores=bool(data.get('refresh_scores', False))
+        )
         
-        return jsonify({'trends': trends_data}), 200
+        return jsonify({
+            'message': 'Snapshot de qualidade registrado',
+            **result
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -74,67 +77,28 @@ def get_trends():
 def get_department_analysis():
     """Endpoint para análise comparativa por departamento"""
     try:
-        # Simular dados por departamento
-        departments = [
-            {
-                'name': 'Cardiologia',
-                'total_records': 1567,
-                'completeness_percentage': 98,
-                'quality_score': 'Excelente',
-                'open_issues': 2,
-                'avg_resolution_time': 1.5,  # horas
-                'last_update': datetime.utcnow().isoformat()
-            },
-            {
-                'name': 'Laboratório',
-                'total_records': 2341,
-                'completeness_percentage': 94,
-                'quality_score': 'Excelente',
-                'open_issues': 5,
-                'avg_resolution_time': 2.1,
-                'last_update': datetime.utcnow().isoformat()
-            },
-            {
-                'name': 'Emergência',
-                'total_records': 789,
-                'completeness_percentage': 82,
-                'quality_score': 'Bom',
-                'open_issues': 12,
-                'avg_resolution_time': 3.2,
-                'last_update': datetime.utcnow().isoformat()
-            },
-            {
-                'name': 'Ambulatório',
-                'total_records': 1234,
-                'completeness_percentage': 76,
-                'quality_score': 'Precisa Melhorar',
-                'open_issues': 18,
-                'avg_resolution_time': 4.1,
-                'last_update': datetime.utcnow().isoformat()
-            },
-            {
-                'name': 'Internação',
-                'total_records': 567,
-                'completeness_percentage': 91,
-                'quality_score': 'Excelente',
-                'open_issues': 3,
-                'avg_resolution_time': 1.8,
-                'last_update': datetime.utcnow().isoformat()
-            },
-            {
-                'name': 'Radiologia',
-                'total_records': 892,
-                'completeness_percentage': 88,
-                'quality_score': 'Bom',
-                'open_issues': 7,
-                'avg_resolution_time': 2.5,
-                'last_update': datetime.utcnow().isoformat()
-            }
-        ]
+        # Valores pré-calculados em uma consulta agrupada e mantidos em cache
+        result = get_department_metrics()
+        
+        return jsonify(result), 200
         
-        return jsonify({'departments': departments}), 200
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@analytics_bp.route('/departments/refresh', methods=['POST'])
+@jwt_required()
+def refresh_department_analysis():
+    """Endpoint para recalcular a análise por departamento"""
+    try:
+        result = refresh_department_metrics()
+        
+        return jsonify({
+            'message': 'Análise por departamento recalculada',
+            **result
+        }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
 @analytics_bp.route('/roi', methods=['GET'])
@@ -190,15 +154,21 @@ def get_roi_analysis():
 def get_available_reports():
     """Endpoint para obter relatórios disponíveis"""
     try:
+        # Última geração concluída de cada relatório (jobs mantidos pela fila)
+        last_generated = {}
+        for job in get_report_queue(current_app._get_current_object()).list():
+            if job.status == 'completed' and job.report_id not in last_generated:
+                last_generated[job.report_id] = job.finished_at.isoformat()
+        
         reports = [
             {
                 'id': 'quality_report',
                 'title': 'Relatório de Qualidade',
                 'description': 'Análise completa da qualidade dos dados',
                 'type': 'quality',
-                'last_generated': (datetime.utcnow() - timedelta(hours=2)).isoformat(),
+                'last_generated': last_generated.get('quality_report'),
                 'frequency': 'daily',
-                'format': ['PDF', 'Excel'],
+                'format': ['PDF', 'Excel', 'CSV'],
                 'estimated_time': '5 minutos'
             },
             {
@@ -206,9 +176,9 @@ def get_available_reports():
                 'title': 'Relatório de Integrações',
                 'description': 'Status e performance das integrações',
                 'type': 'integration',
-                'last_generated': (datetime.utcnow() - timedelta(days=1)).isoformat(),
+                'last_generated': last_generated.get('integration_report'),
                 'frequency': 'weekly',
-                'format': ['PDF', 'Excel'],
+                'format': ['PDF', 'Excel', 'CSV'],
                 'estimated_time': '3 minutos'
             },
             {
@@ -216,9 +186,9 @@ def get_available_reports():
                 'title': 'Relatório de ROI',
                 'description': 'Análise de retorno sobre investimento',
                 'type': 'financial',
-                'last_generated': (datetime.utcnow() - timedelta(days=3)).isoformat(),
+                'last_generated': last_generated.get('roi_report'),
                 'frequency': 'monthly',
-                'format': ['PDF', 'PowerPoint'],
+                'format': ['PDF', 'Excel', 'CSV'],
                 'estimated_time': '8 minutos'
             },
             {
@@ -226,9 +196,9 @@ def get_available_reports():
                 'title': 'Relatório Executivo',
                 'description': 'Resumo executivo para gestores',
                 'type': 'executive',
-                'last_generated': datetime.utcnow().isoformat(),
+                'last_generated': last_generated.get('executive_report'),
                 'frequency': 'weekly',
-                'format': ['PDF', 'PowerPoint'],
+                'format': ['PDF', 'Excel', 'CSV'],
                 'estimated_time': '10 minutos'
             }
         ]
@@ -241,105 +211,117 @@ def get_available_reports():
 @analytics_bp.route('/reports/<report_id>/generate', methods=['POST'])
 @jwt_required()
 def generate_report(report_id):
-    """Endpoint para gerar um relatório específico"""
+    """Endpoint para enfileirar a geração de um relatório"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True) or {}
         format_type = data.get('format', 'PDF')
         date_range = data.get('date_range', '30_days')
         
-        # Simular geração de relatório
-        report_data = {
-            'report_id': report_id,
-            'format': format_type,
-            'date_range': date_range,
-            'generated_at': datetime.utcnow().isoformat(),
-            'status': 'completed',
-            'download_url': f'/api/analytics/reports/{report_id}/download',
-            'file_size': f"{random.randint(500, 2000)} KB",
-            'pages': random.randint(5, 25)
-        }
+        # Geração em segundo plano; o cliente acompanha pelo status_url
+        queue = get_report_queue(current_app._get_current_object())
+        job = queue.submit(report_id, format_type, date_range, requested_by=get_jwt_identity())
         
-        # Simular conteúdo baseado no tipo de relatório
-        if report_id == 'quality_report':
-            report_data['summary'] = {
-                'overall_quality_score': 87.5,
-                'total_issues_found': 234,
-                'issues_resolved': 189,
-                'critical_issues': 12
-            }
-        elif report_id == 'integration_report':
-            report_data['summary'] = {
-                'systems_monitored': 8,
-                'uptime_percentage': 99.2,
-                'failed_syncs': 5,
-                'data_volume_gb': 45.7
-            }
-        elif report_id == 'roi_report':
-            report_data['summary'] = {
-                'annual_savings': 2400000,
-                'roi_percentage': 340,
-                'payback_months': 8,
-                'efficiency_gain': 35
-            }
+        return jsonify({
+            'message': 'Geração de relatório iniciada',
+            'report': job.to_dict()
+        }), 202
+        
+    except KeyError:
+        return jsonify({'error': 'Relatório não encontrado'}), 404
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@analytics_bp.route('/reports/jobs', methods=['GET'])
+@jwt_required()
+def get_report_jobs():
+    """Endpoint para listar os relatórios em geração e gerados"""
+    try:
+        queue = get_report_queue(current_app._get_current_object())
+        user_id = str(get_jwt_identity())
+        
+        return jsonify({'jobs': [job.to_dict() for job in queue.list() if str(job.requested_by) == user_id]}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@analytics_bp.route('/reports/jobs/<job_id>', methods=['GET'])
+@jwt_required()
+def get_report_job(job_id):
+    """Endpoint para acompanhar o progresso de um relatório"""
+    try:
+        job = _own_report_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        return jsonify({'report': job.to_dict()}), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@analytics_bp.route('/reports/jobs/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_report_job(job_id):
+    """Endpoint para cancelar um relatório na fila ou em geração"""
+    try:
+        if not _own_report_job(job_id):
+            return jsonify({'error': 'Job não encontrado'}), 404
+        job = get_report_queue(current_app._get_current_object()).cancel(job_id)
+        
+        if job.status in ('completed', 'failed'):
+            return jsonify({'error': 'Relatório já foi finalizado', 'report': job.to_dict()}), 409
         
         return jsonify({
-            'message': 'Relatório gerado com sucesso',
-            'report': report_data
+            'message': 'Cancelamento solicitado',
+            'report': job.to_dict()
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@analytics_bp.route('/reports/jobs/<job_id>/download', methods=['GET'])
+@jwt_required()
+def download_report(job_id):
+    """Endpoint para baixar um relatório gerado (aceita Range para downloads parciais)"""
+    try:
+        job = _own_report_job(job_id)
+        if not job:
+            return jsonify({'error': 'Job não encontrado'}), 404
+        
+        if job.status != 'completed':
+            return jsonify({'error': 'Relatório ainda não está disponível', 'report': job.to_dict()}), 409
+        
+        return send_file(
+            job.path,
+            mimetype=REPORT_WRITERS[job.format].mimetype,
+            as_attachment=True,
+            download_name=job.filename,
+            conditional=True
+        )
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @analytics_bp.route('/kpis', methods=['GET'])
 @jwt_required()
 def get_key_performance_indicators():
     """Endpoint para obter KPIs principais"""
     try:
-        # Calcular KPIs baseados nos dados reais e simulados
-        current_month = datetime.utcnow().replace(day=1)
-        last_month = (current_month - timedelta(days=1)).replace(day=1)
-        
-        # KPIs principais
-        kpis = {
-            'data_quality_score': {
-                'current': 87.3,
-                'previous': 84.1,
-                'trend': 'up',
-                'unit': '%'
-            },
-            'issues_resolution_rate': {
-                'current': 94.2,
-                'previous': 91.8,
-                'trend': 'up',
-                'unit': '%'
-            },
-            'average_resolution_time': {
-                'current': 2.1,
-                'previous': 2.8,
-                'trend': 'down',
-                'unit': 'hours'
-            },
-            'system_availability': {
-                'current': 99.2,
-                'previous': 98.7,
-                'trend': 'up',
-                'unit': '%'
-            },
-            'data_completeness': {
-                'current': 76.5,
-                'previous': 73.2,
-                'trend': 'up',
-                'unit': '%'
-            },
-            'cost_savings_monthly': {
-                'current': 200000,
-                'previous': 185000,
-                'trend': 'up',
-                'unit': 'BRL'
-            }
-        }
+        # Derivados dos agregados diários; period aceita week, month, quarter, year ou Nd
+        result = get_kpis(
+            period=request.args.get('period', 'month'),
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            department=request.args.get('department')
+        )
+        
+        return jsonify(result), 200
         
-        return jsonify({'kpis': kpis}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -362,16 +344,14 @@ def get_data_quality_charts():
                 {'system': 'Ambulatório', 'completeness': 82}
             ]
         elif chart_type == 'issues_evolution':
-            # Gráfico de linha - Evolução de problemas
-            data = []
-            for i in range(30):
-                date = datetime.utcnow().date() - timedelta(days=29-i)
-                issues = random.randint(15, 45)
-                data.append({
-                    'date': date.isoformat(),
-                    'open_issues': issues,
-                    'resolved_issues': random.randint(10, 35)
-                })
+            # Gráfico de linha - Evolução de problemas (snapshots diários)
+            days = request.args.get('days', 30, type=int)
+            trends = get_quality_trends(days, request.args.get('bucket'))
+            data = [{
+                'date': point['date'],
+                'open_issues': point['open_issues'],
+                'resolved_issues': point['resolved_issues']
+            } for point in trends['points']]
         elif chart_type == 'criticality':
             # Gráfico de pizza - Distribuição por criticidade
             data = [
@@ -387,6 +367,9 @@ def get_data_quality_charts():
             'data': data
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.patient import Patient, MedicalRecord, HealthSystem, DataQualityIssue, DashboardMetrics, db
+from src.utils.dashboard_snapshot import get_dashboard_snapshot
+from src.utils.issue_listing import issue_listing_query, system_name_of
+from src.utils.quality_scoring import get_quality_score, refresh_quality_scores
+from src.utils.quality_snapshots import get_quality_trends, series
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
 
@@ -11,49 +15,43 @@ dashboard_bp = Blueprint('dashboard', __name__)
 def get_dashboard_metrics():
     """Endpoint para obter métricas do dashboard principal"""
     try:
-        # Métricas principais
-        total_patients = Patient.query.count()
-        total_systems = HealthSystem.query.count()
-        
-        # Problemas de qualidade
-        open_issues = DataQualityIssue.query.filter_by(status='open').count()
-        high_priority_issues = DataQualityIssue.query.filter_by(
-            status='open', 
-            priority='high'
-        ).count()
-        
-        # Sistemas offline
-        offline_systems = HealthSystem.query.filter_by(status='offline').count()
-        
-        # Taxa de completude (simulada)
-        completeness_rate = 76.5
-        
-        # Duplicidades detectadas
-        duplicate_issues = DataQualityIssue.query.filter_by(
-            issue_type='duplicate',
-            status='open'
-        ).count()
-        
-        # Campos críticos ausentes
-        missing_fields = DataQualityIssue.query.filter_by(
-            issue_type='missing',
-            status='open'
-        ).count()
+        # Contagens calculadas em uma única consulta e compartilhadas via snapshot
+        snapshot = get_dashboard_snapshot()
+        
+        # Taxa de completude pré-calculada pelo motor de pontuação
+        completeness_rate = get_quality_score('completeness_rate')
         
         return jsonify({
             'metrics': {
                 'completeness_rate': completeness_rate,
-                'duplicates_detected': duplicate_issues,
-                'missing_critical_fields': missing_fields,
-                'unsynchronized_systems': offline_systems,
-                'total_patients': total_patients,
-                'total_systems': total_systems,
-                'open_issues': open_issues,
-                'high_priority_issues': high_priority_issues
-            }
+                'duplicates_detected': snapshot['duplicate_issues'],
+                'missing_critical_fields': snapshot['missing_fields'],
+                'unsynchronized_systems': snapshot['offline_systems'],
+                'total_patients': snapshot['total_patients'],
+                'total_systems': snapshot['total_systems'],
+                'open_issues': snapshot['open_issues'],
+                'high_priority_issues': snapshot['high_priority_issues']
+            },
+            'calculated_at': snapshot['calculated_at'].isoformat()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@dashboard_bp.route('/quality-scores/refresh', methods=['POST'])
+@jwt_required()
+def refresh_dashboard_quality_scores():
+    """Endpoint para recalcular as pontuações de completude e consistência"""
+    try:
+        scores = refresh_quality_scores()
+        
+        return jsonify({
+            'message': 'Pontuações de qualidade recalculadas',
+            'scores': scores
         }), 200
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
 @dashboard_bp.route('/alerts', methods=['GET'])
@@ -62,9 +60,9 @@ def get_priority_alerts():
     """Endpoint para obter alertas prioritários"""
     try:
         # Buscar problemas de alta prioridade
-        high_priority_issues = DataQualityIssue.query.filter_by(
-            status='open',
-            priority='high'
+        high_priority_issues = issue_listing_query().filter(
+            DataQualityIssue.status == 'open',
+            DataQualityIssue.priority == 'high'
         ).order_by(desc(DataQualityIssue.detected_at)).limit(10).all()
         
         alerts = []
@@ -75,8 +73,8 @@ def get_priority_alerts():
                 'title': issue.title,
                 'description': issue.description,
                 'detected_at': issue.detected_at.isoformat() if issue.detected_at else None,
-                'system_name': issue.system.name if issue.system else 'Sistema Desconhecido',
-                'patient_name': issue.patient.name if issue.patient else None
+                'system_name': system_name_of(issue),
+                'patient_name': issue.patient_name
             }
             alerts.append(alert)
         
@@ -122,18 +120,11 @@ def get_systems_status():
 def get_quick_actions():
     """Endpoint para obter ações rápidas disponíveis"""
     try:
-        # Contar problemas por tipo para sugerir ações
-        duplicate_count = DataQualityIssue.query.filter_by(
-            issue_type='duplicate',
-            status='open'
-        ).count()
-        
-        missing_count = DataQualityIssue.query.filter_by(
-            issue_type='missing',
-            status='open'
-        ).count()
-        
-        offline_systems = HealthSystem.query.filter_by(status='offline').count()
+        # Contar problemas por tipo para sugerir ações (mesmo snapshot das métricas)
+        snapshot = get_dashboard_snapshot()
+        duplicate_count = snapshot['duplicate_issues']
+        missing_count = snapshot['missing_fields']
+        offline_systems = snapshot['offline_systems']
         
         actions = []
         
@@ -143,7 +134,10 @@ def get_quick_actions():
                 'title': 'Resolver duplicidades automaticamente',
                 'description': f'{duplicate_count} duplicidades detectadas',
                 'icon': '🔧',
-                'priority': 'high' if duplicate_count > 10 else 'medium'
+                'priority': 'high' if duplicate_count > 10 else 'medium',
+                # Executada em massa pelo endpoint de resolução em lote
+                'endpoint': '/api/issues/bulk-resolve',
+                'payload': {'filter': {'type': 'duplicate'}}
             })
         
         if offline_systems > 0:
@@ -205,35 +199,12 @@ def get_heatmap_data():
 def get_trends_data():
     """Endpoint para obter dados de tendências temporais"""
     try:
-        # Simular dados de tendências dos últimos 30 dias
+        # Últimos 30 dias da série diária de snapshots
+        trends = get_quality_trends(30)
         trends_data = {
-            'quality_evolution': [
-                {'date': '2024-11-20', 'quality_score': 72},
-                {'date': '2024-11-25', 'quality_score': 74},
-                {'date': '2024-11-30', 'quality_score': 76},
-                {'date': '2024-12-05', 'quality_score': 78},
-                {'date': '2024-12-10', 'quality_score': 75},
-                {'date': '2024-12-15', 'quality_score': 77},
-                {'date': '2024-12-20', 'quality_score': 76}
-            ],
-            'issues_resolved': [
-                {'date': '2024-11-20', 'count': 15},
-                {'date': '2024-11-25', 'count': 18},
-                {'date': '2024-11-30', 'count': 22},
-                {'date': '2024-12-05', 'count': 19},
-                {'date': '2024-12-10', 'count': 25},
-                {'date': '2024-12-15', 'count': 21},
-                {'date': '2024-12-20', 'count': 23}
-            ],
-            'system_availability': [
-                {'date': '2024-11-20', 'availability': 98.5},
-                {'date': '2024-11-25', 'availability': 99.1},
-                {'date': '2024-11-30', 'availability': 97.8},
-                {'date': '2024-12-05', 'availability': 99.3},
-                {'date': '2024-12-10', 'availability': 98.9},
-                {'date': '2024-12-15', 'availability': 99.2},
-                {'date': '2024-12-20', 'availability': 99.2}
-            ]
+            'quality_evolution': series(trends, 'quality_score', 'quality_score'),
+            'issues_resolved': series(trends, 'resolved_issues', 'count'),
+            'system_availability': series(trends, 'system_availability', 'availability')
         }
         
         return jsonify({'trends': trends_data}), 200
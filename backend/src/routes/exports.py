@@ -0,0 +1,30 @@
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from flask_jwt_extended import jwt_required
+from src.utils.data_export import EXPORT_DATASETS, prepare_export
+from datetime import datetime
+
+exports_bp = Blueprint('exports', __name__)
+
+@exports_bp.route('/<dataset>', methods=['GET'])
+@jwt_required()
+def export_dataset(dataset):
+    """Endpoint para exportar problemas, pacientes ou registros em NDJSON, CSV ou Parquet"""
+    try:
+        if dataset not in EXPORT_DATASETS:
+            return jsonify({'error': 'Conjunto de dados não encontrado (use issues, patients ou records)'}), 404
+        
+        chunks, mimetype, extension = prepare_export(dataset, request.args.get('format'), request.args)
+        filename = f'{dataset}_{datetime.utcnow():%Y%m%d_%H%M%S}.{extension}'
+        
+        # Sem Content-Length: a resposta é enviada em partes à medida que os lotes são lidos
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+        )
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
@@ -1,9 +1,17 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.patient import HealthSystem, db
+from src.utils.dashboard_snapshot import invalidate_dashboard_snapshot
+from src.utils.sync_service import (
+    apply_probe_result, compact_sync_logs, compact_sync_logs_if_due, query_sync_logs, recent_system_logs,
+    record_sync_log, run_system_sync, system_sync_metrics
+)
+from src.utils.bundle_ingestion import INGESTION_MAPPINGS, BundleIngestionError, bundle_format, ingest_bundle
+from src.utils.sync_scheduler import get_sync_scheduler
+from src.utils.connection_probe import PROBE_TIMEOUT, probe_systems, probe_target, summarize_probes
 from sqlalchemy import desc
 from datetime import datetime, timedelta
-import random
+import time
 
 integrations_bp = Blueprint('integrations', __name__)
 
@@ -62,41 +70,8 @@ def get_system_details(system_id):
     try:
         system = HealthSystem.query.get_or_404(system_id)
         
-        # Simular logs de sincronização das últimas 24h
-        logs = []
-        current_time = datetime.utcnow()
-        
-        for i in range(10):  # Últimos 10 logs
-            log_time = current_time - timedelta(hours=i*2.5)
-            status = random.choice(['success', 'success', 'success', 'warning', 'error'])
-            
-            if status == 'success':
-                message = f"{system.name} - Sincronização completa"
-                details = f"{random.randint(10, 100)} registros sincronizados"
-            elif status == 'warning':
-                message = f"{system.name} - Timeout na conexão (recuperado)"
-                details = "Conexão reestabelecida automaticamente"
-            else:
-                message = f"{system.name} - Falha na autenticação"
-                details = "Credenciais precisam ser verificadas"
-            
-            log = {
-                'id': i + 1,
-                'timestamp': log_time.isoformat(),
-                'status': status,
-                'message': message,
-                'details': details
-            }
-            logs.append(log)
-        
-        # Métricas do sistema
-        metrics = {
-            'uptime_percentage': random.uniform(95, 99.9),
-            'average_response_time': random.uniform(100, 500),  # ms
-            'total_records': random.randint(1000, 50000),
-            'last_24h_syncs': random.randint(20, 48),
-            'failed_syncs_24h': random.randint(0, 3)
-        }
+        logs = recent_system_logs(system_id, 10)
+        metrics = system_sync_metrics(system_id)
         
         return jsonify({
             'system': system.to_dict(),
@@ -114,33 +89,21 @@ def test_system_connection(system_id):
     try:
         system = HealthSystem.query.get_or_404(system_id)
         
-        # Simular teste de conectividade
-        test_results = {
-            'connection_test': random.choice([True, True, True, False]),  # 75% sucesso
-            'authentication_test': random.choice([True, True, False]),    # 66% sucesso
-            'data_access_test': random.choice([True, True, True, False]), # 75% sucesso
-            'response_time_ms': random.randint(50, 1000)
-        }
-        
-        overall_success = all([
-            test_results['connection_test'],
-            test_results['authentication_test'],
-            test_results['data_access_test']
-        ])
-        
-        # Atualizar status do sistema baseado no teste
-        if overall_success:
-            system.status = 'online'
-            system.last_sync = datetime.utcnow()
-        else:
-            system.status = 'warning' if any(test_results.values()) else 'offline'
+        result = probe_systems([probe_target(system)])[0]
+        overall_success = apply_probe_result(system, result)
         
         db.session.commit()
+        invalidate_dashboard_snapshot()
+        compact_sync_logs_if_due()
+        
+        test_results = {name: result[name] for name in ('connection_test', 'authentication_test', 'data_access_test')}
+        test_results['response_time_ms'] = result['response_time_ms']
         
         return jsonify({
             'system_id': system_id,
             'test_results': test_results,
             'overall_success': overall_success,
+            'error': result['error'],
             'message': 'Teste de conectividade concluído com sucesso' if overall_success else 'Problemas detectados na conectividade'
         }), 200
         
@@ -148,6 +111,70 @@ def test_system_connection(system_id):
         db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@integrations_bp.route('/systems/test-all', methods=['POST'])
+@jwt_required()
+def test_all_connections():
+    """Endpoint para testar a conectividade de todos os sistemas em paralelo"""
+    try:
+        data = request.get_json(silent=True) or {}
+        timeout = data.get('timeout', PROBE_TIMEOUT)
+        if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout <= 60:
+            return jsonify({'error': 'timeout deve estar entre 0 e 60 segundos'}), 400
+        
+        systems = HealthSystem.query.order_by(HealthSystem.id).all()
+        # Nenhuma transação fica aberta durante os testes
+        targets = [probe_target(system) for system in systems]
+        db.session.rollback()
+        
+        started = time.perf_counter()
+        results = probe_systems(targets, timeout)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        systems = {system.id: system for system in HealthSystem.query.filter(
+            HealthSystem.id.in_([target['system_id'] for target in targets])
+        )}
+        now = datetime.utcnow()
+        for result in results:
+            if result['system_id'] in systems:
+                result['overall_success'] = apply_probe_result(systems[result['system_id']], result, now)
+        
+        db.session.commit()
+        invalidate_dashboard_snapshot()
+        compact_sync_logs_if_due()
+        
+        return jsonify({
+            'summary': summarize_probes(results, elapsed_ms),
+            'results': results
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@integrations_bp.route('/systems/<int:system_id>/endpoint', methods=['PUT'])
+@jwt_required()
+def update_system_endpoint(system_id):
+    """Endpoint para configurar a base FHIR e o token usados no teste de conectividade"""
+    try:
+        system = HealthSystem.query.get_or_404(system_id)
+        data = request.get_json(silent=True) or {}
+        
+        endpoint_url = (data.get('endpoint_url') or '').strip()
+        if endpoint_url and not endpoint_url.startswith(('http://', 'https://')):
+            return jsonify({'error': 'endpoint_url deve começar com http:// ou https://'}), 400
+        
+        system.endpoint_url = endpoint_url or None
+        if 'auth_token' in data:
+            system.auth_token = data['auth_token'] or None
+        
+        db.session.commit()
+        
+        return jsonify({'system': system.to_dict()}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @integrations_bp.route('/systems/<int:system_id>/sync', methods=['POST'])
 @jwt_required()
 def force_system_sync(system_id):
@@ -157,27 +184,26 @@ def force_system_sync(system_id):
         
         if system.status == 'offline':
             return jsonify({'error': 'Sistema offline - não é possível sincronizar'}), 400
+        if not system.endpoint_url:
+            return jsonify({'error': 'Endpoint de integração não configurado - não é possível sincronizar'}), 400
         
-        # Simular sincronização
-        sync_success = random.choice([True, True, True, False])  # 75% sucesso
-        
-        if sync_success:
-            system.last_sync = datetime.utcnow()
-            system.status = 'online'
-            records_synced = random.randint(10, 200)
-            message = f"Sincronização concluída com sucesso. {records_synced} registros processados."
-        else:
-            system.status = 'warning'
-            message = "Falha na sincronização. Verifique a conectividade do sistema."
-            records_synced = 0
+        result = run_system_sync(system)
         
         db.session.commit()
+        invalidate_dashboard_snapshot()
+        compact_sync_logs_if_due()
+        
+        # A próxima sincronização agendada passa a contar a partir desta
+        scheduler = get_sync_scheduler(current_app)
+        if scheduler is not None:
+            scheduler.record_manual_sync(system_id, result['sync_success'])
         
         return jsonify({
             'system_id': system_id,
-            'sync_success': sync_success,
-            'records_synced': records_synced,
-            'message': message,
+            'sync_success': result['sync_success'],
+            'records_synced': result['records_synced'],
+            'message': result['message'],
+            'ingestion': result.get('ingestion'),
             'last_sync': system.last_sync.isoformat() if system.last_sync else None
         }), 200
         
@@ -185,6 +211,62 @@ def force_system_sync(system_id):
         db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@integrations_bp.route('/systems/<int:system_id>/ingest', methods=['POST'])
+@jwt_required()
+def ingest_system_bundle(system_id):
+    """Endpoint para ingerir um Bundle FHIR ou lote HL7 v2 enviado no corpo (lido em fluxo)"""
+    try:
+        system = HealthSystem.query.get_or_404(system_id)
+        
+        # O corpo não passa por request.get_json(): é lido em blocos direto do fluxo
+        fmt = bundle_format(request.args.get('format'), request.mimetype)
+        if fmt is None:
+            return jsonify({'error': 'Formato não suportado - use format=fhir ou format=hl7'}), 400
+        
+        mappings = current_app.config.get('INGESTION_MAPPINGS', INGESTION_MAPPINGS)
+        try:
+            report = ingest_bundle(system, request.stream, fmt, mappings)
+        except BundleIngestionError as e:
+            report = e.report
+            record_sync_log(system, 'ingest', 'error', f"{system.name} - Falha na ingestão {fmt.upper()}",
+                            f"{e} (após {report['items']} itens)",
+                            report['records']['inserted'] + report['records']['updated'],
+                            int(report['elapsed_seconds'] * 1000))
+            db.session.commit()
+            invalidate_dashboard_snapshot()
+            return jsonify({'error': f'Conteúdo inválido: {str(e)}', 'report': report}), 400
+        
+        records_synced = report['records']['inserted'] + report['records']['updated']
+        record_sync_log(
+            system, 'ingest', 'success', f"{system.name} - Ingestão {fmt.upper()} concluída",
+            f"{report['items']} itens, {report['patients']['inserted'] + report['patients']['updated']} pacientes, "
+            f"{records_synced} registros, {report['issues']} problemas detectados "
+            f"({report['mb_per_second']} MB/s, {report['items_per_second']} itens/s)",
+            records_synced, int(report['elapsed_seconds'] * 1000)
+        )
+        db.session.commit()
+        invalidate_dashboard_snapshot()
+        
+        return jsonify({'system_id': system_id, 'report': report}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@integrations_bp.route('/scheduler', methods=['GET'])
+@jwt_required()
+def get_scheduler_status():
+    """Endpoint para obter o estado do agendador de sincronizações (fila e atrasos)"""
+    try:
+        scheduler = get_sync_scheduler(current_app)
+        if scheduler is None:
+            return jsonify({'running': False, 'message': 'Agendador desabilitado (SYNC_SCHEDULER_ENABLED=1 para habilitar)'}), 200
+        
+        return jsonify(scheduler.status()), 200
+        
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @integrations_bp.route('/overview', methods=['GET'])
 @jwt_required()
 def get_integrations_overview():
@@ -237,57 +319,33 @@ def get_sync_logs():
     try:
         hours = request.args.get('hours', 24, type=int)
         system_id = request.args.get('system_id', type=int)
+        limit = request.args.get('limit', 50, type=int)
         
-        # Simular logs de sincronização
-        logs = []
-        current_time = datetime.utcnow()
+        if hours < 1 or limit < 1:
+            return jsonify({'error': 'hours e limit devem ser positivos'}), 400
         
-        systems = HealthSystem.query.all()
-        if system_id:
-            systems = [HealthSystem.query.get(system_id)] if HealthSystem.query.get(system_id) else []
-        
-        log_id = 1
-        for system in systems:
-            # Gerar logs para cada sistema
-            syncs_in_period = hours // (system.sync_frequency / 60) if system.sync_frequency else 1
-            
-            for i in range(int(syncs_in_period)):
-                log_time = current_time - timedelta(minutes=i * system.sync_frequency)
-                status = random.choice(['success', 'success', 'success', 'warning', 'error'])
-                
-                if status == 'success':
-                    message = f"{system.name} - Sincronização completa"
-                    details = f"{random.randint(5, 150)} registros sincronizados"
-                elif status == 'warning':
-                    message = f"{system.name} - Latência alta detectada"
-                    details = f"Tempo de resposta: {random.randint(1000, 3000)}ms"
-                else:
-                    message = f"{system.name} - Falha na sincronização"
-                    details = "Timeout na conexão"
-                
-                log = {
-                    'id': log_id,
-                    'timestamp': log_time.isoformat(),
-                    'system_name': system.name,
-                    'system_type': system.system_type,
-                    'status': status,
-                    'message': message,
-                    'details': details
-                }
-                logs.append(log)
-                log_id += 1
-        
-        # Ordenar por timestamp (mais recente primeiro)
-        logs.sort(key=lambda x: x['timestamp'], reverse=True)
+        since = datetime.utcnow() - timedelta(hours=hours)
+        logs, total_logs = query_sync_logs(since, system_id, limit)
         
         return jsonify({
-            'logs': logs[:50],  # Limitar a 50 logs
-            'total_logs': len(logs)
+            'logs': logs,
+            'total_logs': total_logs
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@integrations_bp.route('/logs/compact', methods=['POST'])
+@jwt_required()
+def compact_logs():
+    """Endpoint para aplicar a política de retenção dos logs de sincronização"""
+    try:
+        return jsonify(compact_sync_logs()), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @integrations_bp.route('/mapping', methods=['GET'])
 @jwt_required()
 def get_field_mappings():
@@ -321,7 +379,10 @@ def get_field_mappings():
             }
         ]
         
-        return jsonify({'mappings': mappings}), 200
+        # Mapeamentos aplicados na ingestão de Bundles FHIR / lotes HL7 (/systems/<id>/ingest)
+        ingestion_mappings = current_app.config.get('INGESTION_MAPPINGS', INGESTION_MAPPINGS)
+        
+        return jsonify({'mappings': mappings, 'ingestion_mappings': ingestion_mappings}), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
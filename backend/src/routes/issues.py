@@ -1,11 +1,39 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.patient import DataQualityIssue, HealthSystem, Patient, db
-from sqlalchemy import desc, func
+from src.utils.dashboard_snapshot import invalidate_dashboard_snapshot
+from src.utils.duplicate_detection import DuplicateDetector
+from src.utils.issue_resolution import BulkIssueResolver, DEFAULT_BATCH_SIZE
+from src.utils.text_search import find_similar_issues
+from src.utils.issue_rollup import get_rollup_issue_metrics, reconcile_issue_rollup
+from src.utils.issue_listing import filter_issue_listing, issue_listing_query, issue_row_to_dict, system_name_of
+from src.utils.pagination import KeysetKey, paginate_keyset, cached_total, keyset_pagination_data, offset_pagination_data, is_truthy
+from sqlalchemy import desc, func, case
 from datetime import datetime, timedelta
 
 issues_bp = Blueprint('issues', __name__)
 
+PRIORITY_RANK = {'high': 1, 'medium': 2, 'low': 3}
+
+# Ordenação por prioridade usada na listagem e no cursor
+priority_order = case(
+    (DataQualityIssue.priority == 'high', 1),
+    (DataQualityIssue.priority == 'medium', 2),
+    (DataQualityIssue.priority == 'low', 3),
+    else_=4
+)
+
+ISSUES_KEYSET = [
+    KeysetKey(priority_order, lambda issue: PRIORITY_RANK.get(issue.priority, 4)),
+    KeysetKey(DataQualityIssue.detected_at, lambda issue: issue.detected_at, descending=True, value_type=datetime),
+    KeysetKey(DataQualityIssue.id, lambda issue: issue.id, descending=True)
+]
+
+HISTORY_KEYSET = [
+    KeysetKey(DataQualityIssue.resolved_at, lambda issue: issue.resolved_at, descending=True, value_type=datetime),
+    KeysetKey(DataQualityIssue.id, lambda issue: issue.id, descending=True)
+]
+
 @issues_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_issues():
@@ -17,33 +45,29 @@ def get_issues():
         priority = request.args.get('priority', '')
         issue_type = request.args.get('type', '')
         
-        query = DataQualityIssue.query
+        query = filter_issue_listing(issue_listing_query(), status, priority, issue_type)
         
-        if status:
-            query = query.filter(DataQualityIssue.status == status)
-        
-        if priority:
-            query = query.filter(DataQualityIssue.priority == priority)
-        
-        if issue_type:
-            query = query.filter(DataQualityIssue.issue_type == issue_type)
-        
-        # Ordenar por prioridade e data de detecção
-        priority_order = func.case(
-            (DataQualityIssue.priority == 'high', 1),
-            (DataQualityIssue.priority == 'medium', 2),
-            (DataQualityIssue.priority == 'low', 3),
-            else_=4
-        )
+        cursor = request.args.get('cursor')
         
-        issues = query.order_by(
-            priority_order,
-            desc(DataQualityIssue.detected_at)
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        if cursor is not None:
+            # Modo cursor: sem OFFSET e total apenas sob demanda (em cache)
+            issues = paginate_keyset(query, ISSUES_KEYSET, cursor, per_page)
+            total = None
+            if is_truthy(request.args.get('include_total', '')):
+                total = cached_total(('issues', status, priority, issue_type), query)
+            pagination = keyset_pagination_data(issues, total)
+        else:
+            # Ordenar por prioridade e data de detecção
+            issues = query.order_by(
+                priority_order,
+                desc(DataQualityIssue.detected_at),
+                desc(DataQualityIssue.id)
+            ).paginate(
+                page=page,
+                per_page=per_page,
+                error_out=False
+            )
+            pagination = offset_pagination_data(issues)
         
         issues_data = []
         for issue in issues.items:
@@ -66,10 +90,10 @@ def get_issues():
                 'format': '1 hora'
             }.get(issue.issue_type, '3 horas')
             
-            issue_data = issue.to_dict()
+            issue_data = issue_row_to_dict(issue)
             issue_data.update({
-                'system_name': issue.system.name if issue.system else 'Sistema Desconhecido',
-                'patient_name': issue.patient.name if issue.patient else None,
+                'system_name': system_name_of(issue),
+                'patient_name': issue.patient_name,
                 'time_since_detection': time_since_detection,
                 'estimated_resolution': estimated_resolution
             })
@@ -77,16 +101,11 @@ def get_issues():
         
         return jsonify({
             'issues': issues_data,
-            'pagination': {
-                'page': issues.page,
-                'pages': issues.pages,
-                'per_page': issues.per_page,
-                'total': issues.total,
-                'has_next': issues.has_next,
-                'has_prev': issues.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
@@ -105,14 +124,12 @@ def get_issue_details(issue_id):
             'patient_id_display': issue.patient.patient_id if issue.patient else None
         })
         
-        # Buscar problemas similares
-        similar_issues = DataQualityIssue.query.filter(
-            DataQualityIssue.issue_type == issue.issue_type,
-            DataQualityIssue.id != issue.id,
-            DataQualityIssue.status == 'open'
-        ).limit(5).all()
-        
-        similar_data = [similar.to_dict() for similar in similar_issues]
+        # Buscar problemas similares (índice textual + afinidade de sistema/paciente)
+        similar_data = []
+        for similar, similarity in find_similar_issues(issue, limit=5):
+            similar_item = similar.to_dict()
+            similar_item['similarity_score'] = similarity
+            similar_data.append(similar_item)
         
         return jsonify({
             'issue': issue_data,
@@ -147,6 +164,7 @@ def resolve_issue(issue_id):
         issue.resolution_time = resolution_time
         
         db.session.commit()
+        invalidate_dashboard_snapshot()
         
         return jsonify({
             'message': 'Problema resolvido com sucesso',
@@ -158,69 +176,115 @@ def resolve_issue(issue_id):
         db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@issues_bp.route('/bulk-resolve', methods=['POST'])
+@jwt_required()
+def bulk_resolve_issues():
+    """Endpoint para resolver problemas em massa (lista de IDs ou filtro)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        batch_size = data.get('batch_size', DEFAULT_BATCH_SIZE)
+        if isinstance(batch_size, bool) or not isinstance(batch_size, (int, str)) or not str(batch_size).strip().isdigit() \
+                or int(batch_size) < 1:
+            return jsonify({'error': 'batch_size deve ser um inteiro positivo'}), 400
+        
+        resolver = BulkIssueResolver(batch_size=int(batch_size))
+        if data.get('ids') is not None:
+            result = resolver.resolve_ids(data['ids'])
+        elif data.get('filter') is not None:
+            result = resolver.resolve_filter(data['filter'])
+        else:
+            return jsonify({'error': 'Informe ids ou filter'}), 400
+        
+        if result['resolved']:
+            invalidate_dashboard_snapshot()
+        
+        return jsonify({
+            'message': f"{result['resolved']} problemas resolvidos com sucesso",
+            **result
+        }), 200
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@issues_bp.route('/duplicates/detect', methods=['POST'])
+@jwt_required()
+def detect_duplicates():
+    """Endpoint para executar a detecção de pacientes duplicados"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        detector = DuplicateDetector(
+            threshold=float(data.get('threshold', 0.75)),
+            max_block_size=int(data.get('max_block_size', 50))
+        )
+        stats = detector.run(full=bool(data.get('full', False)))
+        
+        if stats['issues_created']:
+            invalidate_dashboard_snapshot()
+        
+        return jsonify({
+            'message': f"{stats['issues_created']} novas duplicidades registradas",
+            'stats': stats
+        }), 200
+        
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @issues_bp.route('/metrics', methods=['GET'])
 @jwt_required()
 def get_issues_metrics():
     """Endpoint para obter métricas do centro de resolução"""
     try:
-        # Métricas gerais
-        total_open = DataQualityIssue.query.filter_by(status='open').count()
-        total_resolved_month = DataQualityIssue.query.filter(
-            DataQualityIssue.status == 'resolved',
-            DataQualityIssue.resolved_at >= datetime.utcnow() - timedelta(days=30)
-        ).count()
-        
-        # Tempo médio de resolução
-        avg_resolution_time = db.session.query(
-            func.avg(DataQualityIssue.resolution_time)
-        ).filter(
-            DataQualityIssue.status == 'resolved',
-            DataQualityIssue.resolution_time.isnot(None)
-        ).scalar()
+        # Leitura do rollup pré-agregado (mantido por gatilhos), sem varrer a tabela de problemas
+        rollup = get_rollup_issue_metrics()
         
+        avg_resolution_time = rollup['average_resolution_minutes']
         avg_resolution_hours = round(avg_resolution_time / 60, 1) if avg_resolution_time else 0
         
         # Taxa de resolução
-        total_issues_month = DataQualityIssue.query.filter(
-            DataQualityIssue.detected_at >= datetime.utcnow() - timedelta(days=30)
-        ).count()
-        
+        total_resolved_month = rollup['resolved_in_window']
+        total_issues_month = rollup['detected_in_window']
         resolution_rate = round((total_resolved_month / total_issues_month * 100), 1) if total_issues_month > 0 else 0
         
-        # Distribuição por prioridade
-        priority_distribution = db.session.query(
-            DataQualityIssue.priority,
-            func.count(DataQualityIssue.id)
-        ).filter(
-            DataQualityIssue.status == 'open'
-        ).group_by(DataQualityIssue.priority).all()
-        
-        priority_data = {priority: count for priority, count in priority_distribution}
-        
-        # Distribuição por tipo
-        type_distribution = db.session.query(
-            DataQualityIssue.issue_type,
-            func.count(DataQualityIssue.id)
-        ).filter(
-            DataQualityIssue.status == 'open'
-        ).group_by(DataQualityIssue.issue_type).all()
-        
-        type_data = {issue_type: count for issue_type, count in type_distribution}
-        
         return jsonify({
             'metrics': {
-                'total_open_issues': total_open,
+                'total_open_issues': rollup['total_open'],
                 'resolved_this_month': total_resolved_month,
                 'average_resolution_time_hours': avg_resolution_hours,
                 'resolution_rate_percentage': resolution_rate,
-                'priority_distribution': priority_data,
-                'type_distribution': type_data
+                'priority_distribution': rollup['priority_distribution'],
+                'type_distribution': rollup['type_distribution']
             }
         }), 200
         
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+@issues_bp.route('/metrics/reconcile', methods=['POST'])
+@jwt_required()
+def reconcile_issues_metrics():
+    """Endpoint para reconciliar o rollup de métricas com a tabela de problemas"""
+    try:
+        stats = reconcile_issue_rollup()
+        
+        return jsonify({
+            'message': 'Rollup de métricas reconciliado',
+            'stats': stats
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
 @issues_bp.route('/wizards', methods=['GET'])
 @jwt_required()
 def get_resolution_wizards():
@@ -278,15 +342,27 @@ def get_resolution_history():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         
-        resolved_issues = DataQualityIssue.query.filter_by(
-            status='resolved'
-        ).order_by(
-            desc(DataQualityIssue.resolved_at)
-        ).paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        cursor = request.args.get('cursor')
+        
+        query = issue_listing_query().filter(DataQualityIssue.status == 'resolved')
+        
+        if cursor is not None:
+            # Keyset exige resolved_at preenchido para manter a ordem estável
+            query = query.filter(DataQualityIssue.resolved_at.isnot(None))
+            resolved_issues = paginate_keyset(query, HISTORY_KEYSET, cursor, per_page)
+            total = None
+            if is_truthy(request.args.get('include_total', '')):
+                total = cached_total(('history',), query)
+            pagination = keyset_pagination_data(resolved_issues, total)
+        else:
+            resolved_issues = query.order_by(
+                desc(DataQualityIssue.resolved_at)
+            ).paginate(
+                page=page,
+                per_page=per_page,
+                error_out=False
+            )
+            pagination = offset_pagination_data(resolved_issues)
         
         history_data = []
         for issue in resolved_issues.items:
@@ -301,22 +377,17 @@ def get_resolution_history():
                 'resolved_at': issue.resolved_at.isoformat() if issue.resolved_at else None,
                 'resolution_time_display': resolution_time_display,
                 'resolution_time_minutes': issue.resolution_time,
-                'system_name': issue.system.name if issue.system else 'Sistema Desconhecido'
+                'system_name': system_name_of(issue)
             }
             history_data.append(history_item)
         
         return jsonify({
             'history': history_data,
-            'pagination': {
-                'page': resolved_issues.page,
-                'pages': resolved_issues.pages,
-                'per_page': resolved_issues.per_page,
-                'total': resolved_issues.total,
-                'has_next': resolved_issues.has_next,
-                'has_prev': resolved_issues.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
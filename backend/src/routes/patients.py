@@ -1,11 +1,35 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from src.models.patient import Patient, MedicalRecord, DataQualityIssue, db
+from src.utils.patient_aggregates import get_patients_page_metrics, get_patient_overview, get_patient_system_fragments
+from src.utils.quality_scoring import patient_completeness, get_quality_score
+from src.utils.text_search import patient_search_condition, patient_search_join
+from src.utils.timeline import TimelineWindow, DEFAULT_TIMELINE_LIMIT, parse_timeline_datetime, stream_timeline_json
+from src.utils.pagination import KeysetKey, paginate_keyset, cached_total, keyset_pagination_data, offset_pagination_data, is_truthy
 from sqlalchemy import desc, func
+from werkzeug.exceptions import HTTPException
 from datetime import datetime, timedelta
 
 patients_bp = Blueprint('patients', __name__)
 
+PATIENTS_KEYSET = [
+    KeysetKey(Patient.id, lambda patient: patient.id)
+]
+
+# Sub-coleções da visão 360 (mais recentes primeiro)
+PATIENT_RECORDS_KEYSET = [
+    KeysetKey(MedicalRecord.record_date, lambda record: record.record_date, descending=True, value_type=datetime),
+    KeysetKey(MedicalRecord.id, lambda record: record.id, descending=True)
+]
+
+PATIENT_ISSUES_KEYSET = [
+    KeysetKey(DataQualityIssue.detected_at, lambda issue: issue.detected_at, descending=True, value_type=datetime),
+    KeysetKey(DataQualityIssue.id, lambda issue: issue.id, descending=True)
+]
+
+DEFAULT_SUBCOLLECTION_LIMIT = 20
+MAX_SUBCOLLECTION_LIMIT = 100
+
 @patients_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_patients():
@@ -18,104 +42,152 @@ def get_patients():
         query = Patient.query
         
         if search:
-            query = query.filter(
-                Patient.name.contains(search) |
-                Patient.cpf.contains(search) |
-                Patient.patient_id.contains(search)
+            query = query.filter(patient_search_condition(search))
+        
+        cursor = request.args.get('cursor')
+        
+        if cursor is not None:
+            patients = paginate_keyset(query, PATIENTS_KEYSET, cursor, per_page)
+            total = None
+            if is_truthy(request.args.get('include_total', '')):
+                total = cached_total(('patients', search), query)
+            pagination = keyset_pagination_data(patients, total)
+        else:
+            patients = query.paginate(
+                page=page, 
+                per_page=per_page, 
+                error_out=False
             )
+            pagination = offset_pagination_data(patients)
         
-        patients = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        # Calcular métricas de qualidade da página inteira em uma única consulta
+        page_metrics = get_patients_page_metrics(patient.id for patient in patients.items)
         
         patients_data = []
         for patient in patients.items:
-            # Calcular métricas de qualidade para cada paciente
-            total_records = MedicalRecord.query.filter_by(patient_id=patient.id).count()
-            quality_issues = DataQualityIssue.query.filter_by(patient_id=patient.id, status='open').count()
-            
-            # Simular completude (em uma implementação real, seria calculada)
-            completeness = max(0, 100 - (quality_issues * 10))
+            metrics = page_metrics.get(patient.id, {})
             
             patient_data = patient.to_dict()
             patient_data.update({
-                'total_records': total_records,
-                'quality_issues': quality_issues,
-                'completeness_percentage': completeness,
+                'total_records': metrics.get('total_records', 0),
+                'quality_issues': metrics.get('quality_issues', 0),
+                'completeness_percentage': metrics.get('completeness_percentage', 100),
                 'last_update': patient.updated_at.isoformat() if patient.updated_at else None
             })
             patients_data.append(patient_data)
         
         return jsonify({
             'patients': patients_data,
-            'pagination': {
-                'page': patients.page,
-                'pages': patients.pages,
-                'per_page': patients.per_page,
-                'total': patients.total,
-                'has_next': patients.has_next,
-                'has_prev': patients.has_prev
-            }
+            'pagination': pagination
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+def _bounded_limit(name, default):
+    return max(1, min(request.args.get(name, default, type=int), MAX_SUBCOLLECTION_LIMIT))
+
+def _patient_records_page(patient_id, cursor, limit):
+    query = MedicalRecord.query.filter(MedicalRecord.patient_id == patient_id)
+    return paginate_keyset(query, PATIENT_RECORDS_KEYSET, cursor, limit)
+
+def _patient_issues_page(patient_id, cursor, limit):
+    query = DataQualityIssue.query.filter(DataQualityIssue.patient_id == patient_id)
+    return paginate_keyset(query, PATIENT_ISSUES_KEYSET, cursor, limit)
+
 @patients_bp.route('/<int:patient_id>', methods=['GET'])
 @jwt_required()
 def get_patient_details(patient_id):
     """Endpoint para obter detalhes completos de um paciente"""
     try:
-        patient = Patient.query.get_or_404(patient_id)
-        
-        # Buscar registros médicos
-        medical_records = MedicalRecord.query.filter_by(
-            patient_id=patient_id
-        ).order_by(desc(MedicalRecord.record_date)).all()
-        
-        # Buscar problemas de qualidade
-        quality_issues = DataQualityIssue.query.filter_by(
-            patient_id=patient_id
-        ).order_by(desc(DataQualityIssue.detected_at)).all()
-        
-        # Calcular indicadores de qualidade
-        total_records = len(medical_records)
-        open_issues = len([issue for issue in quality_issues if issue.status == 'open'])
-        
-        # Simular métricas de qualidade
-        completeness = max(0, 100 - (open_issues * 5))
-        consistency = max(0, 100 - (open_issues * 8))
-        
-        # Calcular última atualização por sistema
-        systems_last_update = {}
-        for record in medical_records:
-            system = record.system_source
-            if system not in systems_last_update or record.created_at > systems_last_update[system]:
-                systems_last_update[system] = record.created_at
+        # Paciente e contagens em uma consulta; fragmentos por sistema agregados no SQL
+        patient, counts = get_patient_overview(patient_id)
+        if patient is None:
+            return jsonify({'error': 'Paciente não encontrado'}), 404
+        fragments = get_patient_system_fragments(patient_id)
+        
+        # Registros e problemas como sub-coleções paginadas (mais recentes primeiro)
+        medical_records = _patient_records_page(
+            patient_id, request.args.get('records_cursor'), _bounded_limit('records_limit', DEFAULT_SUBCOLLECTION_LIMIT)
+        )
+        quality_issues = _patient_issues_page(
+            patient_id, request.args.get('issues_cursor'), _bounded_limit('issues_limit', DEFAULT_SUBCOLLECTION_LIMIT)
+        )
         
-        # Fragmentação de dados (onde estão os dados)
-        data_fragments = list(set([record.system_source for record in medical_records]))
+        # Completude pelos campos preenchidos; consistência ainda estimada pelos problemas abertos
+        completeness = patient_completeness(patient)
+        consistency = max(0, 100 - (counts['open_issues'] * 8))
         
         return jsonify({
             'patient': patient.to_dict(),
-            'medical_records': [record.to_dict() for record in medical_records],
-            'quality_issues': [issue.to_dict() for issue in quality_issues],
+            'medical_records': [record.to_dict() for record in medical_records.items],
+            'medical_records_pagination': keyset_pagination_data(medical_records, counts['total_records']),
+            'quality_issues': [issue.to_dict() for issue in quality_issues.items],
+            'quality_issues_pagination': keyset_pagination_data(quality_issues, counts['total_issues']),
             'quality_indicators': {
                 'completeness': completeness,
                 'consistency': consistency,
-                'data_freshness': 92,  # Simulado
-                'total_records': total_records,
-                'open_issues': open_issues
+                'data_freshness': get_quality_score('data_freshness'),
+                'total_records': counts['total_records'],
+                'open_issues': counts['open_issues']
             },
             'systems_last_update': {
-                system: timestamp.isoformat() 
-                for system, timestamp in systems_last_update.items()
+                fragment['system']: fragment['last_update'].isoformat()
+                for fragment in fragments if fragment['last_update']
             },
-            'data_fragments': data_fragments
+            'data_fragments': [fragment['system'] for fragment in fragments],
+            'system_fragments': [
+                {
+                    'system': fragment['system'],
+                    'records': fragment['records'],
+                    'last_update': fragment['last_update'].isoformat() if fragment['last_update'] else None
+                }
+                for fragment in fragments
+            ]
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@patients_bp.route('/<int:patient_id>/records', methods=['GET'])
+@jwt_required()
+def get_patient_records(patient_id):
+    """Endpoint para paginar os registros médicos de um paciente"""
+    try:
+        records = _patient_records_page(
+            patient_id, request.args.get('cursor'), _bounded_limit('limit', DEFAULT_SUBCOLLECTION_LIMIT)
+        )
+        
+        return jsonify({
+            'medical_records': [record.to_dict() for record in records.items],
+            'pagination': keyset_pagination_data(records)
+        }), 200
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
+
+@patients_bp.route('/<int:patient_id>/issues', methods=['GET'])
+@jwt_required()
+def get_patient_issues(patient_id):
+    """Endpoint para paginar os problemas de qualidade de um paciente"""
+    try:
+        issues = _patient_issues_page(
+            patient_id, request.args.get('cursor'), _bounded_limit('limit', DEFAULT_SUBCOLLECTION_LIMIT)
+        )
+        
+        return jsonify({
+            'quality_issues': [issue.to_dict() for issue in issues.items],
+            'pagination': keyset_pagination_data(issues)
         }), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
@@ -126,57 +198,31 @@ def get_patient_timeline(patient_id):
     try:
         patient = Patient.query.get_or_404(patient_id)
         
-        # Buscar registros médicos ordenados por data
-        medical_records = MedicalRecord.query.filter_by(
-            patient_id=patient_id
-        ).order_by(desc(MedicalRecord.record_date)).all()
-        
-        # Buscar problemas de qualidade relacionados
-        quality_issues = DataQualityIssue.query.filter_by(
-            patient_id=patient_id
-        ).order_by(desc(DataQualityIssue.detected_at)).all()
-        
-        # Combinar eventos em uma timeline
-        timeline_events = []
-        
-        # Adicionar registros médicos
-        for record in medical_records:
-            event = {
-                'id': f'record_{record.id}',
-                'type': 'medical_record',
-                'date': record.record_date.isoformat(),
-                'title': f'{record.record_type.title()} - {record.department or "Departamento não especificado"}',
-                'description': record.description,
-                'doctor': record.doctor_name,
-                'system_source': record.system_source,
-                'category': record.record_type
-            }
-            timeline_events.append(event)
-        
-        # Adicionar problemas de qualidade
-        for issue in quality_issues:
-            event = {
-                'id': f'issue_{issue.id}',
-                'type': 'quality_issue',
-                'date': issue.detected_at.isoformat(),
-                'title': issue.title,
-                'description': issue.description,
-                'priority': issue.priority,
-                'status': issue.status,
-                'issue_type': issue.issue_type
-            }
-            timeline_events.append(event)
+        # Janela: before/after (ISO 8601), limit, cursor de continuação e filtros por tipo/categoria
+        window = TimelineWindow(
+            before=parse_timeline_datetime(request.args.get('before'), 'before'),
+            after=parse_timeline_datetime(request.args.get('after'), 'after'),
+            limit=request.args.get('limit', DEFAULT_TIMELINE_LIMIT, type=int),
+            cursor=request.args.get('cursor'),
+            types=[value for value in request.args.get('types', '').split(',') if value],
+            categories=[value for value in request.args.get('categories', '').split(',') if value]
+        )
         
-        # Ordenar eventos por data (mais recente primeiro)
-        timeline_events.sort(key=lambda x: x['date'], reverse=True)
+        # Consultas executadas antes da resposta: falhas ainda viram 500 em vez de JSON truncado
+        events = window.open(patient_id)
         
-        return jsonify({
-            'patient_id': patient_id,
-            'patient_name': patient.name,
-            'timeline': timeline_events
-        }), 200
+        # Eventos intercalados no banco e enviados em partes, sem montar a lista inteira
+        return Response(
+            stream_with_context(stream_timeline_json(patient_id, patient.name, window, events)),
+            mimetype='application/json'
+        ), 200
         
+    except HTTPException as e:
+        return jsonify({'error': 'Paciente não encontrado' if e.code == 404 else e.description}), e.code
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
 @patients_bp.route('/<int:patient_id>/recommendations', methods=['GET'])
@@ -235,29 +281,23 @@ def search_patients():
         query = Patient.query
         
         if query_text:
-            query = query.filter(
-                Patient.name.contains(query_text) |
-                Patient.cpf.contains(query_text) |
-                Patient.patient_id.contains(query_text)
-            )
+            # Busca incremental: lê do índice apenas as primeiras correspondências
+            query = patient_search_join(query, query_text)
         
         if has_issues:
             # Filtrar pacientes com problemas de qualidade abertos
             query = query.join(DataQualityIssue).filter(
                 DataQualityIssue.status == 'open'
-            )
+            ).distinct()
         
         patients = query.limit(50).all()
         
+        page_metrics = get_patients_page_metrics(patient.id for patient in patients)
+        
         results = []
         for patient in patients:
-            quality_issues = DataQualityIssue.query.filter_by(
-                patient_id=patient.id,
-                status='open'
-            ).count()
-            
             result = patient.to_dict()
-            result['quality_issues_count'] = quality_issues
+            result['quality_issues_count'] = page_metrics.get(patient.id, {}).get('quality_issues', 0)
             results.append(result)
         
         return jsonify({
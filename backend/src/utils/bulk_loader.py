@@ -0,0 +1,129 @@
+"""
+Carga em massa via SQLAlchemy Core (executemany em lotes grandes)
+
+Os IDs são atribuídos em memória a partir do maior ID existente, sem flush por linha,
+e toda a carga roda em uma única transação com pragmas do SQLite ajustados; os valores que o
+banco tinha antes (journal_mode WAL, por exemplo) são lidos na entrada e devolvidos na saída.
+"""
+
+import time
+from sqlalchemy import func, select
+from src.database import db
+
+# Pragmas para carga: sem fsync por transação e journal em memória
+LOAD_PRAGMAS = {
+    'journal_mode': 'MEMORY',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': '-200000'  # ~200 MB
+}
+
+
+
+class BulkLoader:
+    """Insere linhas em lotes dentro de uma única transação
+
+    Uso:
+        with BulkLoader(db.engine) as loader:
+            ids = loader.insert('patients', patient_rows)
+    """
+
+    def __init__(self, engine=None, chunk_size=20000, metadata=None, tune_pragmas=True):
+        self.engine = engine if engine is not None else db.engine
+        self.chunk_size = chunk_size
+        self.metadata = metadata if metadata is not None else db.metadata
+        self.tune_pragmas = tune_pragmas and self.engine.dialect.name == 'sqlite'
+        self.connection = None
+        self.transaction = None
+        self.stats = {}
+        self._next_ids = {}
+        self._saved_pragmas = None
+
+    def __enter__(self):
+        self.connection = self.engine.connect()
+        if self.tune_pragmas:
+            self._saved_pragmas = self._read_pragmas(LOAD_PRAGMAS)
+            self._set_pragmas(LOAD_PRAGMAS)
+        self.transaction = self.connection.begin()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        try:
+            if exc_type is None:
+                self.transaction.commit()
+            else:
+                self.transaction.rollback()
+        finally:
+            if self._saved_pragmas:
+                self._set_pragmas(self._saved_pragmas)
+                self._saved_pragmas = None
+            self.connection.close()
+            self.connection = None
+        return False
+
+    def _read_pragmas(self, names):
+        values = {name: self.connection.exec_driver_sql(f"PRAGMA {name}").scalar() for name in names}
+        self.connection.commit()
+        return values
+
+    def _set_pragmas(self, pragmas):
+        for name, value in pragmas.items():
+            self.connection.exec_driver_sql(f"PRAGMA {name} = {value}")
+        self.connection.commit()
+
+    def reserve_ids(self, table_name, count):
+        """Reserva um intervalo contínuo de IDs para a tabela"""
+        table = self.metadata.tables[table_name]
+        if table_name not in self._next_ids:
+            current = self.connection.execute(select(func.max(table.c.id))).scalar()
+            self._next_ids[table_name] = (current or 0) + 1
+        start = self._next_ids[table_name]
+        self._next_ids[table_name] = start + count
+        return range(start, start + count)
+
+    def insert(self, table_name, rows):
+        """Insere as linhas (dicionários) e retorna os IDs atribuídos, na mesma ordem"""
+        table = self.metadata.tables[table_name]
+        started = time.perf_counter()
+        assigned = []
+        total = 0
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                assigned.extend(self._insert_chunk(table, chunk))
+                total += len(chunk)
+                chunk = []
+        if chunk:
+            assigned.extend(self._insert_chunk(table, chunk))
+            total += len(chunk)
+
+        self._record(table_name, total, time.perf_counter() - started)
+        return assigned
+
+    def _insert_chunk(self, table, chunk):
+        # Linhas sem ID recebem IDs sequenciais reservados em memória
+        missing = [row for row in chunk if row.get('id') is None]
+        if missing and 'id' in table.c:
+            for row, new_id in zip(missing, self.reserve_ids(table.name, len(missing))):
+                row['id'] = new_id
+        elif 'id' in table.c and table.name in self._next_ids:
+            highest = max(row['id'] for row in chunk)
+            self._next_ids[table.name] = max(self._next_ids[table.name], highest + 1)
+
+        self.connection.execute(table.insert(), chunk)
+        return [row.get('id') for row in chunk]
+
+    def _record(self, table_name, rows, seconds):
+        entry = self.stats.setdefault(table_name, {'rows': 0, 'seconds': 0.0})
+        entry['rows'] += rows
+        entry['seconds'] += seconds
+        entry['rows_per_second'] = int(entry['rows'] / entry['seconds']) if entry['seconds'] else entry['rows']
+
+    def report(self):
+        """Linhas de resumo com a taxa de inserção por tabela"""
+        return [
+            f"{table_name}: {entry['rows']} linhas em {entry['seconds']:.2f}s ({entry['rows_per_second']} linhas/s)"
+            for table_name, entry in self.stats.items()
+        ]
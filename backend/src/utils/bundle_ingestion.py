@@ -0,0 +1,501 @@
+"""
+Ingestão de Bundles FHIR e lotes HL7 v2 enviados diretamente pelos sistemas de origem
+
+O corpo da requisição é lido em fluxo (bundle_parsers): cada recurso ou mensagem é mapeado para
+Patient / MedicalRecord pelos mapeamentos de campos configurados e acumulado em lotes. Cada lote
+é gravado em uma transação curta, pacientes antes dos registros que os referenciam: pacientes
+com upsert por patient_id, registros pelo mesmo upsert (system_source + external_id) e
+detectores de qualidade da ingestão incremental. A memória não depende do tamanho do arquivo.
+
+Mapeamentos: para cada campo, uma lista de caminhos candidatos; vale o primeiro não vazio.
+- FHIR: 'name[0].given', 'identifier[system~cpf].value' (~ contém, = igual), listas sem índice
+  usam o primeiro item;
+- HL7: 'PID-5.2' (segmento-campo.componente), procurado no segmento atual ou no último
+  segmento com esse nome na mensagem;
+- 'a+b' junta os valores não vazios com espaço; 'texto' entre aspas simples é um valor fixo.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from src.database import db
+from src.models.patient import Patient
+from src.utils.bundle_parsers import FhirBundleReader, Hl7BatchReader
+from src.utils.record_ingestion import _parse_timestamp, _store_batch
+
+PATIENT_BATCH_SIZE = 2000
+RECORD_BATCH_SIZE = 5000
+# Referências de Bundle (Patient/<id>, fullUrl) -> código do paciente, para Encounter/Observation
+MAX_PATIENT_REFERENCES = 100000
+
+BUNDLE_FORMATS = ('fhir', 'hl7')
+CONTENT_TYPES = {
+    'application/fhir+json': 'fhir',
+    'application/json': 'fhir',
+    'application/hl7-v2': 'hl7',
+    'x-application/hl7-v2+er7': 'hl7',
+    'text/plain': 'hl7'
+}
+
+# Tipo de registro gerado por recurso FHIR / segmento HL7
+RECORD_TYPES = {
+    'Encounter': 'consultation',
+    'Observation': 'exam',
+    'PV1': 'consultation',
+    'OBX': 'exam'
+}
+
+INGESTION_MAPPINGS = {
+    'fhir': {
+        'Patient': {
+            'patient_id': ['identifier[use=usual].value', 'id'],
+            'name': ['name[0].text', 'name[0].given+name[0].family'],
+            'cpf': ['identifier[system~cpf].value'],
+            'birth_date': ['birthDate'],
+            'gender': ['gender'],
+            'phone': ['telecom[system=phone].value'],
+            'email': ['telecom[system=email].value'],
+            'address': ['address[0].text', 'address[0].line+address[0].city+address[0].state']
+        },
+        'Encounter': {
+            'patient_reference': ['subject.reference'],
+            'patient_identifier': ['subject.identifier.value'],
+            'description': ['reasonCode[0].text', 'type[0].text', 'type[0].coding[0].display', "'Consulta'"],
+            'doctor_name': ['participant[0].individual.display'],
+            'department': ['serviceType.text', 'serviceProvider.display', 'location[0].location.display'],
+            'record_date': ['period.start']
+        },
+        'Observation': {
+            'patient_reference': ['subject.reference'],
+            'patient_identifier': ['subject.identifier.value'],
+            'description': [
+                'code.text+valueQuantity.value+valueQuantity.unit',
+                'code.coding[0].display+valueQuantity.value+valueQuantity.unit',
+                'code.text+valueString', 'code.text+valueCodeableConcept.text'
+            ],
+            'doctor_name': ['performer[0].display'],
+            'department': ['category[0].text', 'category[0].coding[0].display'],
+            'record_date': ['effectiveDateTime', 'effectivePeriod.start', 'issued']
+        }
+    },
+    'hl7': {
+        'PID': {
+            'patient_id': ['PID-3.1'],
+            'name': ['PID-5.2+PID-5.1'],
+            'cpf': ['PID-19'],
+            'birth_date': ['PID-7.1'],
+            'gender': ['PID-8'],
+            'phone': ['PID-13.1'],
+            'email': ['PID-13.4'],
+            'address': ['PID-11.1+PID-11.3+PID-11.4']
+        },
+        'PV1': {
+            'external_id': ['PV1-19.1'],
+            'description': ["'Atendimento'"],
+            'doctor_name': ['PV1-7.3+PV1-7.2'],
+            'department': ['PV1-10', 'PV1-3.1'],
+            'record_date': ['PV1-44.1', 'MSH-7.1']
+        },
+        'OBX': {
+            'description': ['OBX-3.2+OBX-5+OBX-6.1', 'OBX-3.1+OBX-5+OBX-6.1'],
+            'doctor_name': ['OBX-16.3+OBX-16.2', 'OBR-16.3+OBR-16.2'],
+            'department': ['OBR-24'],
+            'record_date': ['OBX-14.1', 'OBR-7.1', 'MSH-7.1']
+        }
+    }
+}
+
+GENDERS = {'male': 'M', 'female': 'F', 'm': 'M', 'f': 'F'}
+# Sem estes campos válidos o paciente não pode ser inserido, só atualizar um já cadastrado
+PATIENT_REQUIRED_FIELDS = ('patient_id', 'name', 'cpf', 'birth_date')
+# Valores de um paciente novo para os campos que não vieram (nunca aplicados em atualizações)
+PATIENT_DEFAULTS = {'gender': 'O', 'phone': None, 'email': None, 'address': None}
+
+_FHIR_STEP = re.compile(r'^(\w+)(?:\[(?:(\d+)|(\w+)([=~])([^\]]*))\])?$')
+_HL7_PATH = re.compile(r'^([A-Z][A-Z0-9]{2})-(\d+)(?:\.(\d+))?$')
+_HL7_TIMESTAMP = re.compile(r'^(\d{4})(\d{2})(\d{2})(?:(\d{2})(\d{2})(\d{2})?)?(?:\.\d+)?([+-]\d{4})?$')
+
+
+class BundleIngestionError(Exception):
+    """Conteúdo inválido no meio da ingestão; report traz o que já foi gravado"""
+
+    def __init__(self, message, report):
+        super().__init__(message)
+        self.report = report
+
+
+def bundle_format(requested, mimetype):
+    """Formato pedido (?format=) ou deduzido do Content-Type; None se não suportado"""
+    if requested:
+        requested = requested.lower()
+        return requested if requested in BUNDLE_FORMATS else None
+    return CONTENT_TYPES.get((mimetype or '').lower())
+
+
+def _first_value(candidates, lookup):
+    """Primeiro candidato não vazio ('a+b' junta partes; 'texto' é valor fixo)"""
+    for candidate in candidates:
+        if candidate.startswith("'"):
+            return candidate.strip("'")
+        value = ' '.join(part for part in (lookup(path) for path in candidate.split('+')) if part)
+        if value:
+            return value
+    return ''
+
+
+def map_fields(mapping, lookup):
+    return {target: _first_value(candidates, lookup) for target, candidates in mapping.items()}
+
+
+@lru_cache(maxsize=1024)
+def _fhir_steps(path):
+    """Passos de um caminho FHIR: (nome, índice, chave, operador, valor) ou None se inválido"""
+    steps = []
+    for step in path.split('.'):
+        match = _FHIR_STEP.match(step)
+        if match is None:
+            return None
+        name, index, key, operator, expected = match.groups()
+        steps.append((name, int(index) if index is not None else None, key, operator,
+                      expected.lower() if operator == '~' else expected))
+    return tuple(steps)
+
+
+def fhir_value(resource, path):
+    """Valor de um caminho FHIR como texto ('' se ausente)"""
+    steps = _fhir_steps(path)
+    if steps is None:
+        return ''
+    current = resource
+    for name, index, key, operator, expected in steps:
+        if isinstance(current, list):
+            current = current[0] if current else None
+        current = current.get(name) if isinstance(current, dict) else None
+        if current is None:
+            return ''
+        if index is not None or key is not None:
+            items = current if isinstance(current, list) else [current]
+            if index is not None:
+                current = items[index] if index < len(items) else None
+            else:
+                current = next((
+                    item for item in items
+                    if isinstance(item, dict) and (
+                        str(item.get(key, '')) == expected if operator == '='
+                        else expected in str(item.get(key, '')).lower()
+                    )
+                ), None)
+            if current is None:
+                return ''
+
+    if isinstance(current, list):
+        # given: ['Maria', 'Clara'] -> 'Maria Clara'
+        return ' '.join(str(item).strip() for item in current if isinstance(item, (str, int, float)))
+    if isinstance(current, (dict, bool)) or current is None:
+        return ''
+    return str(current).strip()
+
+
+@lru_cache(maxsize=1024)
+def _hl7_path(path):
+    """(segmento, campo, componente) de um caminho HL7, ou None se inválido"""
+    match = _HL7_PATH.match(path)
+    if match is None:
+        return None
+    return match.group(1), int(match.group(2)), int(match.group(3)) if match.group(3) else None
+
+
+def hl7_value(message, positions, path):
+    """Valor de um caminho HL7 no segmento atual ou no último segmento com esse nome
+
+    positions: segmento -> posição da sua ocorrência mais recente na mensagem.
+    """
+    parsed = _hl7_path(path)
+    if parsed is None:
+        return ''
+    name, field, component = parsed
+    position = positions.get(name)
+    if position is None:
+        return ''
+    return message.value(position, field, component)
+
+
+def _parse_date(value):
+    """Data de nascimento FHIR (AAAA-MM-DD) ou HL7 (AAAAMMDD...)"""
+    digits = value.replace('-', '')[:8]
+    if len(digits) != 8 or not digits.isdigit():
+        return None
+    try:
+        return date(int(digits[:4]), int(digits[4:6]), int(digits[6:8]))
+    except ValueError:
+        return None
+
+
+def _parse_record_date(value):
+    """Data do registro em ISO 8601 (aceita o formato HL7 AAAAMMDDHHMMSS[+ZZZZ])"""
+    if not value:
+        return None
+    match = _HL7_TIMESTAMP.match(value)
+    try:
+        if match is None:
+            return _parse_timestamp(value).isoformat()
+        year, month, day, hour, minute, second, offset = match.groups()
+        parsed = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+        if offset:
+            sign = 1 if offset[0] == '+' else -1
+            parsed -= sign * timedelta(hours=int(offset[1:3]), minutes=int(offset[3:5]))
+        return parsed.isoformat()
+    except ValueError:
+        return None
+
+
+def _format_cpf(value):
+    digits = re.sub(r'\D', '', value)
+    if len(digits) != 11:
+        return None
+    return f'{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}'
+
+
+def _patient_row(fields):
+    """Campos válidos do paciente a partir dos campos mapeados (None sem patient_id válido)
+
+    Campos ausentes ou inválidos ficam de fora: sem CPF, nome ou data de nascimento a linha é
+    parcial e só atualiza um paciente já cadastrado.
+    """
+    code = fields['patient_id']
+    if not code or len(code) > 50:
+        return None
+    values = {
+        'patient_id': code,
+        'name': fields['name'][:100] or None,
+        'cpf': _format_cpf(fields['cpf']),
+        'birth_date': _parse_date(fields['birth_date']),
+        'gender': GENDERS.get(fields['gender'].lower()),
+        'phone': fields['phone'][:20] or None,
+        'email': fields['email'][:100] or None,
+        'address': fields['address'] or None
+    }
+    return {name: value for name, value in values.items() if value is not None}
+
+
+def _complete(row):
+    return all(name in row for name in PATIENT_REQUIRED_FIELDS)
+
+
+class BundleIngestion:
+    """Acumula pacientes e registros mapeados e grava em lotes, pacientes primeiro"""
+
+    def __init__(self, system, bundle_format, patient_batch_size=PATIENT_BATCH_SIZE,
+                 record_batch_size=RECORD_BATCH_SIZE):
+        self.system = system
+        self.patient_batch_size = patient_batch_size
+        self.record_batch_size = record_batch_size
+        self.patients = {}
+        self.records = []
+        self.started = time.perf_counter()
+        self.report = {
+            'format': bundle_format,
+            'bytes': 0,
+            'items': 0,
+            'resources': {},
+            'skipped': 0,
+            'batches': 0,
+            'patients': {'inserted': 0, 'updated': 0, 'rejected': 0},
+            'records': {'inserted': 0, 'updated': 0, 'rejected': 0},
+            'issues': 0
+        }
+
+    def count(self, resource_type):
+        resources = self.report['resources']
+        resources[resource_type] = resources.get(resource_type, 0) + 1
+
+    def add_patient(self, fields):
+        """Enfileira um paciente; devolve o código (patient_id) ou None se rejeitado"""
+        row = _patient_row(fields)
+        if row is None:
+            self.report['patients']['rejected'] += 1
+            return None
+        # Paciente repetido no lote vale pela última versão de cada campo
+        self.patients.setdefault(row['patient_id'], {}).update(row)
+        if len(self.patients) >= self.patient_batch_size:
+            self.flush()
+        return row['patient_id']
+
+    def add_record(self, fields, record_type, external_id, patient_code):
+        """Enfileira um registro no formato da ingestão incremental"""
+        self.records.append({
+            'id': external_id,
+            'patient_id': patient_code,
+            'record_type': record_type,
+            'description': fields['description'],
+            'doctor_name': fields['doctor_name'] or None,
+            'department': fields['department'] or None,
+            'record_date': _parse_record_date(fields['record_date'])
+        })
+        if len(self.records) >= self.record_batch_size:
+            self.flush()
+
+    def _store_patients(self, rows, now):
+        """Insere os pacientes novos e atualiza, nos existentes, só os campos que vieram"""
+        counts = self.report['patients']
+
+        # CPF único: o primeiro paciente do lote fica com ele, e um CPF já de outro paciente é rejeitado
+        owners = {}
+        for row in rows:
+            if 'cpf' in row:
+                owners.setdefault(row['cpf'], row['patient_id'])
+        if owners:
+            owners.update(db.session.execute(
+                select(Patient.cpf, Patient.patient_id).where(Patient.cpf.in_(list(owners)))
+            ).all())
+        accepted = [row for row in rows if 'cpf' not in row or owners[row['cpf']] == row['patient_id']]
+
+        ids = dict(db.session.execute(
+            select(Patient.patient_id, Patient.id).where(Patient.patient_id.in_([row['patient_id'] for row in accepted]))
+        ).all())
+        new = [dict(PATIENT_DEFAULTS, **row, created_at=now, updated_at=now)
+               for row in accepted if row['patient_id'] not in ids and _complete(row)]
+        changes = [
+            dict({name: value for name, value in row.items() if name != 'patient_id'},
+                 id=ids[row['patient_id']], updated_at=now)
+            for row in accepted if row['patient_id'] in ids
+        ]
+        # Rejeitados: CPF de outro paciente, ou paciente novo sem os campos obrigatórios
+        counts['rejected'] += len(rows) - len(new) - len(changes)
+
+        if new:
+            # Um paciente inserido por outra requisição entre a leitura e o INSERT não perde os contatos
+            statement = insert(Patient)
+            columns = Patient.__table__.c
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=[Patient.patient_id],
+                set_=dict(
+                    {name: statement.excluded[name] for name in ('name', 'cpf', 'birth_date', 'updated_at')},
+                    **{name: func.coalesce(statement.excluded[name], columns[name])
+                       for name in ('phone', 'email', 'address')}
+                )
+            ), new)
+        if changes:
+            # UPDATE por chave primária, agrupado pelo conjunto de campos presentes em cada linha
+            db.session.execute(update(Patient), changes)
+        counts['inserted'] += len(new)
+        counts['updated'] += len(changes)
+
+    def flush(self):
+        """Grava os lotes pendentes em uma transação, com a hora da gravação em updated_at"""
+        if not self.patients and not self.records:
+            return
+        now = datetime.utcnow()
+        try:
+            if self.patients:
+                self._store_patients(list(self.patients.values()), now)
+            if self.records:
+                for record in self.records:
+                    record['updated_at'] = now.isoformat()
+                counts = _store_batch(self.system, self.records, now)
+                for name in ('inserted', 'updated', 'rejected'):
+                    self.report['records'][name] += counts[name]
+                self.report['issues'] += counts['issues']
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        self.patients = {}
+        self.records = []
+        self.report['batches'] += 1
+
+    def finish(self, bytes_read):
+        """Relatório final com a vazão"""
+        elapsed = time.perf_counter() - self.started
+        report = self.report
+        report['bytes'] = bytes_read
+        report['elapsed_seconds'] = round(elapsed, 3)
+        report['mb_per_second'] = round(bytes_read / (1024 * 1024) / elapsed, 2) if elapsed else None
+        report['items_per_second'] = int(report['items'] / elapsed) if elapsed else report['items']
+        return report
+
+
+def _ingest_fhir(ingestion, reader, mappings):
+    # Referências a pacientes do próprio Bundle, limitadas às mais recentes
+    references = OrderedDict()
+    for entry in reader:
+        ingestion.report['items'] += 1
+        resource = entry.get('resource')
+        resource_type = resource.get('resourceType') if isinstance(resource, dict) else None
+        if resource_type not in mappings:
+            ingestion.report['skipped'] += 1
+            continue
+        ingestion.count(resource_type)
+        fields = map_fields(mappings[resource_type], lambda path: fhir_value(resource, path))
+
+        if resource_type == 'Patient':
+            code = ingestion.add_patient(fields)
+            if code is not None:
+                for key in (f"Patient/{resource.get('id')}", entry.get('fullUrl')):
+                    if key:
+                        references[key] = code
+                while len(references) > MAX_PATIENT_REFERENCES:
+                    references.popitem(last=False)
+            continue
+
+        reference = fields.get('patient_reference', '')
+        code = references.get(reference) or fields.get('patient_identifier')
+        if not code and reference.startswith('Patient/'):
+            # Paciente fora do Bundle: o id do recurso é o código do paciente
+            code = reference.split('/', 1)[1]
+        external_id = f"{resource_type}/{resource['id']}" if resource.get('id') else entry.get('fullUrl')
+        ingestion.add_record(fields, RECORD_TYPES.get(resource_type, resource_type.lower()), external_id, code)
+
+
+def _ingest_hl7(ingestion, reader, mappings):
+    for message in reader:
+        ingestion.report['items'] += 1
+        control_id = message.value(0, 10)
+        code = None
+        positions = {'MSH': 0}
+        for index in range(1, len(message.segments)):
+            name = message.segment_name(index)
+            positions[name] = index
+            if name not in mappings:
+                continue
+            ingestion.count(name)
+            fields = map_fields(mappings[name], lambda path: hl7_value(message, positions, path))
+
+            if name == 'PID':
+                code = ingestion.add_patient(fields) or fields['patient_id'] or None
+                continue
+
+            external_id = fields.get('external_id')
+            if not external_id:
+                # Sem identificador próprio: ID de controle da mensagem + posição do segmento
+                set_id = message.value(index, 1) or str(index)
+                external_id = f'{control_id}-{name}-{set_id}' if control_id else None
+            ingestion.add_record(fields, RECORD_TYPES.get(name, name.lower()), external_id, code)
+
+
+def ingest_bundle(system, stream, bundle_format, mappings=None, patient_batch_size=PATIENT_BATCH_SIZE,
+                  record_batch_size=RECORD_BATCH_SIZE):
+    """Lê o Bundle FHIR / lote HL7 do fluxo e grava pacientes e registros em lotes
+
+    Lança BundleIngestionError se o conteúdo for inválido no meio do caminho; tudo o que foi lido
+    antes do erro é gravado e aparece no relatório da exceção.
+    """
+    mappings = (mappings or INGESTION_MAPPINGS)[bundle_format]
+    ingestion = BundleIngestion(system, bundle_format, patient_batch_size, record_batch_size)
+    reader = FhirBundleReader(stream) if bundle_format == 'fhir' else Hl7BatchReader(stream)
+
+    try:
+        if bundle_format == 'fhir':
+            _ingest_fhir(ingestion, reader, mappings)
+        else:
+            _ingest_hl7(ingestion, reader, mappings)
+    except ValueError as e:
+        ingestion.flush()
+        raise BundleIngestionError(str(e), ingestion.finish(reader.bytes_read))
+
+    ingestion.flush()
+    return ingestion.finish(reader.bytes_read)
@@ -0,0 +1,264 @@
+"""
+Leitura incremental de Bundles FHIR (JSON) e lotes HL7 v2
+
+Os dois leitores consomem um fluxo binário em blocos e entregam um item por vez, sem carregar
+o arquivo inteiro: o JSON do Bundle é percorrido estruturalmente e cada elemento de "entry" é
+decodificado isoladamente (json.JSONDecoder.raw_decode sobre o buffer); o HL7 é dividido em
+segmentos e agrupado em mensagens a cada MSH. A memória usada é limitada por um bloco de
+leitura mais o maior item (entrada do Bundle ou mensagem HL7).
+"""
+
+import codecs
+import json
+import re
+
+READ_CHUNK_SIZE = 256 * 1024
+MAX_ITEM_BYTES = 16 * 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_SEGMENT_END = re.compile(r'[\r\n]+')
+# Moldura MLLP (início de bloco, fim de bloco)
+_MLLP_CHARACTERS = ('\x0b', '\x1c')
+
+
+class _TextStream:
+    """Fluxo binário decodificado em UTF-8 sob demanda, com contagem de bytes lidos"""
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE, errors='strict'):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors)
+        self.bytes_read = 0
+        self.eof = False
+
+    def read(self):
+        """Próximo bloco de texto ('' no fim do fluxo)"""
+        while not self.eof:
+            data = self.stream.read(self.chunk_size)
+            if not data:
+                self.eof = True
+                return self.decoder.decode(b'', final=True)
+            self.bytes_read += len(data)
+            text = self.decoder.decode(data)
+            if text:
+                return text
+        return ''
+
+
+class FhirBundleReader:
+    """Percorre um Bundle FHIR e entrega cada entrada ({'fullUrl', 'resource', ...})
+
+    Uso:
+        reader = FhirBundleReader(request.stream)
+        for entry in reader:
+            ...
+    """
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE, max_entry_bytes=MAX_ITEM_BYTES):
+        self.source = _TextStream(stream, chunk_size)
+        self.max_entry_bytes = max_entry_bytes
+        self.decoder = json.JSONDecoder()
+        self.text = ''
+        self.pos = 0
+        self.bundle = {}  # campos do Bundle fora de "entry" (resourceType, type, total...)
+
+    @property
+    def bytes_read(self):
+        return self.source.bytes_read
+
+    def _fill(self):
+        chunk = self.source.read()
+        if not chunk:
+            return False
+        # Descarta o que já foi consumido antes de anexar o bloco novo
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _skip_whitespace(self):
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self._fill():
+                return
+
+    def _peek(self):
+        self._skip_whitespace()
+        if self.pos >= len(self.text):
+            raise ValueError('JSON incompleto: fim do conteúdo antes do fim do Bundle')
+        return self.text[self.pos]
+
+    def _expect(self, char):
+        if self._peek() != char:
+            raise ValueError(f"JSON inválido na posição {self.source.bytes_read}: esperado '{char}'")
+        self.pos += 1
+
+    def _value(self):
+        """Decodifica o próximo valor JSON completo, lendo mais blocos quando necessário"""
+        self._skip_whitespace()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.pos)
+                # Um número no fim do buffer pode continuar no próximo bloco
+                if end < len(self.text) or self.source.eof:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError as e:
+                if self.source.eof:
+                    raise ValueError(f'JSON inválido: {e.msg}')
+            if len(self.text) - self.pos > self.max_entry_bytes:
+                raise ValueError(f'Entrada do Bundle excede {self.max_entry_bytes // (1024 * 1024)} MB')
+            self._fill()
+
+    def _entries(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            entry = self._value()
+            if isinstance(entry, dict):
+                yield entry
+            separator = self._peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                raise ValueError("JSON inválido: esperado ',' ou ']' entre as entradas do Bundle")
+
+    def __iter__(self):
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self._value()
+            if not isinstance(key, str):
+                raise ValueError('JSON inválido: chave do Bundle não é texto')
+            self._expect(':')
+            if key == 'entry':
+                yield from self._entries()
+            else:
+                self.bundle[key] = self._value()
+                if key == 'resourceType' and self.bundle[key] != 'Bundle':
+                    raise ValueError(f"Esperado um Bundle FHIR, recebido {self.bundle[key]}")
+            separator = self._peek()
+            self.pos += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError("JSON inválido: esperado ',' ou '}' entre os campos do Bundle")
+
+
+class Hl7Message:
+    """Mensagem HL7 v2 com acesso por caminho ('PID-5.2' = campo 5, componente 2, 1ª repetição)"""
+
+    def __init__(self, segments):
+        self.segments = segments
+        header = segments[0]
+        self.field_separator = header[3]
+        encoding = header.split(self.field_separator)[1] if len(header) > 4 else '^~\\&'
+        self.component_separator = encoding[0:1] or '^'
+        self.repetition_separator = encoding[1:2] or '~'
+        self.escape_character = encoding[2:3] or '\\'
+        self.subcomponent_separator = encoding[3:4] or '&'
+        self._split = {}
+        self._values = {}
+
+    def fields(self, index):
+        """Campos do segmento na posição informada (SEG-n = fields[n], inclusive no MSH)"""
+        fields = self._split.get(index)
+        if fields is None:
+            segment = self.segments[index]
+            fields = segment.split(self.field_separator)
+            if fields[0] == 'MSH':
+                # MSH-1 é o próprio separador: alinha a numeração dos demais campos
+                fields.insert(1, self.field_separator)
+            self._split[index] = fields
+        return fields
+
+    def segment_name(self, index):
+        return self.segments[index][:3]
+
+    def _unescape(self, value):
+        escape = self.escape_character
+        if escape not in value:
+            return value
+        replacements = {
+            'F': self.field_separator, 'S': self.component_separator, 'T': self.subcomponent_separator,
+            'R': self.repetition_separator, 'E': escape
+        }
+        return re.sub(
+            re.escape(escape) + r'([FSTRE])' + re.escape(escape),
+            lambda match: replacements[match.group(1)],
+            value
+        )
+
+    def value(self, index, field, component=None):
+        """Valor de um campo (primeira repetição) ou de um componente; '' se ausente"""
+        key = (index, field)
+        cached = self._values.get(key)
+        if cached is None:
+            fields = self.fields(index)
+            value = fields[field].split(self.repetition_separator, 1)[0] if field < len(fields) else ''
+            cached = self._values[key] = (value, value.split(self.component_separator))
+        value, components = cached
+        if component is not None:
+            value = components[component - 1] if component <= len(components) else ''
+            value = value.split(self.subcomponent_separator, 1)[0]
+        return self._unescape(value).strip()
+
+
+class Hl7BatchReader:
+    """Agrupa os segmentos de um lote HL7 v2 em mensagens (uma a cada MSH)
+
+    Segmentos de envelope (FHS, BHS, BTS, FTS) e linhas vazias são ignorados; a moldura MLLP,
+    se houver, é removida.
+    """
+
+    def __init__(self, stream, chunk_size=READ_CHUNK_SIZE, max_message_bytes=MAX_ITEM_BYTES):
+        self.source = _TextStream(stream, chunk_size, errors='replace')
+        self.max_message_bytes = max_message_bytes
+
+    @property
+    def bytes_read(self):
+        return self.source.bytes_read
+
+    def __iter__(self):
+        limit_mb = self.max_message_bytes // (1024 * 1024)
+        pending = ''
+        segments = []
+        size = 0
+
+        while True:
+            chunk = self.source.read()
+            for character in _MLLP_CHARACTERS:
+                if character in chunk:
+                    chunk = chunk.replace(character, '')
+            parts = _SEGMENT_END.split(pending + chunk)
+            # O último pedaço pode ser um segmento incompleto, exceto no fim do fluxo
+            pending = parts.pop() if chunk else ''
+
+            for segment in parts:
+                if not segment or segment[:3] in ('FHS', 'BHS', 'BTS', 'FTS'):
+                    continue
+                if segment.startswith('MSH'):
+                    if len(segment) < 8:
+                        raise ValueError('Segmento MSH inválido')
+                    if segments:
+                        yield Hl7Message(segments)
+                    segments, size = [segment], 0
+                elif segments:
+                    segments.append(segment)
+                else:
+                    raise ValueError(f'Segmento {segment[:3]} fora de uma mensagem (esperado MSH)')
+                size += len(segment)
+                if size > self.max_message_bytes:
+                    raise ValueError(f'Mensagem HL7 excede {limit_mb} MB')
+
+            if len(pending) > self.max_message_bytes:
+                raise ValueError(f'Segmento HL7 excede {limit_mb} MB')
+            if not chunk:
+                break
+
+        if segments:
+            yield Hl7Message(segments)
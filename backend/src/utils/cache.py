@@ -0,0 +1,63 @@
+"""
+Cache em memória com expiração (TTL) compartilhado pelas rotas
+"""
+
+import threading
+import time
+
+
+class TTLCache:
+    """Cache simples, seguro para threads, com expiração por entrada"""
+
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Retorna o valor armazenado se ainda não expirou"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Armazena um valor com o TTL informado (ou o padrão do cache)"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if len(self._data) >= self.maxsize and key not in self._data:
+                self._evict()
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Retorna o valor em cache ou calcula com a factory e armazena"""
+        marker = object()
+        value = self.get(key, marker)
+        if value is marker:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, key=None):
+        """Remove uma entrada específica ou limpa todo o cache"""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def _evict(self):
+        # Remove entradas expiradas; se não houver, descarta a mais antiga
+        now = time.monotonic()
+        expired = [key for key, (expires_at, _) in self._data.items() if expires_at <= now]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.maxsize:
+            oldest = min(self._data, key=lambda key: self._data[key][0])
+            del self._data[oldest]
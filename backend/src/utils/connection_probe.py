@@ -0,0 +1,126 @@
+"""
+Verificação de conectividade das integrações (asyncio + aiohttp)
+
+Cada sistema é testado contra a sua base FHIR (endpoint_url) em três etapas:
+- conexão: GET {base}/metadata responde sem erro de servidor;
+- autenticação: GET {base}/Patient?_count=1 com o token não devolve 401/403;
+- acesso a dados: essa mesma leitura devolve 200 com um corpo JSON válido.
+
+Todos os sistemas são testados ao mesmo tempo, com um pool de conexões compartilhado e tempo
+limite por sistema: testar N integrações leva cerca de um tempo limite, não N.
+"""
+
+import asyncio
+import math
+import time
+import aiohttp
+
+PROBE_TIMEOUT = 5.0  # segundos, por sistema
+PROBE_MAX_CONNECTIONS = 256
+PERCENTILES = (50, 90, 95, 99)
+
+CHECKS = ('connection_test', 'authentication_test', 'data_access_test')
+
+
+def probe_target(system):
+    """Dados do sistema usados no teste (lidos antes de sair da sessão do banco)"""
+    return {
+        'system_id': system.id,
+        'endpoint_url': (system.endpoint_url or '').rstrip('/'),
+        'auth_token': system.auth_token
+    }
+
+
+def _empty_result(target):
+    result = {name: False for name in CHECKS}
+    result.update({
+        'system_id': target['system_id'],
+        'configured': bool(target['endpoint_url']),
+        'response_time_ms': None,
+        'error': None
+    })
+    return result
+
+
+async def _run_checks(session, target, result):
+    base = target['endpoint_url']
+    async with session.get(f'{base}/metadata') as response:
+        await response.read()
+        result['connection_test'] = response.status < 500
+    if not result['connection_test']:
+        result['error'] = f'Servidor respondeu {response.status}'
+        return
+
+    headers = {'Authorization': f"Bearer {target['auth_token']}"} if target['auth_token'] else {}
+    async with session.get(f'{base}/Patient', params={'_count': '1'}, headers=headers) as response:
+        result['authentication_test'] = response.status not in (401, 403)
+        if response.status != 200:
+            await response.read()
+            result['error'] = f'Leitura de dados respondeu {response.status}'
+            return
+        try:
+            await response.json(content_type=None)
+        except ValueError:
+            result['error'] = 'Resposta de dados não é JSON válido'
+            return
+        result['data_access_test'] = True
+
+
+async def _probe_system(session, target, timeout):
+    result = _empty_result(target)
+    if not result['configured']:
+        result['error'] = 'Endpoint de integração não configurado'
+        return result
+
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(_run_checks(session, target, result), timeout)
+    except asyncio.TimeoutError:
+        result['error'] = f'Tempo limite de {timeout:g}s excedido'
+    except aiohttp.ClientError as e:
+        result['error'] = f'Falha na conexão: {e.__class__.__name__}'
+    except ValueError:  # URL inválida
+        result['error'] = 'Endpoint de integração inválido'
+    result['response_time_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+async def _probe_all(targets, timeout, max_connections):
+    connector = aiohttp.TCPConnector(limit=max_connections, ttl_dns_cache=300)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=None)) as session:
+        return await asyncio.gather(*(_probe_system(session, target, timeout) for target in targets))
+
+
+def probe_systems(targets, timeout=PROBE_TIMEOUT, max_connections=PROBE_MAX_CONNECTIONS):
+    """Testa todos os alvos em paralelo; resultados na mesma ordem dos alvos"""
+    if not targets:
+        return []
+    return asyncio.run(_probe_all(targets, timeout, max_connections))
+
+
+def percentiles(values, points=PERCENTILES):
+    """Percentis pelo método do posto mais próximo ({'p50': ..., ...}; None sem valores)"""
+    ordered = sorted(value for value in values if value is not None)
+    if not ordered:
+        return {f'p{point}': None for point in points}
+    return {
+        f'p{point}': ordered[max(math.ceil(point / 100 * len(ordered)) - 1, 0)]
+        for point in points
+    }
+
+
+def summarize_probes(results, elapsed_ms):
+    """Resumo de um teste de vários sistemas com os percentis do tempo de resposta"""
+    configured = [result for result in results if result['configured']]
+    passed = sum(1 for result in configured if all(result[name] for name in CHECKS))
+    timings = [result['response_time_ms'] for result in configured]
+    summary = {
+        'systems': len(results),
+        'passed': passed,
+        'failed': len(configured) - passed,
+        'not_configured': len(results) - len(configured),
+        'elapsed_ms': round(elapsed_ms, 1),
+        'response_time_ms': percentiles(timings)
+    }
+    summary['response_time_ms']['max'] = max(timings) if timings else None
+    return summary
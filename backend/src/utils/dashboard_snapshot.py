@@ -0,0 +1,73 @@
+"""
+Snapshot das contagens do dashboard, calculado em uma única consulta e mantido em cache
+"""
+
+import threading
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import case, func, select, true
+from src.models.patient import Patient, HealthSystem, DataQualityIssue, db
+from src.utils.cache import TTLCache
+
+DEFAULT_SNAPSHOT_TTL = 30  # segundos
+
+_SNAPSHOT_KEY = 'dashboard_counts'
+_snapshot_cache = TTLCache(ttl=DEFAULT_SNAPSHOT_TTL, maxsize=1)
+_refresh_lock = threading.Lock()
+
+
+def _count_if(condition):
+    return func.coalesce(func.sum(case((condition, 1), else_=0)), 0)
+
+
+def compute_dashboard_counts():
+    """Calcula todas as contagens do dashboard com agregação condicional em um único SELECT"""
+    # Todas as contagens de problemas são sobre abertos: o filtro usa os índices por status
+    issues = select(
+        func.count(DataQualityIssue.id).label('open_issues'),
+        _count_if(DataQualityIssue.priority == 'high').label('high_priority_issues'),
+        _count_if(DataQualityIssue.issue_type == 'duplicate').label('duplicate_issues'),
+        _count_if(DataQualityIssue.issue_type == 'missing').label('missing_fields')
+    ).where(DataQualityIssue.status == 'open').subquery()
+
+    systems = select(
+        func.count(HealthSystem.id).label('total_systems'),
+        _count_if(HealthSystem.status == 'offline').label('offline_systems')
+    ).subquery()
+
+    patients = select(
+        func.count(Patient.id).label('total_patients')
+    ).subquery()
+
+    # Cada subconsulta devolve uma única linha; o join trivial as combina em um só round-trip
+    row = db.session.execute(
+        select(issues, systems, patients).select_from(
+            issues.join(systems, true()).join(patients, true())
+        )
+    ).one()
+
+    counts = dict(row._mapping)
+    counts['calculated_at'] = datetime.utcnow()
+    return counts
+
+
+def get_dashboard_snapshot():
+    """Retorna o snapshot em cache, recalculando no máximo uma vez por janela de TTL"""
+    snapshot = _snapshot_cache.get(_SNAPSHOT_KEY)
+    if snapshot is not None:
+        return snapshot
+
+    # Apenas uma requisição recalcula; as concorrentes aguardam e reutilizam o resultado
+    with _refresh_lock:
+        snapshot = _snapshot_cache.get(_SNAPSHOT_KEY)
+        if snapshot is None:
+            snapshot = compute_dashboard_counts()
+            ttl = current_app.config.get('DASHBOARD_SNAPSHOT_TTL', DEFAULT_SNAPSHOT_TTL)
+            _snapshot_cache.set(_SNAPSHOT_KEY, snapshot, ttl)
+
+    return snapshot
+
+
+def invalidate_dashboard_snapshot():
+    """Descarta o snapshot após alterações em problemas ou sistemas"""
+    _snapshot_cache.invalidate(_SNAPSHOT_KEY)
@@ -0,0 +1,202 @@
+"""
+Exportação em massa de problemas, pacientes e registros médicos
+
+As linhas são lidas em lotes por chave primária (iter_keyset_batches) e convertidas lote a lote
+em NDJSON, CSV ou Parquet; cada lote vira um pedaço da resposta, então a memória usada não
+depende do tamanho da exportação. Parquet requer o pyarrow (dependência opcional).
+
+O primeiro lote é lido antes do início da resposta, então filtros inválidos e falhas do banco
+ainda viram 400/500. Uma falha depois disso não tem como mudar o status: o NDJSON termina com
+uma linha {"error": ...} e, em todos os formatos, a exceção interrompe a transferência sem o
+fechamento da resposta em partes (e o Parquet fica sem rodapé), para o cliente não tomar o
+arquivo como completo.
+"""
+
+import csv
+import io
+import json
+from itertools import chain
+from datetime import date, datetime
+from sqlalchemy import select
+from src.models.patient import Patient, MedicalRecord, DataQualityIssue
+from src.utils.issue_listing import filter_issue_listing, issue_listing_query
+from src.utils.pagination import iter_keyset_batches
+from src.utils.text_search import patient_search_condition
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet fica indisponível sem o pyarrow
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+
+
+def _issues_export(args):
+    # Mesmos filtros (e padrão status=open) da listagem do centro de resolução
+    query = filter_issue_listing(
+        issue_listing_query(),
+        args.get('status', 'open'),
+        args.get('priority', ''),
+        args.get('type', '')
+    )
+    return query.statement, DataQualityIssue.id
+
+
+def _patients_export(args):
+    statement = select(*Patient.__table__.columns)
+    search = args.get('search', '')
+    if search:
+        statement = statement.where(patient_search_condition(search))
+    return statement, Patient.id
+
+
+def _records_export(args):
+    statement = select(*MedicalRecord.__table__.columns)
+    patient_id = args.get('patient_id', '')
+    if patient_id:
+        if not str(patient_id).isdigit():
+            raise ValueError('patient_id deve ser numérico')
+        statement = statement.where(MedicalRecord.patient_id == int(patient_id))
+    for parameter, column in (('system', MedicalRecord.system_source),
+                              ('department', MedicalRecord.department),
+                              ('type', MedicalRecord.record_type)):
+        value = args.get(parameter, '')
+        if value:
+            statement = statement.where(column == value)
+    return statement, MedicalRecord.id
+
+
+EXPORT_DATASETS = {
+    'issues': _issues_export,
+    'patients': _patients_export,
+    'records': _records_export
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def _ndjson_chunks(names, batches):
+    try:
+        for rows in batches:
+            yield ''.join(
+                json.dumps(dict(zip(names, map(_plain, row))), ensure_ascii=False) + '\n' for row in rows
+            )
+    except Exception as e:
+        # Status já enviado: a última linha avisa que a exportação ficou incompleta
+        yield json.dumps({'error': f'Exportação interrompida: {str(e)}'}, ensure_ascii=False) + '\n'
+        raise
+
+
+def _csv_chunks(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for rows in batches:
+        writer.writerows([_plain(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Destino do ParquetWriter que acumula os bytes até serem enviados"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _arrow_type(column):
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return pa.string()
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is float:
+        return pa.float64()
+    if python_type is datetime:
+        return pa.timestamp('us')
+    if python_type is date:
+        return pa.date32()
+    return pa.string()
+
+
+def _parquet_chunks(statement, batches):
+    schema = pa.schema([(column.name, _arrow_type(column)) for column in statement.selected_columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        # Um row group por lote: o rodapé (com o índice dos row groups) é gravado no fechamento
+        for rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def prepare_export(dataset, file_format, args):
+    """Valida o pedido e devolve (gerador de pedaços, mimetype, extensão)
+
+    Lança KeyError para conjunto desconhecido e ValueError para formato ou filtro inválido.
+    """
+    builder = EXPORT_DATASETS[dataset]
+    file_format = (file_format or 'ndjson').lower()
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError(f'Formato não suportado: {file_format} (use ndjson, csv ou parquet)')
+    if file_format == 'parquet' and pa is None:
+        raise ValueError('Exportação em Parquet requer o pacote pyarrow')
+
+    statement, key_column = builder(args)
+    batches = iter_keyset_batches(statement, key_column, EXPORT_BATCH_SIZE)
+    # Primeiro lote já consultado: erros aparecem aqui, antes do status da resposta
+    first = next(batches, None)
+    batches = chain([first], batches) if first is not None else iter(())
+    names = [column.name for column in statement.selected_columns]
+
+    if file_format == 'parquet':
+        chunks = _parquet_chunks(statement, batches)
+    elif file_format == 'csv':
+        chunks = _csv_chunks(names, batches)
+    else:
+        chunks = _ndjson_chunks(names, batches)
+
+    mimetype, extension = EXPORT_FORMATS[file_format]
+    return chunks, mimetype, extension
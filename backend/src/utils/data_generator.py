@@ -1,17 +1,70 @@
 """
 Gerador de dados fictícios para o HealthGraph Radar MVP
+
+Para volumes grandes, os índices de pacientes são divididos em shards gerados em paralelo
+(ProcessPoolExecutor) com seeds determinísticas por shard; os lotes são entregues em ordem
+como um gerador, sem montar o dataset inteiro em memória.
+
+Uso: python src/utils/data_generator.py [--patients N] [--workers W] [--seed S] [--output DIR] [--format ndjson|csv]
 """
 
 from faker import Faker
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+import argparse
+import csv
+import hashlib
+import os
 import random
 import json
 
 fake = Faker('pt_BR')
 
+DEFAULT_SHARD_SIZE = 10000
+PATIENT_TABLES = ['patients', 'medical_records', 'data_quality_issues']
+
+# Colunas fixas dos arquivos CSV (campos opcionais, como resolved_at, ficam vazios)
+CSV_COLUMNS = {
+    'patients': ['patient_index', 'patient_id', 'name', 'cpf', 'birth_date', 'gender', 'phone', 'email', 'address'],
+    'medical_records': ['patient_id', 'record_type', 'description', 'doctor_name', 'department',
+                        'system_source', 'record_date'],
+    'data_quality_issues': ['patient_id', 'system_id', 'issue_type', 'priority', 'title', 'description',
+                            'status', 'detected_at', 'resolved_at', 'resolution_time']
+}
+
+# Permutação dos 9 dígitos base do CPF: multiplicador coprimo com 10 garante CPFs únicos por índice
+_CPF_MULTIPLIER = 387420489
+_CPF_OFFSET = 104729
+
+
+def cpf_from_index(index):
+    """CPF formatado, válido e único derivado do índice do paciente"""
+    base = (index * _CPF_MULTIPLIER + _CPF_OFFSET) % 10**9
+    digits = [int(d) for d in f"{base:09d}"]
+    for length in (9, 10):
+        total = sum(d * (length + 1 - i) for i, d in enumerate(digits[:length]))
+        remainder = total % 11
+        digits.append(0 if remainder < 2 else 11 - remainder)
+    cpf = ''.join(str(d) for d in digits)
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+def shard_seed(seed, shard):
+    """Seed determinística de um shard, estável entre execuções e processos"""
+    digest = hashlib.sha256(f"{seed}:{shard}".encode()).hexdigest()
+    return int(digest[:16], 16)
+
 class HealthDataGenerator:
-    def __init__(self):
-        self.fake = fake
+    def __init__(self, seed=None, reference_time=None):
+        # Com seed, cada instância tem seu próprio gerador (reprodutível e independente do random global)
+        self.random = random.Random(seed)
+        if seed is None:
+            self.fake = fake
+        else:
+            self.fake = Faker('pt_BR')
+            self.fake.seed_instance(seed)
+        # Datas são geradas relativas a este instante para que a saída seja reprodutível
+        self.now = reference_time or datetime.utcnow()
         self.departments = [
             'Cardiologia', 'Laboratório', 'Emergência', 'Ambulatório', 
             'Internação', 'Radiologia', 'Farmácia', 'UTI', 'Pediatria', 'Neurologia'
@@ -40,7 +93,7 @@ class HealthDataGenerator:
 
     def generate_patient(self, patient_index=None):
         """Gera dados de um paciente fictício"""
-        gender = random.choice(['M', 'F'])
+        gender = self.random.choice(['M', 'F'])
         
         if gender == 'M':
             first_name = self.fake.first_name_male()
@@ -53,13 +106,16 @@ class HealthDataGenerator:
         if patient_index is not None:
             patient_id = f"PAC{patient_index:05d}"
         else:
-            patient_id = f"PAC{random.randint(10000, 99999)}"
+            patient_id = f"PAC{self.random.randint(10000, 99999)}"
         
         return {
             'patient_id': patient_id,
             'name': f"{first_name} {last_name}",
-            'cpf': self.fake.cpf(),
-            'birth_date': self.fake.date_of_birth(minimum_age=18, maximum_age=90),
+            'cpf': cpf_from_index(patient_index) if patient_index is not None else self.fake.cpf(),
+            'birth_date': self.fake.date_between(
+                start_date=(self.now - timedelta(days=90 * 365)).date(),
+                end_date=(self.now - timedelta(days=18 * 365)).date()
+            ),
             'gender': gender,
             'phone': self.fake.phone_number(),
             'email': self.fake.email(),
@@ -68,19 +124,19 @@ class HealthDataGenerator:
 
     def generate_medical_record(self, patient_id):
         """Gera um registro médico fictício"""
-        record_date = self.fake.date_time_between(start_date='-2y', end_date='now')
-        record_type = random.choice(self.record_types)
-        department = random.choice(self.departments)
-        system_source = random.choice([sys['name'] for sys in self.health_systems])
-        doctor = random.choice(self.doctor_names)
+        record_date = self.fake.date_time_between(start_date=self.now - timedelta(days=730), end_date=self.now)
+        record_type = self.random.choice(self.record_types)
+        department = self.random.choice(self.departments)
+        system_source = self.random.choice([sys['name'] for sys in self.health_systems])
+        doctor = self.random.choice(self.doctor_names)
         
         # Gerar descrição baseada no tipo de registro
         descriptions = {
             'consultation': f"Consulta {department.lower()} - {doctor}",
-            'exam': f"Exame {random.choice(['sangue', 'urina', 'raio-x', 'tomografia', 'ressonância'])}",
-            'procedure': f"Procedimento {random.choice(['cirúrgico', 'diagnóstico', 'terapêutico'])}",
-            'prescription': f"Prescrição médica - {random.choice(['antibiótico', 'analgésico', 'anti-inflamatório'])}",
-            'diagnosis': f"Diagnóstico: {random.choice(['hipertensão', 'diabetes', 'pneumonia', 'gastrite'])}"
+            'exam': f"Exame {self.random.choice(['sangue', 'urina', 'raio-x', 'tomografia', 'ressonância'])}",
+            'procedure': f"Procedimento {self.random.choice(['cirúrgico', 'diagnóstico', 'terapêutico'])}",
+            'prescription': f"Prescrição médica - {self.random.choice(['antibiótico', 'analgésico', 'anti-inflamatório'])}",
+            'diagnosis': f"Diagnóstico: {self.random.choice(['hipertensão', 'diabetes', 'pneumonia', 'gastrite'])}"
         }
         
         return {
@@ -98,29 +154,68 @@ class HealthDataGenerator:
         status_options = ['online', 'warning', 'offline']
         weights = [0.7, 0.2, 0.1]  # 70% online, 20% warning, 10% offline
         
-        status = random.choices(status_options, weights=weights)[0]
+        status = self.random.choices(status_options, weights=weights)[0]
         
         # Gerar última sincronização baseada no status
         if status == 'online':
-            last_sync = datetime.utcnow() - timedelta(minutes=random.randint(1, 60))
+            last_sync = self.now - timedelta(minutes=self.random.randint(1, 60))
         elif status == 'warning':
-            last_sync = datetime.utcnow() - timedelta(hours=random.randint(1, 6))
+            last_sync = self.now - timedelta(hours=self.random.randint(1, 6))
         else:
-            last_sync = datetime.utcnow() - timedelta(days=random.randint(1, 3))
+            last_sync = self.now - timedelta(days=self.random.randint(1, 3))
         
         return {
             'name': system_data['name'],
             'system_type': system_data['type'],
             'status': status,
             'last_sync': last_sync,
-            'sync_frequency': random.choice([15, 30, 60, 120]),  # minutos
+            'sync_frequency': self.random.choice([15, 30, 60, 120]),  # minutos
             'description': system_data['description']
         }
 
+    def generate_sync_history(self, system, hours=72):
+        """Gera o histórico de sincronizações de um sistema até a última sincronização"""
+        logs = []
+        if not system['last_sync']:
+            return logs
+        
+        count = int(hours * 60 / system['sync_frequency'])
+        for i in range(count):
+            log_time = system['last_sync'] - timedelta(minutes=i * system['sync_frequency'])
+            # A última sincronização registrada no sistema sempre foi bem-sucedida
+            status = 'success' if i == 0 else self.random.choice(['success', 'success', 'success', 'warning', 'error'])
+            duration_ms = self.random.randint(100, 1000)
+            records_synced = 0
+            
+            if status == 'success':
+                records_synced = self.random.randint(5, 150)
+                message = f"{system['name']} - Sincronização completa"
+                details = f"{records_synced} registros sincronizados"
+            elif status == 'warning':
+                duration_ms = self.random.randint(1000, 3000)
+                records_synced = self.random.randint(5, 150)
+                message = f"{system['name']} - Latência alta detectada"
+                details = f"Tempo de resposta: {duration_ms}ms"
+            else:
+                message = f"{system['name']} - Falha na sincronização"
+                details = "Timeout na conexão"
+            
+            logs.append({
+                'timestamp': log_time,
+                'event': 'sync',
+                'status': status,
+                'message': message,
+                'details': details,
+                'records_synced': records_synced,
+                'duration_ms': duration_ms
+            })
+        
+        return logs
+
     def generate_data_quality_issue(self, patient_id=None, system_id=None):
         """Gera um problema de qualidade de dados"""
-        issue_type = random.choice(self.issue_types)
-        priority = random.choice(self.priorities)
+        issue_type = self.random.choice(self.issue_types)
+        priority = self.random.choice(self.priorities)
         
         # Gerar título e descrição baseados no tipo
         issue_templates = {
@@ -187,17 +282,17 @@ class HealthDataGenerator:
         }
         
         template = issue_templates[issue_type]
-        title = random.choice(template['titles'])
-        description = random.choice(template['descriptions'])
+        title = self.random.choice(template['titles'])
+        description = self.random.choice(template['descriptions'])
         
         # Determinar status (90% aberto, 10% resolvido)
-        status = random.choices(['open', 'resolved'], weights=[0.9, 0.1])[0]
+        status = self.random.choices(['open', 'resolved'], weights=[0.9, 0.1])[0]
         
-        detected_at = self.fake.date_time_between(start_date='-30d', end_date='now')
+        detected_at = self.fake.date_time_between(start_date=self.now - timedelta(days=30), end_date=self.now)
         
         issue_data = {
             'patient_id': patient_id,
-            'system_id': system_id or random.randint(1, len(self.health_systems)),
+            'system_id': system_id or self.random.randint(1, len(self.health_systems)),
             'issue_type': issue_type,
             'priority': priority,
             'title': title,
@@ -208,7 +303,7 @@ class HealthDataGenerator:
         
         # Se resolvido, adicionar dados de resolução
         if status == 'resolved':
-            resolution_time = random.randint(30, 480)  # 30 min a 8 horas
+            resolution_time = self.random.randint(30, 480)  # 30 min a 8 horas
             issue_data['resolved_at'] = detected_at + timedelta(minutes=resolution_time)
             issue_data['resolution_time'] = resolution_time
         
@@ -226,28 +321,70 @@ class HealthDataGenerator:
             'first_name': first_name,
             'last_name': last_name,
             'role': role,
-            'department': random.choice(self.departments),
+            'department': self.random.choice(self.departments),
             'password': 'senha123'  # Senha padrão para o MVP
         }
 
     def generate_dashboard_metric(self, metric_name, department=None):
         """Gera uma métrica para o dashboard"""
         metric_values = {
-            'completeness_rate': random.uniform(70, 95),
-            'data_quality_score': random.uniform(75, 90),
-            'resolution_time': random.uniform(1, 6),  # horas
-            'system_availability': random.uniform(95, 99.9),
-            'issues_count': random.randint(5, 50)
+            'completeness_rate': self.random.uniform(70, 95),
+            'data_quality_score': self.random.uniform(75, 90),
+            'resolution_time': self.random.uniform(1, 6),  # horas
+            'system_availability': self.random.uniform(95, 99.9),
+            'issues_count': self.random.randint(5, 50)
         }
         
         return {
             'metric_name': metric_name,
-            'metric_value': metric_values.get(metric_name, random.uniform(0, 100)),
+            'metric_value': metric_values.get(metric_name, self.random.uniform(0, 100)),
             'metric_unit': '%' if 'rate' in metric_name or 'availability' in metric_name else 'count',
             'department': department,
-            'calculated_at': datetime.utcnow()
+            'calculated_at': self.now
         }
 
+    def generate_patient_chunk(self, start, stop, num_records_per_patient=5):
+        """Gera os pacientes de índice [start, stop) com seus registros e problemas
+
+        Registros e problemas referenciam o paciente pelo índice (1..N), não pelo ID do banco.
+        """
+        chunk = {
+            'start': start,
+            'stop': stop,
+            'patients': [],
+            'medical_records': [],
+            'data_quality_issues': []
+        }
+        
+        for patient_index in range(start, stop):
+            chunk['patients'].append(self.generate_patient(patient_index=patient_index))
+            
+            # Gerar registros médicos para este paciente
+            num_records = self.random.randint(1, num_records_per_patient)
+            for _ in range(num_records):
+                chunk['medical_records'].append(self.generate_medical_record(patient_index))
+            
+            # Chance de 30% de ter problemas de qualidade
+            if self.random.random() < 0.3:
+                num_issues = self.random.randint(1, 3)
+                for _ in range(num_issues):
+                    chunk['data_quality_issues'].append(self.generate_data_quality_issue(
+                        patient_id=patient_index,
+                        system_id=self.random.randint(1, len(self.health_systems))
+                    ))
+        
+        return chunk
+
+    def generate_system_issues(self, count=50):
+        """Gera problemas de qualidade não associados a pacientes"""
+        return [
+            self.generate_data_quality_issue(
+                patient_id=None,
+                system_id=self.random.randint(1, len(self.health_systems))
+            )
+            for _ in range(count)
+        ]
+
     def generate_complete_dataset(self, num_patients=500, num_records_per_patient=5):
         """Gera um dataset completo para o MVP"""
         print("Gerando dataset completo...")
@@ -280,38 +417,18 @@ class HealthDataGenerator:
         
         # Gerar pacientes e registros médicos
         print(f"Gerando {num_patients} pacientes...")
-        for i in range(num_patients):
-            if i % 100 == 0:
-                print(f"Progresso: {i}/{num_patients} pacientes")
-            
-            patient = self.generate_patient(patient_index=i+1)  # Usar índice único
-            dataset['patients'].append(patient)
-            patient_id = i + 1  # ID será auto-incrementado no banco
-            
-            # Gerar registros médicos para este paciente
-            num_records = random.randint(1, num_records_per_patient)
-            for _ in range(num_records):
-                record = self.generate_medical_record(patient_id)
-                dataset['medical_records'].append(record)
-            
-            # Chance de 30% de ter problemas de qualidade
-            if random.random() < 0.3:
-                num_issues = random.randint(1, 3)
-                for _ in range(num_issues):
-                    issue = self.generate_data_quality_issue(
-                        patient_id=patient_id,
-                        system_id=random.randint(1, len(self.health_systems))
-                    )
-                    dataset['data_quality_issues'].append(issue)
+        for start in range(1, num_patients + 1, 100):
+            print(f"Progresso: {start - 1}/{num_patients} pacientes")
+            chunk = self.generate_patient_chunk(
+                start, min(start + 100, num_patients + 1), num_records_per_patient
+            )
+            dataset['patients'].extend(chunk['patients'])
+            dataset['medical_records'].extend(chunk['medical_records'])
+            dataset['data_quality_issues'].extend(chunk['data_quality_issues'])
         
         # Gerar problemas de qualidade não relacionados a pacientes específicos
         print("Gerando problemas de qualidade do sistema...")
-        for _ in range(50):
-            issue = self.generate_data_quality_issue(
-                patient_id=None,
-                system_id=random.randint(1, len(self.health_systems))
-            )
-            dataset['data_quality_issues'].append(issue)
+        dataset['data_quality_issues'].extend(self.generate_system_issues())
         
         # Gerar métricas do dashboard
         print("Gerando métricas do dashboard...")
@@ -325,13 +442,126 @@ class HealthDataGenerator:
         print("Dataset completo gerado!")
         return dataset
 
+def _generate_shard(args):
+    """Gera um shard em um processo do pool (função de módulo para ser serializável)"""
+    seed, shard, start, stop, num_records_per_patient, reference_time = args
+    generator = HealthDataGenerator(seed=shard_seed(seed, shard), reference_time=reference_time)
+    chunk = generator.generate_patient_chunk(start, stop, num_records_per_patient)
+    chunk['shard'] = shard
+    return chunk
+
+
+def iter_dataset_chunks(num_patients, num_records_per_patient=5, seed=0, reference_time=None,
+                        shard_size=DEFAULT_SHARD_SIZE, workers=None):
+    """Gera os pacientes em shards e entrega os lotes em ordem de índice
+
+    O conteúdo de cada shard depende apenas de (seed, shard, reference_time), então o resultado
+    é o mesmo com qualquer número de workers. Com workers=1 tudo roda no processo atual.
+    """
+    reference_time = reference_time or datetime.utcnow()
+    tasks = [
+        (seed, shard, start, min(start + shard_size, num_patients + 1), num_records_per_patient, reference_time)
+        for shard, start in enumerate(range(1, num_patients + 1, shard_size))
+    ]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(tasks) == 1:
+        for task in tasks:
+            yield _generate_shard(task)
+        return
+
+    # Janela limitada de shards em andamento para manter a memória constante
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = [executor.submit(_generate_shard, task) for task in tasks[:window]]
+        next_task = len(pending)
+        while pending:
+            chunk = pending.pop(0).result()
+            if next_task < len(tasks):
+                pending.append(executor.submit(_generate_shard, tasks[next_task]))
+                next_task += 1
+            yield chunk
+
+
+def _file_rows(table_name, chunk):
+    # Nos arquivos, o paciente leva o próprio índice para que registros e problemas possam referenciá-lo
+    if table_name == 'patients':
+        return (
+            dict(patient, patient_index=chunk['start'] + offset)
+            for offset, patient in enumerate(chunk['patients'])
+        )
+    return chunk[table_name]
+
+
+def write_chunks_to_files(chunks, output_dir, file_format='ndjson'):
+    """Grava os lotes em um arquivo por tabela (NDJSON ou CSV) e retorna a contagem de linhas"""
+    os.makedirs(output_dir, exist_ok=True)
+    extension = 'ndjson' if file_format == 'ndjson' else 'csv'
+    files = {
+        table_name: open(os.path.join(output_dir, f"{table_name}.{extension}"), 'w', encoding='utf-8', newline='')
+        for table_name in PATIENT_TABLES
+    }
+    writers = {}
+    if file_format != 'ndjson':
+        for table_name, handle in files.items():
+            writers[table_name] = csv.DictWriter(handle, fieldnames=CSV_COLUMNS[table_name])
+            writers[table_name].writeheader()
+    counts = dict.fromkeys(PATIENT_TABLES, 0)
+
+    try:
+        for chunk in chunks:
+            for table_name in PATIENT_TABLES:
+                rows = _file_rows(table_name, chunk)
+                if file_format == 'ndjson':
+                    files[table_name].writelines(
+                        json.dumps(row, default=str, ensure_ascii=False) + '\n' for row in rows
+                    )
+                    counts[table_name] += len(chunk[table_name])
+                    continue
+                writers[table_name].writerows(rows)
+                counts[table_name] += len(chunk[table_name])
+    finally:
+        for handle in files.values():
+            handle.close()
+
+    return counts
+
+
 if __name__ == "__main__":
-    generator = HealthDataGenerator()
-    dataset = generator.generate_complete_dataset()
-    
-    # Salvar em arquivo JSON para inspeção
-    with open('/tmp/sample_dataset.json', 'w', encoding='utf-8') as f:
-        json.dump(dataset, f, indent=2, default=str, ensure_ascii=False)
-    
-    print("Dataset salvo em /tmp/sample_dataset.json")
+    parser = argparse.ArgumentParser(description='Gerador de dados fictícios do HealthGraph Radar')
+    parser.add_argument('--patients', type=int, default=500)
+    parser.add_argument('--records-per-patient', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--reference-time', default=None, help='Data de referência ISO (ex.: 2024-01-01T00:00:00)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--shard-size', type=int, default=DEFAULT_SHARD_SIZE)
+    parser.add_argument('--output', default=None, help='Diretório de saída para geração em shards')
+    parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    args = parser.parse_args()
+
+    reference_time = datetime.fromisoformat(args.reference_time) if args.reference_time else None
 
+    if args.output is None:
+        generator = HealthDataGenerator(seed=args.seed, reference_time=reference_time)
+        dataset = generator.generate_complete_dataset(args.patients, args.records_per_patient)
+        
+        # Salvar em arquivo JSON para inspeção
+        with open('/tmp/sample_dataset.json', 'w', encoding='utf-8') as f:
+            json.dump(dataset, f, indent=2, default=str, ensure_ascii=False)
+        
+        print("Dataset salvo em /tmp/sample_dataset.json")
+    else:
+        started = datetime.utcnow()
+        chunks = iter_dataset_chunks(
+            args.patients, args.records_per_patient,
+            seed=args.seed or 0,
+            reference_time=reference_time,
+            shard_size=args.shard_size,
+            workers=args.workers
+        )
+        counts = write_chunks_to_files(chunks, args.output, args.format)
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        
+        for table_name, count in counts.items():
+            print(f"- {table_name}: {count} linhas")
+        print(f"Dataset salvo em {args.output} ({elapsed:.1f}s)")
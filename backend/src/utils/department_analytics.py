@@ -0,0 +1,333 @@
+"""
+Análise comparativa por departamento
+
+Registros, completude, problemas abertos e tempo médio de resolução por departamento são
+calculados em uma única consulta agrupada: os problemas chegam aos departamentos pelos
+pacientes que têm registros em cada um. O resultado é gravado em DashboardMetrics (valor atual)
+e em department_snapshots (série diária com totais acumulados) e mantido em cache; a rota lê
+apenas os valores gravados e só calcula na própria requisição quando a tabela de registros
+cabe no orçamento de custo (DEPARTMENT_SCAN_BUDGET).
+
+Uso: python src/utils/department_analytics.py [caminho/para/healthgraph.db]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert
+from src.database import db
+from src.models.patient import MedicalRecord, DataQualityIssue, DashboardMetrics
+from src.models.quality import DepartmentSnapshot
+from src.utils.cache import TTLCache
+from src.utils.quality_scoring import RECORD_FIELDS, filled_expression
+
+DEFAULT_DEPARTMENT_TTL = 300  # segundos
+
+# Registros que a rota aceita agregar na própria requisição quando ainda não há valores gravados
+DEFAULT_SCAN_BUDGET = 200000
+
+# Idade a partir da qual os valores gravados são servidos e recalculados em segundo plano
+DEPARTMENT_MAX_AGE = timedelta(hours=1)
+
+# Métrica gravada em DashboardMetrics -> (campo do resultado, unidade)
+DEPARTMENT_METRICS = {
+    'department_total_records': ('total_records', 'count'),
+    'department_completeness': ('completeness_percentage', '%'),
+    'department_open_issues': ('open_issues', 'count'),
+    'department_avg_resolution_time': ('avg_resolution_time', 'hours')
+}
+
+PUBLIC_FIELDS = ('name', 'total_records', 'completeness_percentage', 'open_issues', 'avg_resolution_time')
+
+# Coluna de department_snapshots -> campo do resultado
+SNAPSHOT_COLUMNS = {
+    'department': 'name',
+    'total_records': 'total_records',
+    'completeness_rate': 'completeness_percentage',
+    'open_issues': 'open_issues',
+    'detected_total': 'detected_total',
+    'resolved_total': 'resolved_total',
+    'resolution_time_sum': 'resolution_time_sum',
+    'resolution_count': 'resolution_count'
+}
+
+_CACHE_KEY = 'departments'
+_department_cache = TTLCache(ttl=DEFAULT_DEPARTMENT_TTL, maxsize=1)
+_refresh_lock = threading.Lock()
+_background_refresh = threading.Event()
+
+
+def quality_label(completeness):
+    """Classificação exibida na tela a partir da completude"""
+    if completeness >= 90:
+        return 'Excelente'
+    if completeness >= 80:
+        return 'Bom'
+    return 'Precisa Melhorar'
+
+
+def compute_department_metrics():
+    """Calcula as métricas de todos os departamentos em uma única consulta agrupada"""
+    department = MedicalRecord.department.isnot(None)
+    filled = sum(filled_expression(getattr(MedicalRecord, field)) for field in RECORD_FIELDS)
+
+    records = select(
+        MedicalRecord.department.label('department'),
+        func.count(MedicalRecord.id).label('total_records'),
+        func.sum(filled).label('filled_cells')
+    ).where(department).group_by(MedicalRecord.department).cte('department_records')
+
+    # Pacientes atendidos em cada departamento (coberto por ix_medical_records_department_patient)
+    patients = select(
+        MedicalRecord.department.label('department'),
+        MedicalRecord.patient_id.label('patient_id')
+    ).where(department).distinct().cte('department_patients')
+
+    resolved = DataQualityIssue.status == 'resolved'
+    issues = select(
+        DataQualityIssue.patient_id.label('patient_id'),
+        func.count(DataQualityIssue.id).label('total_issues'),
+        func.sum(case((resolved, 1), else_=0)).label('resolved_issues'),
+        func.sum(case((DataQualityIssue.status == 'open', 1), else_=0)).label('open_issues'),
+        func.sum(case((resolved, DataQualityIssue.resolution_time), else_=None)).label('resolution_sum'),
+        func.count(case((resolved, DataQualityIssue.resolution_time), else_=None)).label('resolution_count')
+    ).where(DataQualityIssue.patient_id.isnot(None)).group_by(DataQualityIssue.patient_id).cte('patient_issues')
+
+    rows = db.session.execute(
+        select(
+            records.c.department,
+            records.c.total_records,
+            records.c.filled_cells,
+            func.coalesce(func.sum(issues.c.open_issues), 0),
+            func.coalesce(func.sum(issues.c.total_issues), 0),
+            func.coalesce(func.sum(issues.c.resolved_issues), 0),
+            func.coalesce(func.sum(issues.c.resolution_sum), 0),
+            func.coalesce(func.sum(issues.c.resolution_count), 0)
+        ).select_from(
+            records.outerjoin(patients, patients.c.department == records.c.department)
+            .outerjoin(issues, issues.c.patient_id == patients.c.patient_id)
+        ).group_by(
+            records.c.department, records.c.total_records, records.c.filled_cells
+        ).order_by(records.c.department)
+    ).all()
+
+    departments = []
+    for (name, total_records, filled_cells, open_issues, total_issues, resolved_issues,
+         resolution_sum, resolution_count) in rows:
+        completeness = round((filled_cells or 0) * 100.0 / (total_records * len(RECORD_FIELDS)), 1)
+        departments.append({
+            'name': name,
+            'total_records': total_records,
+            'completeness_percentage': completeness,
+            'open_issues': int(open_issues),
+            # Tempo de resolução é gravado em minutos; a tela exibe horas
+            'avg_resolution_time': (
+                round(resolution_sum / resolution_count / 60, 1) if resolution_count else None
+            ),
+            # Totais acumulados gravados na série diária (usados pelos KPIs por período)
+            'detected_total': int(total_issues),
+            'resolved_total': int(resolved_issues),
+            'resolution_time_sum': int(resolution_sum),
+            'resolution_count': int(resolution_count)
+        })
+    return departments
+
+
+def store_department_metrics(departments, now=None):
+    """Substitui os valores por departamento gravados em DashboardMetrics"""
+    now = now or datetime.utcnow()
+
+    # Só o cálculo mais recente é mantido, para que a leitura não percorra o histórico
+    DashboardMetrics.query.filter(
+        DashboardMetrics.metric_name.in_(DEPARTMENT_METRICS)
+    ).delete(synchronize_session=False)
+
+    metrics = []
+    for department in departments:
+        for metric_name, (field, unit) in DEPARTMENT_METRICS.items():
+            if department[field] is None:
+                continue
+            metrics.append(DashboardMetrics(
+                metric_name=metric_name, metric_value=department[field], metric_unit=unit,
+                department=department['name'], calculated_at=now
+            ))
+
+    db.session.add_all(metrics)
+    db.session.commit()
+    return len(metrics)
+
+
+def record_department_snapshots(departments, now=None):
+    """Grava (ou atualiza) a linha do dia de cada departamento na série diária"""
+    now = now or datetime.utcnow()
+    rows = [
+        {'day': now.date(), 'calculated_at': now,
+         **{column: department[field] for column, field in SNAPSHOT_COLUMNS.items()}}
+        for department in departments
+    ]
+    if not rows:
+        return 0
+
+    statement = insert(DepartmentSnapshot)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[DepartmentSnapshot.department, DepartmentSnapshot.day],
+        set_={name: statement.excluded[name] for name in list(SNAPSHOT_COLUMNS)[1:] + ['calculated_at']}
+    ), rows)
+    return len(rows)
+
+
+def refresh_department_metrics():
+    """Recalcula, grava e coloca em cache as métricas por departamento"""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    departments = compute_department_metrics()
+    record_department_snapshots(departments, now)
+    store_department_metrics(departments, now)
+
+    result = _with_labels(departments, now, 'fresh')
+    _department_cache.set(_CACHE_KEY, result, _cache_ttl())
+    return dict(result, elapsed_seconds=round(time.perf_counter() - started, 4))
+
+
+def load_department_metrics():
+    """Lê os últimos valores gravados (poucas linhas por departamento); None se não houver"""
+    rows = db.session.query(
+        DashboardMetrics.department, DashboardMetrics.metric_name,
+        DashboardMetrics.metric_value, DashboardMetrics.calculated_at
+    ).filter(
+        DashboardMetrics.metric_name.in_(DEPARTMENT_METRICS),
+        DashboardMetrics.department.isnot(None)
+    ).all()
+    if not rows:
+        return None
+
+    departments = {}
+    for name, metric_name, value, _ in rows:
+        department = departments.setdefault(name, {
+            'name': name, 'total_records': 0, 'completeness_percentage': 0.0,
+            'open_issues': 0, 'avg_resolution_time': None
+        })
+        field = DEPARTMENT_METRICS[metric_name][0]
+        department[field] = int(value) if field in ('total_records', 'open_issues') else value
+
+    calculated_at = min(row.calculated_at for row in rows)
+    return [departments[name] for name in sorted(departments)], calculated_at
+
+
+def estimated_record_count():
+    """Estimativa do tamanho de medical_records pelos extremos da chave primária (sem varredura)"""
+    low, high = db.session.query(func.min(MedicalRecord.id), func.max(MedicalRecord.id)).one()
+    return high - low + 1 if high is not None else 0
+
+
+def _with_labels(departments, calculated_at, status):
+    return {
+        'departments': [
+            {
+                **{field: department[field] for field in PUBLIC_FIELDS},
+                'quality_score': quality_label(department['completeness_percentage']),
+                'last_update': calculated_at.isoformat()
+            }
+            for department in departments
+        ],
+        'calculated_at': calculated_at.isoformat(),
+        'status': status
+    }
+
+
+def _cache_ttl():
+    return current_app.config.get('DEPARTMENT_METRICS_TTL', DEFAULT_DEPARTMENT_TTL)
+
+
+def _refresh_in_background():
+    """Dispara o recálculo em uma thread (no máximo um por vez)
+
+    Deve ser chamada com _refresh_lock adquirido: a verificação e a marcação do recálculo em
+    andamento não podem ser intercaladas entre duas requisições.
+    """
+    if _background_refresh.is_set():
+        return
+    _background_refresh.set()
+    app = current_app._get_current_object()
+
+    def _run():
+        try:
+            with app.app_context():
+                refresh_department_metrics()
+        finally:
+            _background_refresh.clear()
+
+    threading.Thread(target=_run, name='department-metrics-refresh', daemon=True).start()
+
+
+def get_department_metrics():
+    """Métricas por departamento para a rota, sem varrer medical_records acima do orçamento
+
+    status: fresh (calculado agora ou dentro de DEPARTMENT_MAX_AGE), stale (valores gravados
+    antigos, recálculo em segundo plano) ou pending (nada gravado e tabela acima do orçamento).
+    """
+    cached = _department_cache.get(_CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    with _refresh_lock:
+        cached = _department_cache.get(_CACHE_KEY)
+        if cached is not None:
+            return cached
+
+        stored = load_department_metrics()
+        if stored is not None:
+            departments, calculated_at = stored
+            status = 'fresh'
+            if datetime.utcnow() - calculated_at > DEPARTMENT_MAX_AGE:
+                status = 'stale'
+                _refresh_in_background()
+            result = _with_labels(departments, calculated_at, status)
+            _department_cache.set(_CACHE_KEY, result, _cache_ttl())
+            return result
+
+        budget = current_app.config.get('DEPARTMENT_SCAN_BUDGET', DEFAULT_SCAN_BUDGET)
+        if estimated_record_count() <= budget:
+            result = refresh_department_metrics()
+            result.pop('elapsed_seconds')
+            return result
+
+        _refresh_in_background()
+    return {'departments': [], 'calculated_at': None, 'status': 'pending'}
+
+
+def invalidate_department_metrics():
+    """Descarta o cache (os valores gravados continuam valendo até o próximo recálculo)"""
+    _department_cache.invalidate(_CACHE_KEY)
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from src.models.auth import User, UserSession
+    from src.models.patient import Patient, HealthSystem
+    from src.models.quality import PatientBlockingKey, DuplicateCandidate
+    from src.utils.migrations import apply_migrations
+
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else default_path)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        result = refresh_department_metrics()
+
+    for department in result['departments']:
+        print(f"- {department['name']}: {department['total_records']} registros, "
+              f"{department['completeness_percentage']}% completos, {department['open_issues']} abertos")
+    print(f"✓ {len(result['departments'])} departamentos em {result['elapsed_seconds']}s")
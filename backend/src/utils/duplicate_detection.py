@@ -0,0 +1,524 @@
+"""
+Motor de detecção de pacientes duplicados com chaves de blocagem
+
+Em vez de comparar todos os pares (O(n²)), cada paciente recebe chaves de blocagem
+(CPF normalizado, código fonético do nome em português e data de nascimento + sexo)
+persistidas em patient_blocking_keys. Apenas pacientes que compartilham um bloco são
+comparados. Execuções incrementais reprocessam somente pacientes com updated_at a partir da
+última indexação (com uma margem para gravações confirmadas depois dela com horário anterior);
+pacientes já indexados com o mesmo updated_at são ignorados.
+
+Uso: python src/utils/duplicate_detection.py [caminho/para/healthgraph.db] [--full]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import re
+import time
+import unicodedata
+from collections import namedtuple
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from functools import lru_cache
+from itertools import combinations
+from sqlalchemy import func, select, tuple_
+from src.database import db
+from src.models.patient import Patient, HealthSystem, DataQualityIssue
+from src.models.quality import PatientBlockingKey, DuplicateCandidate
+
+# Ordem de precedência: um par já comparado em um bloco anterior não é repetido
+KEY_TYPES = ('cpf', 'phonetic', 'birth_gender')
+
+# Margem da execução incremental: updated_at vem do relógio de quem grava, e uma transação
+# confirmada depois da última indexação pode trazer horários anteriores a ela
+INCREMENTAL_LOOKBACK = timedelta(minutes=15)
+
+_NON_DIGITS = re.compile(r'\D')
+_NON_LETTERS = re.compile(r'[^A-Z ]')
+_VOWELS = re.compile(r'[AEIOU]')
+_REPEATED = re.compile(r'(.)\1+')
+
+_NAME_PARTICLES = {'DA', 'DE', 'DI', 'DO', 'DU', 'DAS', 'DOS', 'E'}
+
+# Regras fonéticas simplificadas para nomes em português (inspiradas no BuscaBR)
+_PHONETIC_RULES = [
+    (re.compile(r'PH'), 'F'),
+    (re.compile(r'TH'), 'T'),
+    (re.compile(r'[CS]H'), 'X'),
+    (re.compile(r'LH'), 'L'),
+    (re.compile(r'NH'), 'N'),
+    (re.compile(r'H'), ''),
+    (re.compile(r'SC(?=[EI])'), 'S'),
+    (re.compile(r'C(?=[EI])'), 'S'),
+    (re.compile(r'QU(?=[EI])'), 'K'),
+    (re.compile(r'[CQ]'), 'K'),
+    (re.compile(r'G(?=[EI])'), 'J'),
+    (re.compile(r'GU(?=[EI])'), 'G'),
+    (re.compile(r'Y'), 'I'),
+    (re.compile(r'W'), 'V'),
+    (re.compile(r'Z'), 'S'),
+    (re.compile(r'M$'), 'N'),
+]
+
+PatientProfile = namedtuple('PatientProfile', [
+    'id', 'patient_id', 'name', 'name_normalized', 'cpf_digits', 'phonetic',
+    'birth_gender', 'phone_digits', 'email', 'updated_at'
+])
+
+
+def strip_accents(text):
+    """Remove acentos e diacríticos"""
+    if text.isascii():
+        return text
+    text = text.replace('ç', 's').replace('Ç', 'S')
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
+
+
+def normalize_name(name):
+    """Nome em maiúsculas, sem acentos, pontuação ou partículas (da, de, dos...)"""
+    cleaned = _NON_LETTERS.sub(' ', strip_accents(name or '').upper())
+    return ' '.join(token for token in cleaned.split() if token not in _NAME_PARTICLES)
+
+
+def normalize_cpf(cpf):
+    """Somente os 11 dígitos do CPF; None para valores inválidos ou de preenchimento"""
+    digits = _NON_DIGITS.sub('', cpf or '')
+    if len(digits) != 11 or digits == digits[0] * 11:
+        return None
+    return digits
+
+
+@lru_cache(maxsize=65536)
+def phonetic_token(token):
+    """Código fonético de uma palavra: regras de som, vogais removidas e letras repetidas colapsadas"""
+    if not token:
+        return ''
+    for pattern, replacement in _PHONETIC_RULES:
+        token = pattern.sub(replacement, token)
+    if not token:
+        return ''
+
+    code = token[0] + _VOWELS.sub('', token[1:])
+    return _REPEATED.sub(r'\1', code)
+
+
+def phonetic_key(name, normalized=None):
+    """Chave fonética do nome: primeiro e último nome codificados"""
+    tokens = (normalized if normalized is not None else normalize_name(name)).split()
+    if not tokens:
+        return None
+    if len(tokens) == 1:
+        return phonetic_token(tokens[0])
+    return f"{phonetic_token(tokens[0])}-{phonetic_token(tokens[-1])}"
+
+
+def build_profile(row):
+    """Projeção normalizada de um paciente usada para blocagem e pontuação"""
+    birth_gender = None
+    if row.birth_date and row.gender:
+        birth_gender = f"{row.birth_date.isoformat()}|{row.gender.upper()}"
+
+    name_normalized = normalize_name(row.name)
+
+    return PatientProfile(
+        id=row.id,
+        patient_id=row.patient_id,
+        name=row.name,
+        name_normalized=name_normalized,
+        cpf_digits=normalize_cpf(row.cpf),
+        phonetic=phonetic_key(row.name, name_normalized),
+        birth_gender=birth_gender,
+        phone_digits=_NON_DIGITS.sub('', row.phone or '')[-8:] or None,
+        email=(row.email or '').strip().lower() or None,
+        updated_at=row.updated_at
+    )
+
+
+def blocking_keys(profile):
+    """Pares (key_type, key_value) de um paciente"""
+    keys = []
+    if profile.cpf_digits:
+        keys.append(('cpf', profile.cpf_digits))
+    if profile.phonetic:
+        keys.append(('phonetic', profile.phonetic))
+    if profile.birth_gender:
+        keys.append(('birth_gender', profile.birth_gender))
+    return keys
+
+
+def score_pair(a, b, threshold=0.0):
+    """Similaridade entre 0 e 1 de dois pacientes (0 se não puder atingir o limiar)"""
+    if a.cpf_digits and b.cpf_digits:
+        if a.cpf_digits == b.cpf_digits:
+            cpf_score = 1.0
+        else:
+            # Até dois dígitos divergentes: provável erro de digitação
+            differences = sum(1 for x, y in zip(a.cpf_digits, b.cpf_digits) if x != y)
+            cpf_score = 0.5 if differences <= 2 else 0.0
+    else:
+        cpf_score = 0.0
+
+    birth_a, _, gender_a = (a.birth_gender or '').partition('|')
+    birth_b, _, gender_b = (b.birth_gender or '').partition('|')
+    birth_score = 1.0 if birth_a and birth_a == birth_b else 0.0
+    gender_score = 1.0 if gender_a and gender_a == gender_b else 0.0
+
+    contact_score = 0.0
+    if (a.phone_digits and a.phone_digits == b.phone_digits) or (a.email and a.email == b.email):
+        contact_score = 1.0
+
+    partial = 0.4 * cpf_score + 0.2 * birth_score + 0.05 * gender_score + 0.05 * contact_score
+
+    # A comparação de nomes é a etapa cara: só é feita se o par ainda pode atingir o limiar
+    if partial + 0.3 < threshold:
+        return 0.0
+
+    if a.name_normalized == b.name_normalized:
+        name_score = 1.0
+    else:
+        name_score = SequenceMatcher(None, a.name_normalized, b.name_normalized).ratio()
+
+    return round(
+        0.4 * cpf_score + 0.3 * name_score + 0.2 * birth_score +
+        0.05 * gender_score + 0.05 * contact_score,
+        4
+    )
+
+
+def _shared_key_types(a, b):
+    return [key_type for key_type, (value_a, value_b) in zip(KEY_TYPES, (
+        (a.cpf_digits, b.cpf_digits),
+        (a.phonetic, b.phonetic),
+        (a.birth_gender, b.birth_gender)
+    )) if value_a and value_a == value_b]
+
+
+class DuplicateDetector:
+    """Detecta pares de pacientes duplicados e emite DataQualityIssue(issue_type='duplicate')"""
+
+    def __init__(self, threshold=0.75, max_block_size=50, batch_size=5000, system_id=None):
+        self.threshold = threshold
+        self.max_block_size = max_block_size
+        self.batch_size = batch_size
+        self.system_id = system_id
+        self._oversized = set()
+        self.stats = {}
+
+    def run(self, full=False):
+        """Executa a detecção; incremental por padrão (apenas pacientes novos ou alterados)"""
+        started = time.perf_counter()
+        self._oversized = set()
+        self.stats = {
+            'patients_indexed': 0,
+            'blocks_processed': 0,
+            'oversized_blocks': 0,
+            'pairs_compared': 0,
+            'duplicates_found': 0,
+            'issues_created': 0
+        }
+
+        since = None
+        if not full:
+            since = db.session.query(func.max(PatientBlockingKey.patient_updated_at)).scalar()
+            # Sem índice prévio, a execução incremental equivale a uma completa
+            full = since is None
+            if since is not None:
+                since -= INCREMENTAL_LOOKBACK
+        self.stats['mode'] = 'full' if full else 'incremental'
+        if full:
+            db.session.query(PatientBlockingKey).delete(synchronize_session=False)
+            db.session.commit()
+
+        changed_ids = self._index_patients(since)
+        self.stats['patients_indexed'] = len(changed_ids)
+
+        if full:
+            candidates = self._scan_all_blocks()
+        else:
+            candidates = self._scan_changed_blocks(changed_ids)
+
+        self.stats['duplicates_found'] = len(candidates)
+        self.stats['issues_created'] = self._emit_issues(candidates)
+        self.stats['elapsed_seconds'] = round(time.perf_counter() - started, 2)
+        return self.stats
+
+    def _index_patients(self, since):
+        """Recalcula as chaves de blocagem dos pacientes alterados desde o último índice"""
+        columns = (Patient.id, Patient.patient_id, Patient.name, Patient.cpf, Patient.birth_date,
+                   Patient.gender, Patient.phone, Patient.email, Patient.updated_at)
+        changed_ids = []
+        last_id = 0
+
+        while True:
+            query = select(*columns).where(Patient.id > last_id)
+            if since is not None:
+                query = query.where(Patient.updated_at >= since)
+            rows = db.session.execute(query.order_by(Patient.id).limit(self.batch_size)).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            if since is not None:
+                # Dentro da margem: só quem mudou desde a própria indexação
+                indexed = dict(db.session.execute(
+                    select(PatientBlockingKey.patient_id, func.max(PatientBlockingKey.patient_updated_at)).where(
+                        PatientBlockingKey.patient_id.in_([row.id for row in rows])
+                    ).group_by(PatientBlockingKey.patient_id)
+                ).all())
+                rows = [row for row in rows if indexed.get(row.id) != row.updated_at]
+                if not rows:
+                    continue
+
+            batch_ids = [row.id for row in rows]
+            if since is not None:
+                db.session.execute(
+                    PatientBlockingKey.__table__.delete().where(
+                        PatientBlockingKey.patient_id.in_(batch_ids)
+                    )
+                )
+
+            key_rows = []
+            for row in rows:
+                profile = build_profile(row)
+                for key_type, key_value in blocking_keys(profile):
+                    key_rows.append({
+                        'patient_id': profile.id,
+                        'key_type': key_type,
+                        'key_value': key_value,
+                        'patient_updated_at': profile.updated_at
+                    })
+
+            if key_rows:
+                db.session.execute(PatientBlockingKey.__table__.insert(), key_rows)
+            db.session.commit()
+
+            changed_ids.extend(batch_ids)
+
+        return changed_ids
+
+    def _scan_all_blocks(self):
+        """Percorre todos os blocos com dois ou mais pacientes"""
+        candidates = {}
+
+        for key_type in KEY_TYPES:
+            members = func.group_concat(PatientBlockingKey.patient_id)
+            block_size = func.count(PatientBlockingKey.id)
+
+            oversized = db.session.execute(
+                select(PatientBlockingKey.key_value).where(
+                    PatientBlockingKey.key_type == key_type
+                ).group_by(PatientBlockingKey.key_value).having(block_size > self.max_block_size)
+            ).scalars().all()
+            self._oversized.update((key_type, value) for value in oversized)
+            self.stats['oversized_blocks'] += len(oversized)
+
+            result = db.session.execute(
+                select(PatientBlockingKey.key_value, members).where(
+                    PatientBlockingKey.key_type == key_type
+                ).group_by(PatientBlockingKey.key_value).having(
+                    block_size.between(2, self.max_block_size)
+                )
+            )
+
+            pending = []
+            pending_size = 0
+            for key_value, member_list in result:
+                ids = sorted({int(member) for member in member_list.split(',')})
+                pending.append(ids)
+                pending_size += len(ids)
+                if pending_size >= self.batch_size:
+                    self._compare_blocks(key_type, pending, candidates)
+                    pending, pending_size = [], 0
+            if pending:
+                self._compare_blocks(key_type, pending, candidates)
+
+        return candidates
+
+    def _scan_changed_blocks(self, changed_ids):
+        """Compara apenas pares que envolvem pacientes novos ou alterados"""
+        candidates = {}
+        focus = set(changed_ids)
+
+        for start in range(0, len(changed_ids), self.batch_size):
+            batch_ids = changed_ids[start:start + self.batch_size]
+            keys = db.session.execute(
+                select(PatientBlockingKey.key_type, PatientBlockingKey.key_value).where(
+                    PatientBlockingKey.patient_id.in_(batch_ids)
+                ).distinct()
+            ).all()
+
+            for key_type in KEY_TYPES:
+                values = [value for kind, value in keys if kind == key_type]
+                if not values:
+                    continue
+
+                blocks = {}
+                for chunk_start in range(0, len(values), 500):
+                    chunk = values[chunk_start:chunk_start + 500]
+                    rows = db.session.execute(
+                        select(PatientBlockingKey.key_value, PatientBlockingKey.patient_id).where(
+                            PatientBlockingKey.key_type == key_type,
+                            PatientBlockingKey.key_value.in_(chunk)
+                        )
+                    ).all()
+                    for key_value, patient_id in rows:
+                        blocks.setdefault(key_value, set()).add(patient_id)
+
+                eligible = []
+                for key_value, ids in blocks.items():
+                    if len(ids) > self.max_block_size:
+                        self._oversized.add((key_type, key_value))
+                        self.stats['oversized_blocks'] += 1
+                    elif len(ids) > 1:
+                        eligible.append(sorted(ids))
+
+                self._compare_blocks(key_type, eligible, candidates, focus)
+
+        return candidates
+
+    def _compare_blocks(self, key_type, blocks, candidates, focus=None):
+        """Pontua os pares de um lote de blocos"""
+        member_ids = {patient_id for ids in blocks for patient_id in ids}
+        profiles = self._load_profiles(member_ids)
+        precedence = KEY_TYPES.index(key_type)
+
+        for ids in blocks:
+            self.stats['blocks_processed'] += 1
+            for id_a, id_b in combinations(ids, 2):
+                if focus is not None and id_a not in focus and id_b not in focus:
+                    continue
+                if (id_a, id_b) in candidates:
+                    continue
+
+                a, b = profiles.get(id_a), profiles.get(id_b)
+                if a is None or b is None:
+                    continue
+
+                shared = _shared_key_types(a, b)
+                if self._compared_earlier(a, shared, precedence):
+                    continue
+
+                self.stats['pairs_compared'] += 1
+                score = score_pair(a, b, self.threshold)
+                if score >= self.threshold:
+                    candidates[(id_a, id_b)] = (score, shared)
+
+    def _compared_earlier(self, profile, shared, precedence):
+        # O par já foi avaliado em um bloco de maior precedência que não foi descartado por tamanho
+        values = {'cpf': profile.cpf_digits, 'phonetic': profile.phonetic, 'birth_gender': profile.birth_gender}
+        for key_type in KEY_TYPES[:precedence]:
+            if key_type in shared and (key_type, values[key_type]) not in self._oversized:
+                return True
+        return False
+
+    def _load_profiles(self, patient_ids):
+        profiles = {}
+        ids = list(patient_ids)
+        columns = (Patient.id, Patient.patient_id, Patient.name, Patient.cpf, Patient.birth_date,
+                   Patient.gender, Patient.phone, Patient.email, Patient.updated_at)
+
+        for start in range(0, len(ids), 900):
+            rows = db.session.execute(
+                select(*columns).where(Patient.id.in_(ids[start:start + 900]))
+            ).all()
+            for row in rows:
+                profiles[row.id] = build_profile(row)
+
+        return profiles
+
+    def _resolve_system_id(self):
+        if self.system_id:
+            return self.system_id
+        system = HealthSystem.query.filter_by(system_type='HIS').order_by(HealthSystem.id).first()
+        if system is None:
+            system = HealthSystem.query.order_by(HealthSystem.id).first()
+        if system is None:
+            raise ValueError('Nenhum sistema de saúde cadastrado para associar as duplicidades')
+        return system.id
+
+    def _emit_issues(self, candidates):
+        """Cria um problema de duplicidade por par ainda não registrado"""
+        if not candidates:
+            return 0
+
+        system_id = self._resolve_system_id()
+        pairs = sorted(candidates)
+        created = 0
+
+        for start in range(0, len(pairs), 500):
+            chunk = pairs[start:start + 500]
+
+            existing = set(db.session.execute(
+                select(DuplicateCandidate.patient_id, DuplicateCandidate.duplicate_patient_id).where(
+                    tuple_(DuplicateCandidate.patient_id, DuplicateCandidate.duplicate_patient_id).in_(chunk)
+                )
+            ).all())
+            new_pairs = [pair for pair in chunk if pair not in existing]
+            if not new_pairs:
+                continue
+
+            profiles = self._load_profiles({patient_id for pair in new_pairs for patient_id in pair})
+            now = datetime.utcnow()
+
+            issues = []
+            for id_a, id_b in new_pairs:
+                score, shared = candidates[(id_a, id_b)]
+                original, duplicate = profiles[id_a], profiles[id_b]
+                issue = DataQualityIssue(
+                    patient_id=duplicate.id,
+                    system_id=system_id,
+                    issue_type='duplicate',
+                    priority='high' if score >= 0.9 else 'medium' if score >= 0.8 else 'low',
+                    title='Possível paciente duplicado',
+                    description=(
+                        f"Paciente {duplicate.patient_id} ({duplicate.name}) possivelmente duplicado de "
+                        f"{original.patient_id} ({original.name}) - similaridade {score:.0%}"
+                    ),
+                    status='open',
+                    detected_at=now
+                )
+                issues.append((id_a, id_b, score, shared, issue))
+
+            db.session.add_all([issue for *_, issue in issues])
+            db.session.flush()
+
+            db.session.add_all([
+                DuplicateCandidate(
+                    patient_id=id_a,
+                    duplicate_patient_id=id_b,
+                    score=score,
+                    matched_keys=','.join(shared),
+                    issue_id=issue.id,
+                    detected_at=now
+                )
+                for id_a, id_b, score, shared, issue in issues
+            ])
+            db.session.commit()
+            created += len(issues)
+
+        return created
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from src.models.auth import User, UserSession
+    from src.utils.migrations import apply_migrations
+
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = os.path.abspath(args[0] if args else default_path)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        stats = DuplicateDetector().run(full='--full' in sys.argv)
+
+    for key, value in stats.items():
+        print(f"- {key}: {value}")
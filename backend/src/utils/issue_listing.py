@@ -0,0 +1,69 @@
+"""
+Projeção das listagens de problemas com nome do sistema e do paciente
+
+As listagens leem problema, sistema e paciente em uma única consulta com outer join,
+devolvendo linhas leves (Row) em vez de objetos ORM com lazy-load por relacionamento.
+"""
+
+from src.models.patient import DataQualityIssue, HealthSystem, Patient, db
+
+ISSUE_COLUMNS = [
+    DataQualityIssue.id,
+    DataQualityIssue.patient_id,
+    DataQualityIssue.system_id,
+    DataQualityIssue.issue_type,
+    DataQualityIssue.priority,
+    DataQualityIssue.title,
+    DataQualityIssue.description,
+    DataQualityIssue.status,
+    DataQualityIssue.detected_at,
+    DataQualityIssue.resolved_at,
+    DataQualityIssue.resolution_time
+]
+
+UNKNOWN_SYSTEM_NAME = 'Sistema Desconhecido'
+
+
+def issue_listing_query():
+    """Consulta de problemas já unida a sistema e paciente; aceita filter/order_by/paginate"""
+    return db.session.query(
+        *ISSUE_COLUMNS,
+        HealthSystem.name.label('system_name'),
+        Patient.name.label('patient_name')
+    ).select_from(DataQualityIssue).outerjoin(
+        HealthSystem, HealthSystem.id == DataQualityIssue.system_id
+    ).outerjoin(
+        Patient, Patient.id == DataQualityIssue.patient_id
+    )
+
+
+def filter_issue_listing(query, status='open', priority='', issue_type=''):
+    """Filtros da listagem de problemas (valores vazios não filtram)"""
+    if status:
+        query = query.filter(DataQualityIssue.status == status)
+    if priority:
+        query = query.filter(DataQualityIssue.priority == priority)
+    if issue_type:
+        query = query.filter(DataQualityIssue.issue_type == issue_type)
+    return query
+
+
+def issue_row_to_dict(row):
+    """Equivalente a DataQualityIssue.to_dict para uma linha da projeção"""
+    return {
+        'id': row.id,
+        'patient_id': row.patient_id,
+        'system_id': row.system_id,
+        'issue_type': row.issue_type,
+        'priority': row.priority,
+        'title': row.title,
+        'description': row.description,
+        'status': row.status,
+        'detected_at': row.detected_at.isoformat() if row.detected_at else None,
+        'resolved_at': row.resolved_at.isoformat() if row.resolved_at else None,
+        'resolution_time': row.resolution_time
+    }
+
+
+def system_name_of(row):
+    return row.system_name or UNKNOWN_SYSTEM_NAME
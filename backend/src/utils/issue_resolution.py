@@ -0,0 +1,157 @@
+"""
+Resolução de problemas em massa
+
+Os problemas elegíveis são resolvidos com UPDATEs por conjunto em lotes limitados, todos na
+mesma transação; o tempo de resolução é calculado no próprio SQL a partir de detected_at.
+"""
+
+import time
+from datetime import datetime
+from sqlalchemy import DateTime, Integer, case, cast, func, literal, select, update
+from src.models.patient import DataQualityIssue, db
+
+DEFAULT_BATCH_SIZE = 500
+MAX_BATCH_SIZE = 5000
+
+# Filtros aceitos no modo por critério (parâmetro da API -> coluna)
+FILTER_COLUMNS = {
+    'type': DataQualityIssue.issue_type,
+    'priority': DataQualityIssue.priority,
+    'system_id': DataQualityIssue.system_id
+}
+# Tipo JSON esperado em cada filtro
+FILTER_TYPES = {'type': str, 'priority': str, 'system_id': int}
+
+
+def _is_int(value):
+    # bool é subclasse de int no Python, mas true/false não são IDs
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def resolution_minutes_expression(now):
+    """Minutos entre detected_at e o instante da resolução, calculado no SQLite"""
+    elapsed_days = func.julianday(literal(now, DateTime)) - func.julianday(DataQualityIssue.detected_at)
+    return case(
+        (DataQualityIssue.detected_at.is_(None), 0),
+        else_=cast(elapsed_days * 1440, Integer)
+    )
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class BulkIssueResolver:
+    """Resolve problemas por lista de IDs ou por filtro (tipo, prioridade, sistema)"""
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        if batch_size < 1:
+            raise ValueError('batch_size deve ser positivo')
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+
+    def resolve_ids(self, issue_ids):
+        """Resolve os IDs informados; IDs inexistentes ou já resolvidos voltam como falhas"""
+        # Só uma lista JSON de inteiros: uma string seria percorrida caractere a caractere
+        if not isinstance(issue_ids, list) or not all(_is_int(issue_id) for issue_id in issue_ids):
+            raise ValueError('ids deve ser uma lista de inteiros')
+        requested = list(dict.fromkeys(issue_ids))
+        if not requested:
+            raise ValueError('Informe ao menos um ID')
+
+        # Estado atual dos IDs pedidos, lido em lotes para respeitar o limite de parâmetros do SQLite
+        status_by_id = {}
+        for batch in _chunks(requested, self.batch_size):
+            status_by_id.update(db.session.execute(
+                select(DataQualityIssue.id, DataQualityIssue.status).where(DataQualityIssue.id.in_(batch))
+            ).all())
+
+        failures = []
+        eligible = []
+        for issue_id in requested:
+            status = status_by_id.get(issue_id)
+            if status is None:
+                failures.append({'id': issue_id, 'reason': 'Problema não encontrado'})
+            elif status == 'resolved':
+                failures.append({'id': issue_id, 'reason': 'Problema já foi resolvido'})
+            else:
+                eligible.append(issue_id)
+
+        return self._apply(eligible, failures)
+
+    def resolve_filter(self, filters):
+        """Resolve todos os problemas não resolvidos que atendem ao filtro"""
+        if not isinstance(filters, dict):
+            raise ValueError('filter deve ser um objeto')
+        conditions = []
+        for name, value in filters.items():
+            if name not in FILTER_COLUMNS:
+                raise ValueError(f'Filtro inválido: {name}')
+            if value is None or value == '':
+                continue
+            expected = FILTER_TYPES[name]
+            if not (_is_int(value) if expected is int else isinstance(value, expected)):
+                raise ValueError(f"Filtro {name} deve ser {'um inteiro' if expected is int else 'um texto'}")
+            conditions.append(FILTER_COLUMNS[name] == value)
+        if not conditions:
+            raise ValueError('Informe ao menos um filtro (type, priority ou system_id)')
+
+        eligible = db.session.execute(
+            select(DataQualityIssue.id).where(
+                DataQualityIssue.status != 'resolved', *conditions
+            ).order_by(DataQualityIssue.id)
+        ).scalars().all()
+
+        return self._apply(eligible, [])
+
+    def _apply(self, eligible, failures):
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        resolution_time = resolution_minutes_expression(now)
+        batches = []
+        resolved = 0
+
+        try:
+            for number, batch in enumerate(_chunks(eligible, self.batch_size), start=1):
+                batch_started = time.perf_counter()
+                # A condição de status evita sobrescrever problemas resolvidos por outra requisição
+                updated = db.session.execute(
+                    update(DataQualityIssue).where(
+                        DataQualityIssue.id.in_(batch),
+                        DataQualityIssue.status != 'resolved'
+                    ).values(
+                        status='resolved',
+                        resolved_at=now,
+                        resolution_time=resolution_time
+                    ).returning(DataQualityIssue.id),
+                    execution_options={'synchronize_session': False}
+                ).scalars().all()
+
+                missed = set(batch) - set(updated)
+                failures.extend(
+                    {'id': issue_id, 'reason': 'Problema já foi resolvido'} for issue_id in sorted(missed)
+                )
+                resolved += len(updated)
+                batches.append({
+                    'batch': number,
+                    'size': len(batch),
+                    'resolved': len(updated),
+                    'seconds': round(time.perf_counter() - batch_started, 4)
+                })
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        # Objetos já carregados na sessão passam a refletir o UPDATE
+        db.session.expire_all()
+
+        return {
+            'resolved': resolved,
+            'failed_ids': [failure['id'] for failure in failures],
+            'failures': failures,
+            'batches': batches,
+            'resolved_at': now.isoformat(),
+            'elapsed_seconds': round(time.perf_counter() - started, 4)
+        }
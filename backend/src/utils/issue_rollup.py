@@ -0,0 +1,234 @@
+"""
+Rollup materializado das métricas de problemas
+
+issue_metrics_rollup guarda contagens e somas de tempo de resolução por
+(dia, sistema, tipo, prioridade, status). Gatilhos no SQLite mantêm o rollup a cada
+INSERT/UPDATE/DELETE em data_quality_issues (inclusive cargas em massa e UPDATEs por
+conjunto); a reconciliação periódica reconstrói a tabela a partir dos problemas.
+
+Status do rollup:
+- detected: toda detecção, pelo dia de detecção (nunca diminui ao resolver)
+- open / in_progress: estado atual, pelo dia de detecção
+- resolved: pelo dia de resolução, com soma e quantidade de tempos de resolução
+
+Uso: python src/utils/issue_rollup.py [caminho/para/healthgraph.db]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, inspect, select
+from src.database import db
+from src.models.quality import IssueMetricsRollup
+
+ROLLUP_TABLE = 'issue_metrics_rollup'
+ROLLUP_KEY = '(day, system_id, issue_type, priority, status)'
+ROLLUP_TRIGGERS = ['issue_rollup_ai', 'issue_rollup_ad', 'issue_rollup_au']
+
+
+def _status_row(alias):
+    """Expressões da linha de estado atual de um problema (new/old nos gatilhos, tabela na reconstrução)"""
+    return {
+        'day': (
+            f"CASE WHEN {alias}.status = 'resolved' "
+            f"THEN date(coalesce({alias}.resolved_at, {alias}.detected_at, CURRENT_TIMESTAMP)) "
+            f"ELSE date(coalesce({alias}.detected_at, CURRENT_TIMESTAMP)) END"
+        ),
+        'system_id': f"coalesce({alias}.system_id, 0)",
+        'issue_type': f"coalesce({alias}.issue_type, '')",
+        'priority': f"coalesce({alias}.priority, '')",
+        'status': f"coalesce({alias}.status, 'open')",
+        'resolution_count': (
+            f"CASE WHEN {alias}.status = 'resolved' AND {alias}.resolution_time IS NOT NULL THEN 1 ELSE 0 END"
+        ),
+        'resolution_time_sum': f"CASE WHEN {alias}.status = 'resolved' THEN coalesce({alias}.resolution_time, 0) ELSE 0 END"
+    }
+
+
+def _detected_row(alias):
+    """Expressões da linha 'detected' (uma por detecção, pelo dia de detecção)"""
+    return {
+        'day': f"date(coalesce({alias}.detected_at, CURRENT_TIMESTAMP))",
+        'system_id': f"coalesce({alias}.system_id, 0)",
+        'issue_type': f"coalesce({alias}.issue_type, '')",
+        'priority': f"coalesce({alias}.priority, '')",
+        'status': "'detected'",
+        'resolution_count': '0',
+        'resolution_time_sum': '0'
+    }
+
+
+def _upsert(row, sign):
+    """Soma (sign=1) ou subtrai (sign=-1) a contribuição de um problema em uma linha do rollup"""
+    return (
+        f"INSERT INTO {ROLLUP_TABLE} (day, system_id, issue_type, priority, status, "
+        f"issue_count, resolution_count, resolution_time_sum) VALUES ("
+        f"{row['day']}, {row['system_id']}, {row['issue_type']}, {row['priority']}, {row['status']}, "
+        f"{sign}, {sign} * ({row['resolution_count']}), {sign} * ({row['resolution_time_sum']})) "
+        f"ON CONFLICT {ROLLUP_KEY} DO UPDATE SET "
+        f"issue_count = issue_count + excluded.issue_count, "
+        f"resolution_count = resolution_count + excluded.resolution_count, "
+        f"resolution_time_sum = resolution_time_sum + excluded.resolution_time_sum;"
+    )
+
+
+def rollup_trigger_statements():
+    """DDL dos gatilhos que mantêm o rollup incrementalmente"""
+    add_new = _upsert(_detected_row('new'), 1) + ' ' + _upsert(_status_row('new'), 1)
+    remove_old = _upsert(_detected_row('old'), -1) + ' ' + _upsert(_status_row('old'), -1)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS issue_rollup_ai AFTER INSERT ON data_quality_issues "
+        f"BEGIN {add_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS issue_rollup_ad AFTER DELETE ON data_quality_issues "
+        f"BEGIN {remove_old} END",
+        # Mover a contribuição: retira a versão antiga e soma a nova (linhas inalteradas se anulam)
+        f"CREATE TRIGGER IF NOT EXISTS issue_rollup_au AFTER UPDATE OF "
+        f"status, resolved_at, resolution_time, detected_at, system_id, issue_type, priority "
+        f"ON data_quality_issues BEGIN {remove_old} {add_new} END"
+    ]
+
+
+def _rebuild_statement(row):
+    return (
+        f"INSERT INTO {ROLLUP_TABLE} (day, system_id, issue_type, priority, status, "
+        f"issue_count, resolution_count, resolution_time_sum) "
+        f"SELECT {row['day']}, {row['system_id']}, {row['issue_type']}, {row['priority']}, {row['status']}, "
+        f"count(*), sum({row['resolution_count']}), sum({row['resolution_time_sum']}) "
+        f"FROM data_quality_issues AS i GROUP BY 1, 2, 3, 4, 5"
+    )
+
+
+def rebuild_issue_rollup(connection):
+    """Reconstrói o rollup a partir de data_quality_issues (na transação da conexão)"""
+    connection.exec_driver_sql(f"DELETE FROM {ROLLUP_TABLE}")
+    connection.exec_driver_sql(_rebuild_statement(_detected_row('i')))
+    connection.exec_driver_sql(_rebuild_statement(_status_row('i')))
+
+
+def ensure_issue_rollup(connection):
+    """Cria os gatilhos do rollup; na primeira instalação também carrega o histórico existente"""
+    if connection.dialect.name != 'sqlite' or not inspect(connection).has_table(ROLLUP_TABLE):
+        return []
+
+    existing = set(connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+    ).scalars())
+    missing = [name for name in ROLLUP_TRIGGERS if name not in existing]
+    if not missing:
+        return []
+
+    for statement in rollup_trigger_statements():
+        connection.exec_driver_sql(statement)
+    rebuild_issue_rollup(connection)
+    return missing
+
+
+def _rollup_snapshot(connection):
+    rows = connection.exec_driver_sql(
+        f"SELECT day, system_id, issue_type, priority, status, issue_count, resolution_count, "
+        f"resolution_time_sum FROM {ROLLUP_TABLE} "
+        f"WHERE issue_count != 0 OR resolution_count != 0 OR resolution_time_sum != 0"
+    ).all()
+    return {tuple(row[:5]): tuple(row[5:]) for row in rows}
+
+
+def reconcile_issue_rollup():
+    """Reconcilia o rollup com a tabela de problemas e informa quantas chaves divergiam"""
+    started = time.perf_counter()
+    connection = db.session.connection()
+
+    before = _rollup_snapshot(connection)
+    rebuild_issue_rollup(connection)
+    after = _rollup_snapshot(connection)
+    db.session.commit()
+
+    drifted = sum(1 for key in set(before) | set(after) if before.get(key) != after.get(key))
+    return {
+        'rows': len(after),
+        'drifted_keys': drifted,
+        'reconciled_at': datetime.utcnow().isoformat(),
+        'elapsed_seconds': round(time.perf_counter() - started, 4)
+    }
+
+
+def get_rollup_issue_metrics(now=None, window_days=30):
+    """Métricas do centro de resolução lidas do rollup (uma consulta sobre linhas pré-agregadas)"""
+    now = now or datetime.utcnow()
+    cutoff = (now - timedelta(days=window_days)).date()
+    in_window = case((IssueMetricsRollup.day >= cutoff, 1), else_=0)
+
+    rows = db.session.execute(
+        select(
+            IssueMetricsRollup.status,
+            IssueMetricsRollup.priority,
+            IssueMetricsRollup.issue_type,
+            in_window.label('in_window'),
+            func.sum(IssueMetricsRollup.issue_count),
+            func.sum(IssueMetricsRollup.resolution_count),
+            func.sum(IssueMetricsRollup.resolution_time_sum)
+        ).where(
+            IssueMetricsRollup.status.in_(('detected', 'open', 'resolved'))
+        ).group_by(
+            IssueMetricsRollup.status, IssueMetricsRollup.priority, IssueMetricsRollup.issue_type, in_window
+        )
+    ).all()
+
+    total_open = resolved_window = detected_window = 0
+    resolution_count = resolution_time_sum = 0
+    priority_data = {}
+    type_data = {}
+
+    for status, priority, issue_type, recent, count, resolutions, resolution_sum in rows:
+        if status == 'open':
+            total_open += count
+            priority_data[priority] = priority_data.get(priority, 0) + count
+            type_data[issue_type] = type_data.get(issue_type, 0) + count
+        elif status == 'resolved':
+            resolution_count += resolutions
+            resolution_time_sum += resolution_sum
+            if recent:
+                resolved_window += count
+        elif status == 'detected' and recent:
+            detected_window += count
+
+    # Chaves zeradas (problemas que mudaram de status) não entram nas distribuições
+    priority_data = {key: value for key, value in priority_data.items() if value}
+    type_data = {key: value for key, value in type_data.items() if value}
+
+    avg_resolution_time = resolution_time_sum / resolution_count if resolution_count else None
+
+    return {
+        'total_open': total_open,
+        'resolved_in_window': resolved_window,
+        'detected_in_window': detected_window,
+        'average_resolution_minutes': avg_resolution_time,
+        'priority_distribution': priority_data,
+        'type_distribution': type_data
+    }
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from src.models.auth import User, UserSession
+    from src.models.patient import Patient, MedicalRecord, HealthSystem, DataQualityIssue, DashboardMetrics
+    from src.models.quality import PatientBlockingKey, DuplicateCandidate
+    from src.utils.migrations import apply_migrations
+
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else default_path)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        stats = reconcile_issue_rollup()
+
+    print(f"✓ Rollup reconciliado: {stats['rows']} linhas, {stats['drifted_keys']} chaves divergentes "
+          f"({stats['elapsed_seconds']}s)")
@@ -0,0 +1,217 @@
+"""
+KPIs por período com comparação ao período anterior
+
+Os indicadores são derivados apenas de agregados diários: quality_snapshots (pontuações e
+contagens globais), issue_metrics_rollup (tempos de resolução) e department_snapshots (totais
+acumulados por departamento). O custo de um período é proporcional ao número de dias, não
+ao número de problemas ou registros; os resultados ficam em cache por (período, departamento).
+"""
+
+import re
+from datetime import date, datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from src.database import db
+from src.models.quality import DepartmentSnapshot, IssueMetricsRollup, QualitySnapshot
+from src.utils.cache import TTLCache
+from src.utils.quality_snapshots import ensure_recent_snapshot
+
+DEFAULT_KPI_TTL = 300  # segundos
+MAX_PERIOD_DAYS = 3650
+
+# Economia estimada por problema resolvido (mesmo valor usado na análise de ROI)
+ESTIMATED_SAVINGS_PER_ISSUE = 1500
+
+KPI_UNITS = {
+    'data_quality_score': '%',
+    'issues_resolution_rate': '%',
+    'average_resolution_time': 'hours',
+    'system_availability': '%',
+    'data_completeness': '%',
+    'cost_savings': 'BRL'
+}
+
+_DAYS_PERIOD = re.compile(r'^(\d+)d$')
+_kpi_cache = TTLCache(ttl=DEFAULT_KPI_TTL, maxsize=256)
+
+
+def _quarter_start(day):
+    return day.replace(month=3 * ((day.month - 1) // 3) + 1, day=1)
+
+
+def resolve_period(period='month', start=None, end=None, today=None):
+    """Intervalos (início, fim) do período atual e do anterior
+
+    period: week, month, quarter, year (até hoje, comparados ao anterior completo), Nd
+    (últimos N dias) ou start/end explícitos (comparados ao intervalo de mesmo tamanho anterior).
+    """
+    today = today or datetime.utcnow().date()
+
+    if start or end:
+        try:
+            current_start = date.fromisoformat(start) if start else today
+            current_end = date.fromisoformat(end) if end else today
+        except ValueError:
+            raise ValueError('Datas devem estar no formato AAAA-MM-DD')
+        if current_start > current_end:
+            raise ValueError('start deve ser anterior a end')
+        length = (current_end - current_start).days + 1
+        if length > MAX_PERIOD_DAYS:
+            raise ValueError(f'Período máximo de {MAX_PERIOD_DAYS} dias')
+        previous_end = current_start - timedelta(days=1)
+        return (current_start, current_end), (previous_end - timedelta(days=length - 1), previous_end)
+
+    if period == 'week':
+        current_start = today - timedelta(days=today.weekday())
+        previous_end = current_start - timedelta(days=1)
+        previous_start = current_start - timedelta(days=7)
+    elif period == 'month':
+        current_start = today.replace(day=1)
+        previous_end = current_start - timedelta(days=1)
+        previous_start = previous_end.replace(day=1)
+    elif period == 'quarter':
+        current_start = _quarter_start(today)
+        previous_end = current_start - timedelta(days=1)
+        previous_start = _quarter_start(previous_end)
+    elif period == 'year':
+        current_start = today.replace(month=1, day=1)
+        previous_end = current_start - timedelta(days=1)
+        previous_start = previous_end.replace(month=1, day=1)
+    else:
+        match = _DAYS_PERIOD.match(period or '')
+        if not match or not 1 <= int(match.group(1)) <= MAX_PERIOD_DAYS:
+            raise ValueError(f'Período inválido: {period} (use week, month, quarter, year ou Nd)')
+        days = int(match.group(1))
+        current_start = today - timedelta(days=days - 1)
+        previous_end = current_start - timedelta(days=1)
+        previous_start = previous_end - timedelta(days=days - 1)
+
+    return (current_start, today), (previous_start, previous_end)
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+def _ratio(part, total, scale=100.0):
+    return part * scale / total if total else None
+
+
+def _global_kpis(start, end):
+    """Indicadores globais de um intervalo a partir das linhas diárias"""
+    in_range = QualitySnapshot.day.between(start, end)
+    quality, availability, completeness, detected, resolved = db.session.execute(
+        select(
+            func.avg(QualitySnapshot.quality_score),
+            func.avg(QualitySnapshot.system_availability),
+            func.avg(QualitySnapshot.completeness_rate),
+            func.sum(QualitySnapshot.detected_issues),
+            func.sum(QualitySnapshot.resolved_issues)
+        ).where(in_range)
+    ).one()
+
+    # Tempo de resolução pelo dia da resolução (índice status + dia do rollup)
+    resolution_sum, resolution_count = db.session.execute(
+        select(
+            func.sum(IssueMetricsRollup.resolution_time_sum),
+            func.sum(IssueMetricsRollup.resolution_count)
+        ).where(IssueMetricsRollup.status == 'resolved', IssueMetricsRollup.day.between(start, end))
+    ).one()
+
+    return {
+        'data_quality_score': _round(quality),
+        'issues_resolution_rate': _round(_ratio(resolved or 0, detected)),
+        'average_resolution_time': _round(_ratio(resolution_sum or 0, resolution_count, 1 / 60)),
+        'system_availability': _round(availability),
+        'data_completeness': _round(completeness),
+        'cost_savings': (resolved or 0) * ESTIMATED_SAVINGS_PER_ISSUE if detected is not None else None
+    }
+
+
+def _department_row_at(department, day):
+    """Última linha diária do departamento até o dia informado"""
+    return DepartmentSnapshot.query.filter(
+        DepartmentSnapshot.department == department,
+        DepartmentSnapshot.day <= day
+    ).order_by(DepartmentSnapshot.day.desc()).first()
+
+
+def _department_kpis(department, start, end):
+    """Indicadores de um departamento pela diferença dos totais acumulados no intervalo"""
+    completeness = db.session.query(func.avg(DepartmentSnapshot.completeness_rate)).filter(
+        DepartmentSnapshot.department == department,
+        DepartmentSnapshot.day.between(start, end)
+    ).scalar()
+
+    kpis = {'issues_resolution_rate': None, 'average_resolution_time': None,
+            'data_completeness': _round(completeness)}
+
+    last = _department_row_at(department, end)
+    # Sem linha antes do início, a primeira linha do intervalo serve de base
+    base = _department_row_at(department, start - timedelta(days=1)) or DepartmentSnapshot.query.filter(
+        DepartmentSnapshot.department == department,
+        DepartmentSnapshot.day.between(start, end)
+    ).order_by(DepartmentSnapshot.day).first()
+    if last is None or base is None or last.id == base.id:
+        return kpis
+
+    detected = last.detected_total - base.detected_total
+    resolved = last.resolved_total - base.resolved_total
+    resolution_sum = last.resolution_time_sum - base.resolution_time_sum
+    resolution_count = last.resolution_count - base.resolution_count
+
+    kpis['issues_resolution_rate'] = _round(_ratio(resolved, detected))
+    kpis['average_resolution_time'] = _round(_ratio(resolution_sum, resolution_count, 1 / 60))
+    return kpis
+
+
+def _trend(current, previous):
+    if current is None or previous is None or current == previous:
+        return 'stable'
+    return 'up' if current > previous else 'down'
+
+
+def compute_kpis(current, previous, department=None):
+    """KPIs do intervalo atual comparados ao anterior"""
+    if department:
+        current_values = _department_kpis(department, *current)
+        previous_values = _department_kpis(department, *previous)
+    else:
+        ensure_recent_snapshot()
+        current_values = _global_kpis(*current)
+        previous_values = _global_kpis(*previous)
+
+    return {
+        name: {
+            'current': current_values[name],
+            'previous': previous_values[name],
+            'trend': _trend(current_values[name], previous_values[name]),
+            'unit': KPI_UNITS[name]
+        }
+        for name in current_values
+    }
+
+
+def get_kpis(period='month', start=None, end=None, department=None):
+    """KPIs em cache por (intervalo, departamento)"""
+    current, previous = resolve_period(period, start, end)
+    key = (current, previous, department or None)
+
+    def _compute():
+        return {
+            'kpis': compute_kpis(current, previous, department or None),
+            'period': {
+                'current': {'start': current[0].isoformat(), 'end': current[1].isoformat()},
+                'previous': {'start': previous[0].isoformat(), 'end': previous[1].isoformat()}
+            },
+            'department': department or None,
+            'calculated_at': datetime.utcnow().isoformat()
+        }
+
+    ttl = current_app.config.get('KPI_CACHE_TTL', DEFAULT_KPI_TTL)
+    return _kpi_cache.get_or_set(key, _compute, ttl)
+
+
+def invalidate_kpis():
+    """Descarta os KPIs em cache"""
+    _kpi_cache.invalidate()
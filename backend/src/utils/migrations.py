@@ -0,0 +1,204 @@
+"""
+Migrações idempotentes aplicadas sobre bancos existentes (healthgraph.db)
+
+Uso: python src/utils/migrations.py [caminho/para/healthgraph.db]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+from sqlalchemy import create_engine, inspect
+from src.database import db
+from src.utils.issue_rollup import ensure_issue_rollup
+
+
+def ensure_columns(connection, metadata):
+    """Adiciona as colunas declaradas nos modelos que ainda não existem no banco
+
+    Só colunas anuláveis podem ser adicionadas assim (ALTER TABLE ... ADD COLUMN); as linhas
+    existentes ficam com NULL.
+    """
+    inspector = inspect(connection)
+    created = []
+
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise ValueError(f'Coluna {table.name}.{column.name} precisa ser anulável para ser adicionada')
+            column_type = column.type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            created.append(f'{table.name}.{column.name}')
+
+    return created
+
+
+def ensure_indexes(connection, metadata):
+    """Cria os índices declarados nos modelos que ainda não existem no banco"""
+    inspector = inspect(connection)
+    created = []
+
+    for table in metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+                created.append(index.name)
+
+    return created
+
+
+# Índices de texto completo (SQLite FTS5): tabela virtual, gatilhos de sincronização e carga inicial
+FTS_INDEXES = [
+    {
+        # Problemas semelhantes: conteúdo externo lido de data_quality_issues
+        'name': 'data_quality_issues_fts',
+        'source': 'data_quality_issues',
+        'create': (
+            "CREATE VIRTUAL TABLE data_quality_issues_fts USING fts5("
+            "title, description, content='data_quality_issues', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        ),
+        'triggers': [
+            "CREATE TRIGGER IF NOT EXISTS data_quality_issues_fts_ai AFTER INSERT ON data_quality_issues BEGIN "
+            "INSERT INTO data_quality_issues_fts(rowid, title, description) "
+            "VALUES (new.id, new.title, new.description); END",
+            "CREATE TRIGGER IF NOT EXISTS data_quality_issues_fts_ad AFTER DELETE ON data_quality_issues BEGIN "
+            "INSERT INTO data_quality_issues_fts(data_quality_issues_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END",
+            "CREATE TRIGGER IF NOT EXISTS data_quality_issues_fts_au AFTER UPDATE OF title, description "
+            "ON data_quality_issues BEGIN "
+            "INSERT INTO data_quality_issues_fts(data_quality_issues_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO data_quality_issues_fts(rowid, title, description) "
+            "VALUES (new.id, new.title, new.description); END"
+        ],
+        'populate': "INSERT INTO data_quality_issues_fts(data_quality_issues_fts) VALUES ('rebuild')",
+        # Frequência dos termos no índice (quantos problemas contêm cada termo), lida pela busca
+        'vocab': (
+            "CREATE VIRTUAL TABLE IF NOT EXISTS data_quality_issues_fts_vocab "
+            "USING fts5vocab(data_quality_issues_fts, row)"
+        )
+    },
+    {
+        # Busca de pacientes: sem conteúdo próprio (só rowids), CPF indexado apenas com dígitos
+        'name': 'patients_fts',
+        'source': 'patients',
+        'create': (
+            "CREATE VIRTUAL TABLE patients_fts USING fts5("
+            "name, patient_id, cpf_digits, email, content='', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')"
+        ),
+        'triggers': [
+            "CREATE TRIGGER IF NOT EXISTS patients_fts_ai AFTER INSERT ON patients BEGIN "
+            "INSERT INTO patients_fts(rowid, name, patient_id, cpf_digits, email) "
+            "VALUES (new.id, new.name, new.patient_id, replace(replace(new.cpf, '.', ''), '-', ''), new.email); END",
+            "CREATE TRIGGER IF NOT EXISTS patients_fts_ad AFTER DELETE ON patients BEGIN "
+            "INSERT INTO patients_fts(patients_fts, rowid, name, patient_id, cpf_digits, email) "
+            "VALUES ('delete', old.id, old.name, old.patient_id, replace(replace(old.cpf, '.', ''), '-', ''), old.email); END",
+            "CREATE TRIGGER IF NOT EXISTS patients_fts_au AFTER UPDATE OF name, patient_id, cpf, email "
+            "ON patients BEGIN "
+            "INSERT INTO patients_fts(patients_fts, rowid, name, patient_id, cpf_digits, email) "
+            "VALUES ('delete', old.id, old.name, old.patient_id, replace(replace(old.cpf, '.', ''), '-', ''), old.email); "
+            "INSERT INTO patients_fts(rowid, name, patient_id, cpf_digits, email) "
+            "VALUES (new.id, new.name, new.patient_id, replace(replace(new.cpf, '.', ''), '-', ''), new.email); END"
+        ],
+        # Tabelas sem conteúdo não aceitam 'rebuild': a carga inicial lê os pacientes existentes
+        'populate': (
+            "INSERT INTO patients_fts(rowid, name, patient_id, cpf_digits, email) "
+            "SELECT id, name, patient_id, replace(replace(cpf, '.', ''), '-', ''), email FROM patients"
+        )
+    }
+]
+
+
+def ensure_fts_indexes(connection):
+    """Cria as tabelas FTS5 e os gatilhos que as mantêm; popula as tabelas recém-criadas"""
+    if connection.dialect.name != 'sqlite':
+        return []
+
+    inspector = inspect(connection)
+    created = []
+
+    for fts in FTS_INDEXES:
+        if not inspector.has_table(fts['source']):
+            continue
+
+        is_new = not inspector.has_table(fts['name'])
+        if is_new:
+            connection.exec_driver_sql(fts['create'])
+        for trigger in fts['triggers']:
+            connection.exec_driver_sql(trigger)
+        if fts.get('vocab'):
+            connection.exec_driver_sql(fts['vocab'])
+        if is_new:
+            connection.exec_driver_sql(fts['populate'])
+            created.append(fts['name'])
+
+    return created
+
+
+# Tabelas FTS existentes por banco (URL do engine); preenchido na primeira consulta e após migrar
+_fts_tables = {}
+
+
+def fts_tables(engine, refresh=False):
+    """Nomes das tabelas FTS (e de vocabulário) presentes no banco, sem inspecionar a cada chamada"""
+    key = str(engine.url)
+    tables = _fts_tables.get(key)
+    if tables is None or refresh:
+        names = []
+        for fts in FTS_INDEXES:
+            names.append(fts['name'])
+            if fts.get('vocab'):
+                names.append(f"{fts['name']}_vocab")
+        inspector = inspect(engine)
+        tables = _fts_tables[key] = frozenset(name for name in names if inspector.has_table(name))
+    return tables
+
+
+def apply_migrations(engine, metadata=None):
+    """Aplica todas as migrações pendentes; pode ser executada várias vezes"""
+    metadata = metadata if metadata is not None else db.metadata
+
+    with engine.begin() as connection:
+        # Colunas antes dos índices: um índice novo pode depender de uma coluna nova
+        created = ensure_columns(connection, metadata)
+        created += ensure_indexes(connection, metadata)
+        created += ensure_fts_indexes(connection)
+        created += ensure_issue_rollup(connection)
+
+        # Atualizar estatísticas do planejador após criar índices novos
+        if created and connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('ANALYZE')
+
+    fts_tables(engine, refresh=True)
+    return created
+
+
+if __name__ == "__main__":
+    # Registrar os modelos no metadata antes de migrar
+    from src.models.auth import User, UserSession
+    from src.models.patient import Patient, MedicalRecord, HealthSystem, DataQualityIssue, DashboardMetrics
+    from src.models.quality import PatientBlockingKey, DuplicateCandidate, IssueMetricsRollup, QualitySnapshot, DepartmentSnapshot
+    from src.models.integration import SyncLog, SyncLogDaily
+
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = sys.argv[1] if len(sys.argv) > 1 else default_path
+
+    engine = create_engine(f"sqlite:///{os.path.abspath(db_path)}")
+    created = apply_migrations(engine)
+
+    if created:
+        print(f"✓ {len(created)} alterações aplicadas: {', '.join(created)}")
+    else:
+        print("✓ Banco de dados já está atualizado")
@@ -0,0 +1,164 @@
+"""
+Paginação por cursor (keyset) para listagens grandes
+"""
+
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_
+from src.database import db
+from src.utils.cache import TTLCache
+
+# Totais exatos são caros em tabelas grandes; guardamos por alguns segundos
+total_count_cache = TTLCache(ttl=60)
+
+# Maior página aceita no modo cursor (valores acima são reduzidos a este)
+MAX_PER_PAGE = 500
+
+
+class KeysetKey:
+    """Coluna de ordenação do keyset: expressão SQL, direção e extrator do valor no item"""
+
+    def __init__(self, expression, getter, descending=False, value_type=int):
+        self.expression = expression
+        self.getter = getter
+        self.descending = descending
+        self.value_type = value_type
+
+    def order_by(self):
+        return self.expression.desc() if self.descending else self.expression.asc()
+
+
+class KeysetPage:
+    """Resultado de uma página por cursor"""
+
+    def __init__(self, items, per_page, next_cursor):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.has_next = next_cursor is not None
+
+
+def encode_cursor(values):
+    """Gera um token opaco a partir dos valores da última linha da página"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, value_types):
+    """Decodifica um token de cursor; lança ValueError se for inválido"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+
+    if not isinstance(payload, list) or len(payload) != len(value_types):
+        raise ValueError('Cursor inválido')
+
+    values = []
+    for value, value_type in zip(payload, value_types):
+        try:
+            if value_type is datetime:
+                values.append(datetime.fromisoformat(value))
+            else:
+                values.append(value_type(value))
+        except (ValueError, TypeError):
+            raise ValueError('Cursor inválido')
+    return values
+
+
+def keyset_condition(keys, values):
+    """Monta o filtro "depois de" para uma ordenação composta com direções mistas"""
+    clauses = []
+    for i, key in enumerate(keys):
+        equals = [keys[j].expression == values[j] for j in range(i)]
+        if key.descending:
+            beyond = key.expression < values[i]
+        else:
+            beyond = key.expression > values[i]
+        clauses.append(and_(*equals, beyond))
+    return or_(*clauses)
+
+
+def paginate_keyset(query, keys, cursor, per_page):
+    """Executa a consulta a partir do cursor, sem OFFSET nem COUNT(*)
+
+    Lança ValueError para per_page menor que 1; acima de MAX_PER_PAGE, a página é reduzida.
+    """
+    if per_page < 1:
+        raise ValueError('Parâmetro per_page deve ser positivo')
+    per_page = min(per_page, MAX_PER_PAGE)
+
+    if cursor:
+        values = decode_cursor(cursor, [key.value_type for key in keys])
+        query = query.filter(keyset_condition(keys, values))
+
+    rows = query.order_by(*[key.order_by() for key in keys]).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([key.getter(last) for key in keys])
+
+    return KeysetPage(rows, per_page, next_cursor)
+
+
+def iter_keyset_batches(statement, key_column, batch_size=5000):
+    """Percorre um SELECT em lotes ordenados pela chave, encerrando a leitura a cada lote
+
+    Cada lote roda em uma transação curta: uma leitura longa no SQLite seguraria o lock
+    compartilhado e bloquearia as escritas enquanto o consumidor processa as linhas.
+    A chave precisa ser a primeira coluna da consulta.
+    """
+    last = None
+    while True:
+        batch = statement if last is None else statement.where(key_column > last)
+        rows = db.session.execute(batch.order_by(key_column).limit(batch_size)).all()
+        db.session.rollback()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1][0]
+
+
+def iter_keyset_rows(statement, key_column, batch_size=5000):
+    """Linhas de iter_keyset_batches, uma a uma"""
+    for rows in iter_keyset_batches(statement, key_column, batch_size):
+        yield from rows
+
+
+def cached_total(cache_key, query):
+    """Total de linhas da consulta, reaproveitado enquanto o cache não expira"""
+    return total_count_cache.get_or_set(cache_key, lambda: query.order_by(None).count())
+
+
+def offset_pagination_data(page):
+    """Bloco 'pagination' da resposta no modo tradicional page/per_page"""
+    return {
+        'page': page.page,
+        'pages': page.pages,
+        'per_page': page.per_page,
+        'total': page.total,
+        'has_next': page.has_next,
+        'has_prev': page.has_prev
+    }
+
+
+def keyset_pagination_data(page, total=None):
+    """Bloco 'pagination' da resposta no modo cursor"""
+    return {
+        'per_page': page.per_page,
+        'next_cursor': page.next_cursor,
+        'has_next': page.has_next,
+        'total': total
+    }
+
+
+def is_truthy(value):
+    """Interpreta parâmetros booleanos da query string"""
+    return str(value).lower() in ('1', 'true', 'yes', 'sim')
@@ -0,0 +1,98 @@
+"""
+Camada de agregação de métricas por página de pacientes
+"""
+
+from sqlalchemy import func, select
+from src.models.patient import Patient, MedicalRecord, DataQualityIssue, db
+from src.utils.quality_scoring import patient_completeness_expression
+
+
+def get_patients_page_metrics(patient_ids):
+    """Calcula registros, problemas abertos e completude de uma página de pacientes em uma única consulta"""
+    patient_ids = list(patient_ids)
+    if not patient_ids:
+        return {}
+
+    # Subconsultas agrupadas restritas aos pacientes da página
+    records = select(
+        MedicalRecord.patient_id.label('patient_id'),
+        func.count(MedicalRecord.id).label('total_records')
+    ).where(
+        MedicalRecord.patient_id.in_(patient_ids)
+    ).group_by(MedicalRecord.patient_id).subquery()
+
+    issues = select(
+        DataQualityIssue.patient_id.label('patient_id'),
+        func.count(DataQualityIssue.id).label('quality_issues')
+    ).where(
+        DataQualityIssue.patient_id.in_(patient_ids),
+        DataQualityIssue.status == 'open'
+    ).group_by(DataQualityIssue.patient_id).subquery()
+
+    rows = db.session.execute(
+        select(
+            Patient.id,
+            func.coalesce(records.c.total_records, 0),
+            func.coalesce(issues.c.quality_issues, 0),
+            patient_completeness_expression()
+        ).outerjoin(
+            records, records.c.patient_id == Patient.id
+        ).outerjoin(
+            issues, issues.c.patient_id == Patient.id
+        ).where(Patient.id.in_(patient_ids))
+    ).all()
+
+    metrics = {}
+    for patient_id, total_records, quality_issues, completeness in rows:
+        metrics[patient_id] = {
+            'total_records': total_records,
+            'quality_issues': quality_issues,
+            'completeness_percentage': round(completeness, 1)
+        }
+
+    return metrics
+
+
+def get_patient_overview(patient_id):
+    """Paciente e contagens do histórico (registros, problemas, abertos) em uma única consulta"""
+    total_records = select(func.count(MedicalRecord.id)).where(
+        MedicalRecord.patient_id == Patient.id
+    ).scalar_subquery()
+    total_issues = select(func.count(DataQualityIssue.id)).where(
+        DataQualityIssue.patient_id == Patient.id
+    ).scalar_subquery()
+    open_issues = select(func.count(DataQualityIssue.id)).where(
+        DataQualityIssue.patient_id == Patient.id,
+        DataQualityIssue.status == 'open'
+    ).scalar_subquery()
+
+    row = db.session.execute(
+        select(Patient, total_records, total_issues, open_issues).where(Patient.id == patient_id)
+    ).first()
+    if row is None:
+        return None, {}
+
+    patient, records_count, issues_count, open_count = row
+    return patient, {
+        'total_records': records_count,
+        'total_issues': issues_count,
+        'open_issues': open_count
+    }
+
+
+def get_patient_system_fragments(patient_id):
+    """Última atualização e quantidade de registros por sistema de origem, agregadas no SQL"""
+    rows = db.session.execute(
+        select(
+            MedicalRecord.system_source,
+            func.max(MedicalRecord.created_at),
+            func.count(MedicalRecord.id)
+        ).where(
+            MedicalRecord.patient_id == patient_id
+        ).group_by(MedicalRecord.system_source).order_by(MedicalRecord.system_source)
+    ).all()
+
+    return [
+        {'system': system, 'last_update': last_update, 'records': records}
+        for system, last_update, records in rows
+    ]
@@ -3,13 +3,20 @@ Script para popular o banco de dados com dados fictícios
 """
 
 import os
+import random
 import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
 
 from flask import Flask
 from datetime import datetime
+from sqlalchemy import inspect, text
 from src.database import db
-from src.utils.data_generator import HealthDataGenerator
+from src.utils.data_generator import HealthDataGenerator, iter_dataset_chunks, shard_seed
+from src.utils.bulk_loader import BulkLoader
+
+# Tabelas derivadas dos pacientes/problemas, limpas junto com os dados de origem
+DERIVED_TABLES = ['duplicate_candidates', 'patient_blocking_keys', 'issue_metrics_rollup', 'quality_snapshots', 'department_snapshots',
+                  'sync_logs', 'sync_log_daily']
 
 # Definir modelos aqui para evitar conflitos de importação
 class Patient(db.Model):
@@ -37,6 +44,7 @@ class MedicalRecord(db.Model):
     doctor_name = db.Column(db.String(100))
     department = db.Column(db.String(50))
     system_source = db.Column(db.String(50), nullable=False)
+    external_id = db.Column(db.String(100))
     record_date = db.Column(db.DateTime, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
@@ -50,14 +58,36 @@ class HealthSystem(db.Model):
     last_sync = db.Column(db.DateTime)
     sync_frequency = db.Column(db.Integer, default=60)
     description = db.Column(db.Text)
+    endpoint_url = db.Column(db.String(255))
+    auth_token = db.Column(db.String(255))
+    sync_watermark = db.Column(db.DateTime)
+    sync_watermark_id = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class SyncLog(db.Model):
+    __tablename__ = 'sync_logs'
+    __table_args__ = (
+        db.Index('ix_sync_logs_system_timestamp', 'system_id', 'timestamp'),
+        db.Index('ix_sync_logs_timestamp', 'timestamp'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    system_id = db.Column(db.Integer, db.ForeignKey('health_systems.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    event = db.Column(db.String(20), nullable=False, default='sync')
+    status = db.Column(db.String(20), nullable=False)
+    message = db.Column(db.String(200), nullable=False)
+    details = db.Column(db.Text)
+    records_synced = db.Column(db.Integer, nullable=False, default=0)
+    duration_ms = db.Column(db.Integer)
+
 class DataQualityIssue(db.Model):
     __tablename__ = 'data_quality_issues'
     
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=True)
     system_id = db.Column(db.Integer, db.ForeignKey('health_systems.id'), nullable=False)
+    record_id = db.Column(db.Integer, db.ForeignKey('medical_records.id'), nullable=True)
     issue_type = db.Column(db.String(50), nullable=False)
     priority = db.Column(db.String(20), default='medium')
     title = db.Column(db.String(200), nullable=False)
@@ -96,9 +126,68 @@ class User(db.Model):
         from werkzeug.security import generate_password_hash
         self.password_hash = generate_password_hash(password)
 
-def populate_database(app):
-    """Popular o banco de dados com dados fictícios"""
+def _load_patient_chunk(loader, chunk, system_ids, now):
+    """Insere um lote de pacientes com seus registros e problemas, mapeando índices para IDs"""
+    patient_ids = loader.reserve_ids('patients', len(chunk['patients']))
+    # Os índices do lote são contíguos: índice start + k recebe o k-ésimo ID reservado
+    patient_id_map = {chunk['start'] + offset: patient_id for offset, patient_id in enumerate(patient_ids)}
+    
+    loader.insert('patients', (
+        {
+            'id': patient_id,
+            'patient_id': patient_data['patient_id'],
+            'name': patient_data['name'],
+            'cpf': patient_data['cpf'],
+            'birth_date': patient_data['birth_date'],
+            'gender': patient_data['gender'],
+            'phone': patient_data['phone'],
+            'email': patient_data['email'],
+            'address': patient_data['address'],
+            'created_at': now,
+            'updated_at': now
+        }
+        for patient_id, patient_data in zip(patient_ids, chunk['patients'])
+    ))
+    
+    loader.insert('medical_records', (
+        {
+            'patient_id': patient_id_map[record_data['patient_id']],
+            'record_type': record_data['record_type'],
+            'description': record_data['description'],
+            'doctor_name': record_data['doctor_name'],
+            'department': record_data['department'],
+            'system_source': record_data['system_source'],
+            'record_date': record_data['record_date'],
+            'created_at': now
+        }
+        for record_data in chunk['medical_records']
+    ))
+    
+    loader.insert('data_quality_issues', (
+        _issue_row(issue_data, system_ids, patient_id_map.get(issue_data['patient_id']))
+        for issue_data in chunk['data_quality_issues']
+    ))
 
+def _issue_row(issue_data, system_ids, patient_id):
+    return {
+        'patient_id': patient_id,
+        'system_id': system_ids[issue_data['system_id'] - 1],
+        'issue_type': issue_data['issue_type'],
+        'priority': issue_data['priority'],
+        'title': issue_data['title'],
+        'description': issue_data['description'],
+        'status': issue_data['status'],
+        'detected_at': issue_data['detected_at'],
+        'resolved_at': issue_data.get('resolved_at'),
+        'resolution_time': issue_data.get('resolution_time')
+    }
+
+def populate_database(app, num_patients=500, num_records_per_patient=5, seed=None, workers=1):
+    """Popular o banco de dados com dados fictícios
+
+    Os pacientes são gerados em shards (em paralelo quando workers > 1) e inseridos lote a lote.
+    Com seed, o conteúdo gerado é reprodutível para a mesma data de referência.
+    """
     
     with app.app_context():
         print("Criando tabelas...")
@@ -107,8 +196,13 @@ def populate_database(app):
         # Verificar se já existem dados
         if Patient.query.count() > 0:
             print("Banco de dados já contém dados. Limpando...")
-            # Limpar dados existentes
+            # Limpar dados existentes; os problemas saem antes das tabelas derivadas, pois o
+            # gatilho de DELETE desconta cada problema do rollup (que precisa terminar vazio)
             DataQualityIssue.query.delete()
+            existing_tables = inspect(db.engine).get_table_names()
+            for table_name in DERIVED_TABLES:
+                if table_name in existing_tables:
+                    db.session.execute(text(f"DELETE FROM {table_name}"))
             MedicalRecord.query.delete()
             Patient.query.delete()
             HealthSystem.query.delete()
@@ -117,11 +211,20 @@ def populate_database(app):
             db.session.commit()
         
         print("Gerando dados fictícios...")
-        generator = HealthDataGenerator()
-        dataset = generator.generate_complete_dataset(num_patients=500, num_records_per_patient=5)
+        # Com seed, as datas são relativas ao início do dia para que execuções no mesmo dia coincidam
+        now = datetime.utcnow()
+        reference_time = now.replace(hour=0, minute=0, second=0, microsecond=0) if seed is not None else now
+        generator = HealthDataGenerator(
+            seed=shard_seed(seed, 'base') if seed is not None else None,
+            reference_time=reference_time
+        )
+        users = [generator.generate_user('admin')]
+        users[0]['username'] = 'admin'
+        users[0]['email'] = 'admin@healthgraph.com'
+        users.extend(generator.generate_user() for _ in range(10))
         
         print("Inserindo usuários...")
-        for user_data in dataset['users']:
+        for user_data in users:
             user = User(
                 username=user_data['username'],
                 email=user_data['email'],
@@ -134,99 +237,73 @@ def populate_database(app):
             db.session.add(user)
         
         db.session.commit()
-        print(f"✓ {len(dataset['users'])} usuários inseridos")
-        
-        print("Inserindo sistemas de saúde...")
-        for system_data in dataset['health_systems']:
-            system = HealthSystem(
-                name=system_data['name'],
-                system_type=system_data['system_type'],
-                status=system_data['status'],
-                last_sync=system_data['last_sync'],
-                sync_frequency=system_data['sync_frequency'],
-                description=system_data['description']
-            )
-            db.session.add(system)
-        
-        db.session.commit()
-        print(f"✓ {len(dataset['health_systems'])} sistemas de saúde inseridos")
-        
-        print("Inserindo pacientes...")
-        patient_id_map = {}
-        for i, patient_data in enumerate(dataset['patients']):
-            patient = Patient(
-                patient_id=patient_data['patient_id'],
-                name=patient_data['name'],
-                cpf=patient_data['cpf'],
-                birth_date=patient_data['birth_date'],
-                gender=patient_data['gender'],
-                phone=patient_data['phone'],
-                email=patient_data['email'],
-                address=patient_data['address']
-            )
-            db.session.add(patient)
-            db.session.flush()  # Para obter o ID
-            patient_id_map[i + 1] = patient.id
-        
-        db.session.commit()
-        print(f"✓ {len(dataset['patients'])} pacientes inseridos")
-        
-        print("Inserindo registros médicos...")
-        for record_data in dataset['medical_records']:
-            # Mapear patient_id do dataset para o ID real do banco
-            real_patient_id = patient_id_map.get(record_data['patient_id'])
-            if real_patient_id:
-                record = MedicalRecord(
-                    patient_id=real_patient_id,
-                    record_type=record_data['record_type'],
-                    description=record_data['description'],
-                    doctor_name=record_data['doctor_name'],
-                    department=record_data['department'],
-                    system_source=record_data['system_source'],
-                    record_date=record_data['record_date']
-                )
-                db.session.add(record)
-        
-        db.session.commit()
-        print(f"✓ {len(dataset['medical_records'])} registros médicos inseridos")
+        print(f"✓ {len(users)} usuários inseridos")
         
-        print("Inserindo problemas de qualidade...")
-        for issue_data in dataset['data_quality_issues']:
-            # Mapear patient_id se existir
-            real_patient_id = None
-            if issue_data['patient_id']:
-                real_patient_id = patient_id_map.get(issue_data['patient_id'])
+        # Demais tabelas: carga em massa em uma única transação
+        with BulkLoader(db.engine) as loader:
+            print("Inserindo sistemas de saúde...")
+            systems = [generator.generate_health_system(system_data) for system_data in generator.health_systems]
+            system_ids = loader.insert('health_systems', (
+                {
+                    'name': system_data['name'],
+                    'system_type': system_data['system_type'],
+                    'status': system_data['status'],
+                    'last_sync': system_data['last_sync'],
+                    'sync_frequency': system_data['sync_frequency'],
+                    'description': system_data['description']
+                }
+                for system_data in systems
+            ))
+            print(f"✓ {len(system_ids)} sistemas de saúde inseridos")
             
-            issue = DataQualityIssue(
-                patient_id=real_patient_id,
-                system_id=issue_data['system_id'],
-                issue_type=issue_data['issue_type'],
-                priority=issue_data['priority'],
-                title=issue_data['title'],
-                description=issue_data['description'],
-                status=issue_data['status'],
-                detected_at=issue_data['detected_at'],
-                resolved_at=issue_data.get('resolved_at'),
-                resolution_time=issue_data.get('resolution_time')
+            print(f"Gerando e inserindo {num_patients} pacientes...")
+            chunks = iter_dataset_chunks(
+                num_patients, num_records_per_patient,
+                seed=seed if seed is not None else random.randrange(2**32),
+                reference_time=reference_time,
+                workers=workers
             )
-            db.session.add(issue)
-        
-        db.session.commit()
-        print(f"✓ {len(dataset['data_quality_issues'])} problemas de qualidade inseridos")
-        
-        print("Inserindo métricas do dashboard...")
-        for metric_data in dataset['dashboard_metrics']:
-            metric = DashboardMetrics(
-                metric_name=metric_data['metric_name'],
-                metric_value=metric_data['metric_value'],
-                metric_unit=metric_data['metric_unit'],
-                department=metric_data['department'],
-                calculated_at=metric_data['calculated_at']
-            )
-            db.session.add(metric)
+            for chunk in chunks:
+                _load_patient_chunk(loader, chunk, system_ids, now)
+                print(f"Progresso: {chunk['stop'] - 1}/{num_patients} pacientes")
+            
+            print("Inserindo problemas de qualidade do sistema...")
+            loader.insert('data_quality_issues', (
+                _issue_row(issue_data, system_ids, None) for issue_data in generator.generate_system_issues()
+            ))
+            
+            for table_name in ('patients', 'medical_records', 'data_quality_issues'):
+                print(f"✓ {loader.stats[table_name]['rows']} linhas em {table_name}")
+            
+            print("Inserindo métricas do dashboard...")
+            metrics = [
+                generator.generate_dashboard_metric(metric, dept)
+                for metric in ['completeness_rate', 'data_quality_score', 'resolution_time', 'system_availability']
+                for dept in generator.departments
+            ]
+            loader.insert('dashboard_metrics', (
+                {
+                    'metric_name': metric_data['metric_name'],
+                    'metric_value': metric_data['metric_value'],
+                    'metric_unit': metric_data['metric_unit'],
+                    'department': metric_data['department'],
+                    'calculated_at': metric_data['calculated_at']
+                }
+                for metric_data in metrics
+            ))
+            print(f"✓ {len(metrics)} métricas inseridas")
+            
+            print("Inserindo histórico de sincronizações...")
+            loader.insert('sync_logs', (
+                dict(log_data, system_id=system_id)
+                for system_id, system_data in zip(system_ids, systems)
+                for log_data in generator.generate_sync_history(system_data)
+            ))
+            print(f"✓ {loader.stats['sync_logs']['rows']} logs de sincronização inseridos")
         
-        db.session.commit()
-        print(f"✓ {len(dataset['dashboard_metrics'])} métricas inseridas")
+        print("\nDesempenho da carga:")
+        for line in loader.report():
+            print(f"- {line}")
         
         print("\n🎉 Banco de dados populado com sucesso!")
         print("\nResumo dos dados inseridos:")
@@ -247,5 +324,9 @@ if __name__ == "__main__":
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.init_app(app)
-    populate_database(app)
+    num_patients = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_records_per_patient = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    populate_database(app, num_patients, num_records_per_patient, seed, workers)
 
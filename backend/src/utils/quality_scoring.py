@@ -0,0 +1,337 @@
+"""
+Motor de pontuação de completude e consistência dos dados
+
+As colunas são lidas em lotes como indicadores numéricos (preenchido / formato válido)
+e agregadas com NumPy, sem instanciar objetos ORM. Os resultados são gravados em
+DashboardMetrics (uma linha por métrica, substituída a cada cálculo) para que a API leia números
+pré-calculados; a leitura nunca dispara a varredura, no máximo um recálculo em segundo plano.
+
+Uso: python src/utils/quality_scoring.py [caminho/para/healthgraph.db]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import threading
+import time
+from datetime import datetime
+from itertools import chain
+import numpy as np
+from flask import current_app
+from sqlalchemy import case, func, select
+from src.database import db
+from src.models.patient import Patient, MedicalRecord, HealthSystem, DataQualityIssue, DashboardMetrics
+
+PATIENT_FIELDS = ['name', 'cpf', 'birth_date', 'gender', 'phone', 'email', 'address']
+RECORD_FIELDS = ['record_type', 'description', 'doctor_name', 'department', 'system_source', 'record_date']
+
+# Problemas que indicam divergência do mesmo paciente entre sistemas
+CONSISTENCY_ISSUE_TYPES = ('conflict', 'duplicate')
+
+CPF_PATTERN = '[0-9][0-9][0-9].[0-9][0-9][0-9].[0-9][0-9][0-9]-[0-9][0-9]'
+
+# Métricas globais gravadas pelo motor (department nulo)
+GLOBAL_METRICS = ('completeness_rate', 'patient_completeness', 'record_completeness',
+                  'consistency_rate', 'format_validity', 'cross_system_consistency', 'data_freshness')
+# Completude por departamento, separada das métricas por departamento da carga inicial
+DEPARTMENT_METRIC = 'record_completeness'
+
+_refresh_lock = threading.Lock()
+_refresh_running = False
+
+
+def filled_expression(column):
+    """1 se a coluna tem valor não vazio, 0 caso contrário"""
+    return case((func.length(func.trim(func.coalesce(column, ''))) > 0, 1), else_=0)
+
+
+def patient_completeness_expression():
+    """Percentual de campos preenchidos de um paciente, calculado no SQL"""
+    filled = sum(filled_expression(getattr(Patient, field)) for field in PATIENT_FIELDS)
+    return filled * 100.0 / len(PATIENT_FIELDS)
+
+
+def patient_completeness(patient):
+    """Percentual de campos preenchidos de um paciente já carregado"""
+    filled = sum(1 for field in PATIENT_FIELDS if str(getattr(patient, field) or '').strip())
+    return round(filled * 100.0 / len(PATIENT_FIELDS), 1)
+
+
+def _percentage(part, total):
+    return round(float(part) / float(total) * 100, 1) if total else 0.0
+
+
+def _iter_matrices(statement, width, batch_size):
+    """Executa a consulta em lotes e devolve cada lote como matriz int8 (linhas x colunas)"""
+    result = db.session.execute(statement, execution_options={'yield_per': batch_size})
+    for partition in result.partitions():
+        yield np.fromiter(
+            chain.from_iterable(partition), dtype=np.int8, count=len(partition) * width
+        ).reshape(-1, width)
+
+
+class QualityScorer:
+    """Calcula completude por campo, consistência e atualização dos sistemas"""
+
+    def __init__(self, batch_size=100000):
+        self.batch_size = batch_size
+
+    def score(self):
+        """Executa todas as pontuações e retorna um dicionário com os resultados"""
+        started = time.perf_counter()
+
+        patients = self._score_patients()
+        records = self._score_records()
+        cross_system = self._score_cross_system()
+
+        # Completude geral: células preenchidas sobre células esperadas nas duas tabelas
+        filled_cells = patients['filled_cells'] + records['filled_cells']
+        total_cells = patients['total_cells'] + records['total_cells']
+
+        format_validity = patients['format_validity']
+        consistency_rate = round((format_validity + cross_system) / 2, 1)
+
+        return {
+            'completeness_rate': _percentage(filled_cells, total_cells),
+            'patient_completeness': _percentage(patients['filled_cells'], patients['total_cells']),
+            'record_completeness': _percentage(records['filled_cells'], records['total_cells']),
+            'consistency_rate': consistency_rate,
+            'format_validity': format_validity,
+            'cross_system_consistency': cross_system,
+            'data_freshness': self._score_freshness(),
+            'patient_fields': patients['fields'],
+            'record_fields': records['fields'],
+            'departments': records['departments'],
+            'total_patients': patients['rows'],
+            'total_records': records['rows'],
+            'elapsed_seconds': round(time.perf_counter() - started, 2)
+        }
+
+    def _score_patients(self):
+        columns = [filled_expression(getattr(Patient, field)) for field in PATIENT_FIELDS]
+        # Validade de formato (CPF formatado, e-mail e telefone plausíveis)
+        columns += [
+            case((Patient.cpf.op('GLOB')(CPF_PATTERN), 1), else_=0),
+            case((Patient.email.like('%_@_%._%'), 1), else_=0),
+            case((func.length(Patient.phone) >= 8, 1), else_=0)
+        ]
+        width = len(columns)
+
+        totals = np.zeros(width, dtype=np.int64)
+        rows = 0
+        for matrix in _iter_matrices(select(*columns), width, self.batch_size):
+            totals += matrix.sum(axis=0, dtype=np.int64)
+            rows += matrix.shape[0]
+
+        field_totals = totals[:len(PATIENT_FIELDS)]
+        valid_totals = totals[len(PATIENT_FIELDS):]
+        # Formato avaliado apenas sobre campos preenchidos (cpf, email, phone)
+        filled_checked = np.array([
+            field_totals[PATIENT_FIELDS.index('cpf')],
+            field_totals[PATIENT_FIELDS.index('email')],
+            field_totals[PATIENT_FIELDS.index('phone')]
+        ])
+
+        return {
+            'rows': rows,
+            'filled_cells': int(field_totals.sum()),
+            'total_cells': rows * len(PATIENT_FIELDS),
+            'fields': {
+                field: _percentage(field_totals[i], rows) for i, field in enumerate(PATIENT_FIELDS)
+            },
+            'format_validity': _percentage(valid_totals.sum(), filled_checked.sum())
+        }
+
+    def _score_records(self):
+        columns = [filled_expression(getattr(MedicalRecord, field)) for field in RECORD_FIELDS]
+        width = len(columns)
+
+        totals = np.zeros(width, dtype=np.int64)
+        rows = 0
+        for matrix in _iter_matrices(select(*columns), width, self.batch_size):
+            totals += matrix.sum(axis=0, dtype=np.int64)
+            rows += matrix.shape[0]
+
+        # Completude por departamento: agregação no SQL sobre os mesmos indicadores
+        filled = sum(filled_expression(getattr(MedicalRecord, field)) for field in RECORD_FIELDS)
+        department_rows = db.session.execute(
+            select(
+                MedicalRecord.department,
+                func.count(MedicalRecord.id),
+                func.sum(filled)
+            ).where(
+                MedicalRecord.department.isnot(None)
+            ).group_by(MedicalRecord.department)
+        ).all()
+
+        departments = {}
+        if department_rows:
+            names = [row[0] for row in department_rows]
+            counts = np.array([row[1] for row in department_rows], dtype=np.int64)
+            filled_cells = np.array([row[2] or 0 for row in department_rows], dtype=np.int64)
+            rates = np.round(filled_cells / (counts * len(RECORD_FIELDS)) * 100, 1)
+            departments = dict(zip(names, rates.tolist()))
+
+        return {
+            'rows': rows,
+            'filled_cells': int(totals.sum()),
+            'total_cells': rows * len(RECORD_FIELDS),
+            'fields': {
+                field: _percentage(totals[i], rows) for i, field in enumerate(RECORD_FIELDS)
+            },
+            'departments': departments
+        }
+
+    def _score_cross_system(self):
+        """Percentual de pacientes presentes em mais de um sistema sem conflitos abertos"""
+        systems_per_patient = db.session.execute(
+            select(
+                MedicalRecord.patient_id,
+                func.count(func.distinct(MedicalRecord.system_source))
+            ).group_by(MedicalRecord.patient_id)
+        ).all()
+        if not systems_per_patient:
+            return 100.0
+
+        data = np.array(systems_per_patient, dtype=np.int64)
+        multi_system = data[data[:, 1] > 1, 0]
+        if multi_system.size == 0:
+            return 100.0
+
+        conflicting = np.fromiter(
+            db.session.execute(
+                select(DataQualityIssue.patient_id).where(
+                    DataQualityIssue.status == 'open',
+                    DataQualityIssue.issue_type.in_(CONSISTENCY_ISSUE_TYPES),
+                    DataQualityIssue.patient_id.isnot(None)
+                ).distinct()
+            ).scalars(),
+            dtype=np.int64
+        )
+
+        inconsistent = np.isin(multi_system, conflicting).sum()
+        return _percentage(multi_system.size - inconsistent, multi_system.size)
+
+    def _score_freshness(self):
+        """Percentual de sistemas sincronizados dentro de duas vezes a frequência configurada"""
+        systems = db.session.execute(
+            select(HealthSystem.last_sync, HealthSystem.sync_frequency)
+        ).all()
+        if not systems:
+            return 0.0
+
+        now = datetime.utcnow()
+        age_minutes = np.array([
+            (now - last_sync).total_seconds() / 60 if last_sync else np.inf
+            for last_sync, _ in systems
+        ])
+        frequency = np.array([frequency or 60 for _, frequency in systems], dtype=np.float64)
+        return _percentage((age_minutes <= frequency * 2).sum(), len(systems))
+
+
+def store_quality_scores(scores):
+    """Substitui os resultados gravados em DashboardMetrics (department nulo = valor global)"""
+    now = datetime.utcnow()
+    metrics = []
+
+    for name in GLOBAL_METRICS:
+        metrics.append(DashboardMetrics(
+            metric_name=name, metric_value=scores[name], metric_unit='%', calculated_at=now
+        ))
+
+    for field, value in scores['patient_fields'].items():
+        metrics.append(DashboardMetrics(
+            metric_name=f'completeness_patient_{field}', metric_value=value, metric_unit='%', calculated_at=now
+        ))
+    for field, value in scores['record_fields'].items():
+        metrics.append(DashboardMetrics(
+            metric_name=f'completeness_record_{field}', metric_value=value, metric_unit='%', calculated_at=now
+        ))
+    for department, value in scores['departments'].items():
+        metrics.append(DashboardMetrics(
+            metric_name=DEPARTMENT_METRIC, metric_value=value, metric_unit='%',
+            department=department, calculated_at=now
+        ))
+
+    # Só o cálculo mais recente é mantido: a tabela não cresce a cada recálculo
+    field_metrics = [f'completeness_patient_{field}' for field in PATIENT_FIELDS]
+    field_metrics += [f'completeness_record_{field}' for field in RECORD_FIELDS]
+    DashboardMetrics.query.filter(
+        (DashboardMetrics.metric_name.in_(GLOBAL_METRICS) & DashboardMetrics.department.is_(None)) |
+        DashboardMetrics.metric_name.in_(field_metrics) |
+        (DashboardMetrics.metric_name == DEPARTMENT_METRIC)
+    ).delete(synchronize_session=False)
+
+    db.session.add_all(metrics)
+    db.session.commit()
+    return len(metrics)
+
+
+def refresh_quality_scores(batch_size=100000):
+    """Recalcula e persiste as pontuações de qualidade"""
+    scores = QualityScorer(batch_size=batch_size).score()
+    store_quality_scores(scores)
+    return scores
+
+
+def refresh_quality_scores_in_background():
+    """Dispara o recálculo em uma thread (no máximo um por vez)"""
+    global _refresh_running
+    with _refresh_lock:
+        if _refresh_running:
+            return
+        _refresh_running = True
+    app = current_app._get_current_object()
+
+    def _run():
+        global _refresh_running
+        try:
+            with app.app_context():
+                refresh_quality_scores()
+        finally:
+            with _refresh_lock:
+                _refresh_running = False
+
+    threading.Thread(target=_run, name='quality-scores-refresh', daemon=True).start()
+
+
+def get_latest_metric(metric_name, department=None, default=None):
+    """Valor mais recente de uma métrica pré-calculada"""
+    value = db.session.query(DashboardMetrics.metric_value).filter(
+        DashboardMetrics.metric_name == metric_name,
+        DashboardMetrics.department.is_(None) if department is None else DashboardMetrics.department == department
+    ).order_by(DashboardMetrics.calculated_at.desc()).limit(1).scalar()
+    return default if value is None else round(value, 1)
+
+
+def get_quality_score(metric_name):
+    """Pontuação global pré-calculada; None enquanto o primeiro cálculo (em segundo plano) não termina"""
+    value = get_latest_metric(metric_name)
+    if value is None:
+        refresh_quality_scores_in_background()
+    return value
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from src.models.auth import User, UserSession
+    from src.models.quality import PatientBlockingKey, DuplicateCandidate
+    from src.utils.migrations import apply_migrations
+
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else default_path)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        scores = refresh_quality_scores()
+
+    for key in ('completeness_rate', 'consistency_rate', 'data_freshness', 'total_patients',
+                'total_records', 'elapsed_seconds'):
+        print(f"- {key}: {scores[key]}")
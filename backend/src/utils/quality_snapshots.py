@@ -0,0 +1,335 @@
+"""
+Série temporal diária de qualidade (quality_snapshots)
+
+Uma linha por dia com pontuação de qualidade, completude, consistência, disponibilidade dos
+sistemas e contagens de problemas. As contagens vêm do rollup de problemas e podem ser
+reconstruídas para dias passados; as pontuações só existem a partir do dia em que o job rodou.
+
+As tendências agregam a série no SQL em baldes de dia, semana ou mês, de modo que intervalos
+longos devolvem um número limitado de pontos.
+
+Uso: python src/utils/quality_snapshots.py [caminho/para/healthgraph.db] [dias_de_historico]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert
+from src.database import db
+from src.models.patient import HealthSystem
+from src.models.quality import IssueMetricsRollup, QualitySnapshot
+from src.utils.quality_scoring import get_latest_metric, refresh_quality_scores
+
+# Tamanho aproximado de cada balde em dias (para limitar a quantidade de pontos)
+BUCKET_DAYS = {'day': 1, 'week': 7, 'month': 30}
+MAX_TREND_POINTS = 120
+MAX_TREND_DAYS = 3650
+
+# Histórico reconstruído na primeira execução do job
+MAX_HISTORY_DAYS = 3650
+
+# Idade máxima do snapshot do dia antes de a leitura das tendências pedir um novo
+SNAPSHOT_MAX_AGE = timedelta(hours=1)
+
+COUNT_COLUMNS = ('open_issues', 'detected_issues', 'resolved_issues')
+
+# Job disparado pela leitura: no máximo uma thread por processo
+_snapshot_lock = threading.Lock()
+_snapshot_running = False
+
+
+def choose_bucket(days, bucket=None):
+    """Balde pedido (ou automático) promovido até caber em MAX_TREND_POINTS pontos"""
+    if bucket is not None and bucket not in BUCKET_DAYS:
+        raise ValueError(f'Agrupamento inválido: {bucket} (use day, week ou month)')
+
+    names = list(BUCKET_DAYS)
+    position = names.index(bucket) if bucket else 0
+    while position < len(names) - 1 and days / BUCKET_DAYS[names[position]] > MAX_TREND_POINTS:
+        position += 1
+    return names[position]
+
+
+def bucket_expression(bucket):
+    """Data inicial do balde (texto YYYY-MM-DD) calculada no SQLite"""
+    if bucket == 'week':
+        # Segunda-feira da semana: recua 6 dias e avança até a próxima segunda
+        return func.date(QualitySnapshot.day, '-6 days', 'weekday 1')
+    if bucket == 'month':
+        return func.strftime('%Y-%m-01', QualitySnapshot.day)
+    return func.date(QualitySnapshot.day)
+
+
+def _issue_history(start, end):
+    """Detectados, resolvidos e em aberto ao final de cada dia entre start e end (do rollup)"""
+    detected = func.sum(case((IssueMetricsRollup.status == 'detected', IssueMetricsRollup.issue_count), else_=0))
+    resolved = func.sum(case((IssueMetricsRollup.status == 'resolved', IssueMetricsRollup.issue_count), else_=0))
+
+    # Todo o histórico até end: o total em aberto é o acumulado de detectados menos resolvidos
+    rows = db.session.execute(
+        select(IssueMetricsRollup.day, detected, resolved).where(
+            IssueMetricsRollup.status.in_(('detected', 'resolved')),
+            IssueMetricsRollup.day <= end
+        ).group_by(IssueMetricsRollup.day).order_by(IssueMetricsRollup.day)
+    ).all()
+
+    by_day = {day: (detected_count or 0, resolved_count or 0) for day, detected_count, resolved_count in rows}
+    open_issues = sum(
+        detected_count - resolved_count
+        for day, (detected_count, resolved_count) in by_day.items() if day < start
+    )
+
+    history = []
+    day = start
+    while day <= end:
+        detected_count, resolved_count = by_day.get(day, (0, 0))
+        open_issues += detected_count - resolved_count
+        history.append({
+            'day': day,
+            'open_issues': open_issues,
+            'detected_issues': detected_count,
+            'resolved_issues': resolved_count
+        })
+        day += timedelta(days=1)
+    return history
+
+
+def record_issue_history(start, end, now=None):
+    """Grava (ou atualiza) as contagens de problemas de cada dia do intervalo"""
+    now = now or datetime.utcnow()
+    rows = [dict(row, calculated_at=now) for row in _issue_history(start, end)]
+    if not rows:
+        return 0
+
+    statement = insert(QualitySnapshot)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[QualitySnapshot.day],
+        set_={name: statement.excluded[name] for name in COUNT_COLUMNS + ('calculated_at',)}
+    ), rows)
+    return len(rows)
+
+
+def system_availability():
+    """Percentual de sistemas que não estão offline"""
+    total, offline = db.session.execute(
+        select(
+            func.count(HealthSystem.id),
+            func.sum(case((HealthSystem.status == 'offline', 1), else_=0))
+        )
+    ).one()
+    return round((total - (offline or 0)) * 100.0 / total, 1) if total else 0.0
+
+
+def take_quality_snapshot(day=None, now=None):
+    """Grava as pontuações atuais no dia informado (hoje por padrão)"""
+    now = now or datetime.utcnow()
+    day = day or now.date()
+
+    completeness = get_latest_metric('completeness_rate')
+    consistency = get_latest_metric('consistency_rate')
+    freshness = get_latest_metric('data_freshness')
+    components = [value for value in (completeness, consistency, freshness) if value is not None]
+
+    scores = {
+        'quality_score': round(sum(components) / len(components), 1) if components else None,
+        'completeness_rate': completeness,
+        'consistency_rate': consistency,
+        'system_availability': system_availability()
+    }
+
+    statement = insert(QualitySnapshot).values(day=day, calculated_at=now, **scores)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[QualitySnapshot.day],
+        set_=dict(scores, calculated_at=now)
+    ))
+    return dict(scores, day=day.isoformat())
+
+
+def _claim_snapshot(now):
+    """Marca o snapshot de hoje como em cálculo, em uma transação curta já confirmada
+
+    Retorna False se o snapshot já está atualizado ou se outro processo o marcou há menos de
+    SNAPSHOT_MAX_AGE (a marcação grava calculated_at antes das pontuações).
+    """
+    stale_before = now - SNAPSHOT_MAX_AGE
+    statement = insert(QualitySnapshot).values(day=now.date(), calculated_at=now)
+    result = db.session.execute(statement.on_conflict_do_update(
+        index_elements=[QualitySnapshot.day],
+        set_={'calculated_at': now},
+        where=QualitySnapshot.calculated_at < stale_before
+    ))
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def _release_claim(now):
+    """Desfaz a marcação de um job que falhou: o snapshot volta a ser considerado desatualizado"""
+    db.session.query(QualitySnapshot).filter(
+        QualitySnapshot.day == now.date(),
+        QualitySnapshot.calculated_at == now
+    ).update({'calculated_at': now - SNAPSHOT_MAX_AGE - timedelta(seconds=1)}, synchronize_session=False)
+    db.session.commit()
+
+
+def run_snapshot_job(history_days=None, refresh_scores=False, now=None, claim=False):
+    """Job diário: atualiza as contagens pendentes e grava as pontuações do dia
+
+    Sem history_days, recalcula desde o último dia gravado antes de hoje (para completar o
+    dia anterior) ou, na primeira execução, desde o primeiro dia do rollup. Com claim, só roda
+    se o snapshot de hoje continua desatualizado (retorna None caso contrário).
+    """
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    today = now.date()
+
+    # A marcação é confirmada antes do cálculo: o recálculo das pontuações não roda com a
+    # trava de escrita do banco presa, e processos concorrentes veem a marcação e desistem
+    if claim and not _claim_snapshot(now):
+        return None
+
+    try:
+        if history_days is not None:
+            start = today - timedelta(days=max(history_days - 1, 0))
+        else:
+            start = db.session.query(func.max(QualitySnapshot.day)).filter(QualitySnapshot.day < today).scalar()
+            if start is None:
+                start = db.session.query(func.min(IssueMetricsRollup.day)).scalar() or today
+        start = max(min(start, today), today - timedelta(days=MAX_HISTORY_DAYS - 1))
+
+        # O job é quem calcula as pontuações quando ainda não existem (a leitura não calcula)
+        if refresh_scores or get_latest_metric('completeness_rate') is None:
+            refresh_quality_scores()
+        days = record_issue_history(start, today, now)
+        snapshot = take_quality_snapshot(today, now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if claim:
+            _release_claim(now)
+        raise
+
+    return {
+        'snapshot': snapshot,
+        'history_start': start.isoformat(),
+        'days_recorded': days,
+        'elapsed_seconds': round(time.perf_counter() - started, 4)
+    }
+
+
+def run_snapshot_job_in_background():
+    """Dispara o job em uma thread (no máximo um por vez neste processo)"""
+    global _snapshot_running
+    with _snapshot_lock:
+        if _snapshot_running:
+            return
+        _snapshot_running = True
+    app = current_app._get_current_object()
+
+    def _run():
+        global _snapshot_running
+        try:
+            with app.app_context():
+                run_snapshot_job(claim=True)
+        finally:
+            with _snapshot_lock:
+                _snapshot_running = False
+
+    threading.Thread(target=_run, name='quality-snapshot-job', daemon=True).start()
+
+
+def ensure_recent_snapshot(now=None):
+    """Pede um novo snapshot (fora da requisição) se o de hoje não existe ou está desatualizado
+
+    A leitura não espera o job: usa a série já gravada.
+    """
+    now = now or datetime.utcnow()
+    calculated_at = db.session.query(QualitySnapshot.calculated_at).filter(
+        QualitySnapshot.day == now.date(),
+        QualitySnapshot.quality_score.isnot(None)
+    ).scalar()
+    if calculated_at is None or now - calculated_at > SNAPSHOT_MAX_AGE:
+        run_snapshot_job_in_background()
+
+
+def get_quality_trends(days=30, bucket=None, now=None):
+    """Série dos últimos N dias agrupada em baldes (médias das pontuações, somas das contagens)"""
+    if days < 1:
+        raise ValueError('days deve ser positivo')
+    days = min(days, MAX_TREND_DAYS)
+    bucket = choose_bucket(days, bucket)
+
+    now = now or datetime.utcnow()
+    ensure_recent_snapshot(now)
+    start = now.date() - timedelta(days=days - 1)
+
+    key = bucket_expression(bucket).label('bucket')
+    rows = db.session.execute(
+        select(
+            key,
+            func.avg(QualitySnapshot.quality_score),
+            func.avg(QualitySnapshot.completeness_rate),
+            func.avg(QualitySnapshot.consistency_rate),
+            func.avg(QualitySnapshot.system_availability),
+            func.avg(QualitySnapshot.open_issues),
+            func.sum(QualitySnapshot.detected_issues),
+            func.sum(QualitySnapshot.resolved_issues),
+            func.count(QualitySnapshot.id)
+        ).where(QualitySnapshot.day >= start).group_by(key).order_by(key)
+    ).all()
+
+    def _round(value):
+        return round(value, 1) if value is not None else None
+
+    points = [{
+        'date': bucket_start,
+        'quality_score': _round(quality),
+        'completeness_rate': _round(completeness),
+        'consistency_rate': _round(consistency),
+        'system_availability': _round(availability),
+        'open_issues': int(round(open_issues or 0)),
+        'detected_issues': detected or 0,
+        'resolved_issues': resolved or 0,
+        'days': count
+    } for bucket_start, quality, completeness, consistency, availability, open_issues, detected, resolved, count in rows]
+
+    return {'bucket': bucket, 'days': days, 'points': points}
+
+
+def series(trends, key, label):
+    """Pontos de uma métrica no formato [{'date', label}], omitindo baldes sem valor"""
+    return [
+        {'date': point['date'], label: point[key]}
+        for point in trends['points'] if point[key] is not None
+    ]
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from src.models.auth import User, UserSession
+    from src.models.patient import Patient, MedicalRecord, DataQualityIssue, DashboardMetrics
+    from src.models.quality import PatientBlockingKey, DuplicateCandidate
+    from src.utils.migrations import apply_migrations
+
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else default_path)
+    history_days = int(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        result = run_snapshot_job(history_days=history_days, refresh_scores=True)
+
+    print(f"✓ Snapshot de {result['snapshot']['day']}: qualidade {result['snapshot']['quality_score']}, "
+          f"{result['days_recorded']} dias de histórico desde {result['history_start']} "
+          f"({result['elapsed_seconds']}s)")
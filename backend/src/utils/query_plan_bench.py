@@ -0,0 +1,171 @@
+"""
+Bench dos planos de consulta antes e depois dos índices declarados nos modelos
+
+Uso: python src/utils/query_plan_bench.py [caminho/para/healthgraph.db] [repetições]
+
+Inclui os candidatos da busca de problemas semelhantes (FTS5) com todos os termos e só com os
+mais seletivos. Trabalha sobre uma cópia temporária do banco; o arquivo original não é alterado.
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import shutil
+import sqlite3
+import tempfile
+import time
+from sqlalchemy import create_engine
+from src.database import db
+from src.utils.migrations import apply_migrations
+
+# Formatos reais das consultas de dashboard.py, issues.py e patients.py
+QUERY_SHAPES = [
+    ('dashboard: problemas abertos de alta prioridade',
+     "SELECT count(*) FROM data_quality_issues WHERE status = 'open' AND priority = 'high'"),
+    ('dashboard: duplicidades abertas',
+     "SELECT count(*) FROM data_quality_issues WHERE issue_type = 'duplicate' AND status = 'open'"),
+    ('dashboard: alertas prioritários',
+     "SELECT id FROM data_quality_issues WHERE status = 'open' AND priority = 'high' "
+     "ORDER BY detected_at DESC LIMIT 10"),
+    ('issues: listagem filtrada por tipo',
+     "SELECT id FROM data_quality_issues WHERE status = 'open' AND issue_type = 'missing' "
+     "ORDER BY detected_at DESC LIMIT 20"),
+    ('issues: histórico de resoluções',
+     "SELECT id FROM data_quality_issues WHERE status = 'resolved' ORDER BY resolved_at DESC LIMIT 10"),
+    ('issues: resolvidos no mês',
+     "SELECT count(*) FROM data_quality_issues WHERE status = 'resolved' "
+     "AND resolved_at >= datetime('now', '-30 days')"),
+    ('issues: detectados no mês',
+     "SELECT count(*) FROM data_quality_issues WHERE detected_at >= datetime('now', '-30 days')"),
+    ('patients: problemas abertos da página',
+     "SELECT patient_id, count(id) FROM data_quality_issues WHERE patient_id IN (1, 2, 3, 4, 5) "
+     "AND status = 'open' GROUP BY patient_id"),
+    ('patients: registros da página',
+     "SELECT patient_id, count(id) FROM medical_records WHERE patient_id IN (1, 2, 3, 4, 5) "
+     "GROUP BY patient_id"),
+    ('patients: timeline do paciente',
+     "SELECT id FROM medical_records WHERE patient_id = 1 ORDER BY record_date DESC"),
+    ('patients: busca por nome (prefixo)',
+     "SELECT id FROM patients WHERE name >= 'Ma' AND name < 'Mb' ORDER BY name LIMIT 20"),
+]
+
+
+def declared_indexes():
+    """Nomes dos índices declarados nos modelos"""
+    from src.models.patient import Patient, MedicalRecord, DataQualityIssue
+    names = []
+    for model in (Patient, MedicalRecord, DataQualityIssue):
+        names.extend(index.name for index in model.__table__.indexes)
+    return names
+
+
+def measure(connection, repetitions):
+    """Plano e tempo médio (ms) de cada consulta"""
+    results = []
+    for label, sql in QUERY_SHAPES:
+        plan = [row[3] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            connection.execute(sql).fetchall()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repetitions
+        results.append((label, plan, elapsed_ms))
+    return results
+
+
+# Candidatos de problemas semelhantes (mesma subconsulta de text_search.find_similar_issues)
+SIMILAR_CANDIDATES_SQL = (
+    "SELECT rowid, bm25(data_quality_issues_fts, 2.0, 1.0) AS score FROM data_quality_issues_fts "
+    "WHERE data_quality_issues_fts MATCH ? AND rowid != ? ORDER BY {order} LIMIT 50"
+)
+
+
+def measure_similar_issues(connection, repetitions, samples=5):
+    """Tempo médio (ms) dos candidatos a semelhantes com todos os termos e só com os seletivos"""
+    from src.utils.text_search import (
+        _index_term, fts_any_query, search_terms, selective_terms, ISSUES_VOCAB
+    )
+
+    issue_ids = [row[0] for row in connection.execute(
+        "SELECT id FROM data_quality_issues ORDER BY random() LIMIT ?", (samples,)
+    )]
+    all_terms_ms = selective_ms = 0.0
+    for issue_id in issue_ids:
+        title, description = connection.execute(
+            "SELECT title, description FROM data_quality_issues WHERE id = ?", (issue_id,)
+        ).fetchone()
+        terms = search_terms(f'{title} {description}')
+        if not terms:
+            continue
+        counts = {}
+        for term in terms:
+            row = connection.execute(
+                f"SELECT doc FROM {ISSUES_VOCAB} WHERE term = ?", (_index_term(term),)
+            ).fetchone()
+            counts[term] = row[0] if row else 0
+        chosen, ranked = selective_terms(terms, counts)
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            connection.execute(
+                SIMILAR_CANDIDATES_SQL.format(order='score'), (fts_any_query(terms), issue_id)
+            ).fetchall()
+        all_terms_ms += (time.perf_counter() - start) * 1000 / repetitions
+
+        if chosen:
+            start = time.perf_counter()
+            for _ in range(repetitions):
+                connection.execute(
+                    SIMILAR_CANDIDATES_SQL.format(order='score' if ranked else 'rowid DESC'),
+                    (fts_any_query(chosen), issue_id)
+                ).fetchall()
+            selective_ms += (time.perf_counter() - start) * 1000 / repetitions
+
+    count = max(len(issue_ids), 1)
+    return all_terms_ms / count, selective_ms / count
+
+
+def run_bench(db_path, repetitions=20):
+    """Compara planos e tempos sem e com os índices declarados"""
+    workdir = tempfile.mkdtemp(prefix='hg_bench_')
+    bench_path = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(db_path, bench_path)
+
+    try:
+        connection = sqlite3.connect(bench_path)
+        for name in declared_indexes():
+            connection.execute(f"DROP INDEX IF EXISTS {name}")
+        connection.commit()
+        before = measure(connection, repetitions)
+        connection.close()
+
+        engine = create_engine(f"sqlite:///{bench_path}")
+        apply_migrations(engine)
+        engine.dispose()
+
+        connection = sqlite3.connect(bench_path)
+        after = measure(connection, repetitions)
+        similar = measure_similar_issues(connection, repetitions)
+        connection.close()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return before, after, similar
+
+
+if __name__ == "__main__":
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = sys.argv[1] if len(sys.argv) > 1 else default_path
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    before, after, similar = run_bench(os.path.abspath(db_path), repetitions)
+
+    for (label, plan_before, ms_before), (_, plan_after, ms_after) in zip(before, after):
+        print(f"\n{label}")
+        print(f"  antes ({ms_before:.2f} ms): {' | '.join(plan_before)}")
+        print(f"  depois ({ms_after:.2f} ms): {' | '.join(plan_after)}")
+
+    all_terms_ms, selective_ms = similar
+    print("\nissues: problemas semelhantes (candidatos do FTS)")
+    print(f"  todos os termos: {all_terms_ms:.2f} ms")
+    print(f"  termos seletivos: {selective_ms:.2f} ms")
@@ -0,0 +1,283 @@
+"""
+Ingestão incremental de registros médicos dos sistemas de origem
+
+Cada sistema guarda uma marca d'água (sync_watermark, sync_watermark_id): o par (updated_at, id)
+do último registro de origem já gravado. A sincronização pede apenas o que mudou depois dela,
+em páginas ordenadas por (updated_at, id):
+
+    GET {endpoint_url}/records?since=<ISO 8601>&after_id=<id em JSON>&_count=<n>
+    -> {"records": [{"id", "updated_at", "patient_id", "record_type", "description",
+                     "doctor_name", "department", "record_date"}, ...], "has_more": true|false}
+
+Cada página é gravada com um upsert em lote (system_source + external_id) na mesma transação
+que avança a marca d'água; uma falha no meio preserva as páginas anteriores e a próxima
+sincronização continua de onde parou. Os detectores de qualidade rodam só sobre os registros
+da página, nunca sobre o histórico do sistema.
+
+O id da marca d'água é guardado e enviado em JSON, com o tipo que veio da origem (after_id=10
+para ids numéricos, after_id="R10" para textos): a origem decodifica o valor e compara como o
+próprio id, sem que 10 fique antes de 9 numa comparação de texto.
+
+Um registro recente de um paciente ainda não cadastrado (a origem pode enviar o registro antes
+do paciente) segura a marca d'água: a página é gravada só até ele e a próxima sincronização o
+pede de novo. Passado PATIENT_WAIT_WINDOW, o registro é rejeitado e a marca d'água segue.
+"""
+
+import http.client
+import json
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from src.database import db
+from src.models.patient import Patient, MedicalRecord, DataQualityIssue
+
+INGEST_BATCH_SIZE = 5000
+INGEST_TIMEOUT = 30  # segundos por página
+# Páginas por sincronização: o restante fica para a próxima (a marca d'água já avançou)
+MAX_BATCHES_PER_SYNC = 200
+
+# Tempo (pelo updated_at da origem) em que um registro espera o cadastro do seu paciente
+PATIENT_WAIT_WINDOW = timedelta(days=1)
+
+KNOWN_RECORD_TYPES = ('consultation', 'exam', 'procedure', 'prescription', 'diagnosis')
+REQUIRED_FIELDS = ('id', 'updated_at', 'patient_id', 'record_type', 'description', 'record_date')
+UPSERT_COLUMNS = ('patient_id', 'record_type', 'description', 'doctor_name', 'department', 'record_date')
+
+
+class IngestionError(Exception):
+    """Falha ao ler os registros do sistema de origem"""
+
+
+def _parse_timestamp(value):
+    """Data ISO 8601 em UTC sem fuso (como as demais colunas DateTime)"""
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def fetch_changes(system, since=None, after_id=None, batch_size=INGEST_BATCH_SIZE, timeout=INGEST_TIMEOUT):
+    """Uma página de registros alterados depois da marca d'água (after_id já em JSON)"""
+    params = {'_count': batch_size}
+    if since is not None:
+        params['since'] = since.isoformat()
+        params['after_id'] = after_id or ''
+    url = f"{system.endpoint_url.rstrip('/')}/records?{urllib.parse.urlencode(params)}"
+    headers = {'Accept': 'application/json'}
+    if system.auth_token:
+        headers['Authorization'] = f'Bearer {system.auth_token}'
+
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout) as response:
+            payload = json.load(response)
+    except urllib.error.HTTPError as e:
+        raise IngestionError(f'Sistema de origem respondeu {e.code}')
+    except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+        raise IngestionError(f'Falha na conexão com o sistema de origem: {getattr(e, "reason", e)}')
+    except http.client.HTTPException as e:
+        # Resposta truncada ou malformada (IncompleteRead, BadStatusLine...)
+        raise IngestionError(f'Resposta incompleta do sistema de origem: {e.__class__.__name__}')
+    except ValueError:
+        raise IngestionError('Resposta do sistema de origem não é JSON válido')
+
+    if not isinstance(payload, dict) or not isinstance(payload.get('records'), list):
+        raise IngestionError('Resposta do sistema de origem sem a lista de registros')
+    return payload['records'], bool(payload.get('has_more'))
+
+
+def _normalize(source, patient_ids):
+    """Linha de medical_records a partir do registro de origem (None se inválido)"""
+    if not isinstance(source, dict) or any(source.get(field) in (None, '') for field in REQUIRED_FIELDS):
+        return None
+    patient_id = patient_ids.get(str(source['patient_id']))
+    if patient_id is None:
+        return None
+    try:
+        record_date = _parse_timestamp(source['record_date'])
+    except ValueError:
+        return None
+    return {
+        'external_id': str(source['id']),
+        'patient_id': patient_id,
+        'record_type': str(source['record_type']),
+        'description': str(source['description']),
+        'doctor_name': source.get('doctor_name') or None,
+        'department': source.get('department') or None,
+        'record_date': record_date
+    }
+
+
+def detect_record_issues(row, now):
+    """Problemas de qualidade de um registro ingerido: [(tipo, prioridade, título, descrição)]"""
+    issues = []
+    missing = [field for field in ('doctor_name', 'department') if not row[field]]
+    if missing:
+        issues.append((
+            'missing', 'medium', 'Campos obrigatórios ausentes no registro',
+            f"Registro {row['external_id']} sem {', '.join(missing)}"
+        ))
+    if row['record_date'] > now + timedelta(days=1):
+        issues.append((
+            'format', 'medium', 'Data do registro no futuro',
+            f"Registro {row['external_id']} com data {row['record_date'].isoformat()}"
+        ))
+    if row['record_type'] not in KNOWN_RECORD_TYPES:
+        issues.append((
+            'format', 'low', 'Tipo de registro desconhecido',
+            f"Registro {row['external_id']} com tipo '{row['record_type']}'"
+        ))
+    return issues
+
+
+def _patient_ids(sources):
+    """Ids internos dos pacientes citados na página ({patient_id da origem: id})"""
+    patient_keys = {str(source['patient_id']) for source in sources
+                    if isinstance(source, dict) and source.get('patient_id') not in (None, '')}
+    return dict(db.session.execute(
+        select(Patient.patient_id, Patient.id).where(Patient.patient_id.in_(patient_keys))
+    ).all()) if patient_keys else {}
+
+
+def _first_waiting(sources, patient_ids, now):
+    """Posição do primeiro registro recente cujo paciente ainda não existe (None se nenhum)"""
+    for position, source in enumerate(sources):
+        if not isinstance(source, dict) or source.get('patient_id') in (None, ''):
+            continue
+        if str(source['patient_id']) in patient_ids:
+            continue
+        try:
+            updated_at = _parse_timestamp(source['updated_at'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if updated_at >= now - PATIENT_WAIT_WINDOW:
+            return position
+    return None
+
+
+def _store_batch(system, sources, now, patient_ids=None):
+    """Upsert de uma página e detecção de problemas sobre ela; devolve as contagens"""
+    if patient_ids is None:
+        patient_ids = _patient_ids(sources)
+
+    # Um registro repetido na página vale pela última versão
+    rows = {}
+    rejected = 0
+    for source in sources:
+        row = _normalize(source, patient_ids)
+        if row is None:
+            rejected += 1
+            continue
+        rows[row['external_id']] = dict(row, system_source=system.name, created_at=now)
+    rows = list(rows.values())
+    if not rows:
+        return {'inserted': 0, 'updated': 0, 'rejected': rejected, 'issues': 0}
+
+    external_ids = [row['external_id'] for row in rows]
+    in_batch = (MedicalRecord.system_source == system.name) & MedicalRecord.external_id.in_(external_ids)
+    existing = set(db.session.execute(select(MedicalRecord.external_id).where(in_batch)).scalars())
+
+    statement = insert(MedicalRecord)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[MedicalRecord.system_source, MedicalRecord.external_id],
+        set_={name: statement.excluded[name] for name in UPSERT_COLUMNS}
+    ), rows)
+
+    record_ids = dict(db.session.execute(
+        select(MedicalRecord.external_id, MedicalRecord.id).where(in_batch)
+    ).all())
+
+    # Detectores só sobre o delta; um problema já aberto para o registro não é repetido
+    open_issues = set(db.session.execute(
+        select(DataQualityIssue.record_id, DataQualityIssue.title).where(
+            DataQualityIssue.record_id.in_(record_ids.values()),
+            DataQualityIssue.status != 'resolved'
+        )
+    ).all())
+    issues = []
+    for row in rows:
+        record_id = record_ids[row['external_id']]
+        for issue_type, priority, title, description in detect_record_issues(row, now):
+            if (record_id, title) in open_issues:
+                continue
+            open_issues.add((record_id, title))
+            issues.append({
+                'patient_id': row['patient_id'],
+                'system_id': system.id,
+                'record_id': record_id,
+                'issue_type': issue_type,
+                'priority': priority,
+                'title': title,
+                'description': description,
+                'status': 'open',
+                'detected_at': now
+            })
+    if issues:
+        db.session.execute(DataQualityIssue.__table__.insert(), issues)
+
+    return {'inserted': len(rows) - len(existing), 'updated': len(existing),
+            'rejected': rejected, 'issues': len(issues)}
+
+
+def ingest_system_records(system, batch_size=INGEST_BATCH_SIZE, max_batches=MAX_BATCHES_PER_SYNC):
+    """Puxa e grava os registros alterados desde a marca d'água do sistema
+
+    Cada página é confirmada junto com o avanço da marca d'água. Lança IngestionError se a
+    origem falhar; as páginas já confirmadas permanecem. waiting conta os registros deixados
+    para a próxima sincronização porque o paciente de um deles ainda não existe.
+    """
+    if not system.endpoint_url:
+        raise IngestionError('Endpoint de integração não configurado')
+
+    started = time.perf_counter()
+    stats = {'batches': 0, 'received': 0, 'inserted': 0, 'updated': 0, 'rejected': 0, 'issues': 0,
+             'waiting': 0, 'has_more': False}
+
+    for _ in range(max_batches):
+        sources, has_more = fetch_changes(system, system.sync_watermark, system.sync_watermark_id, batch_size)
+        if not sources:
+            has_more = False
+            break
+
+        now = datetime.utcnow()
+        patient_ids = _patient_ids(sources)
+        waiting = _first_waiting(sources, patient_ids, now)
+        if waiting is not None:
+            # A marca d'água para antes do registro que espera o paciente; o resto volta depois
+            stats['waiting'] = len(sources) - waiting
+            sources, has_more = sources[:waiting], False
+            if not sources:
+                break
+
+        # A página vem ordenada por (updated_at, id): o último item é a nova marca d'água
+        last = sources[-1]
+        try:
+            watermark = _parse_timestamp(last['updated_at'])
+        except (KeyError, TypeError, ValueError):
+            raise IngestionError('Registro de origem sem updated_at válido no fim da página')
+
+        try:
+            counts = _store_batch(system, sources, now, patient_ids)
+            system.sync_watermark = watermark
+            system.sync_watermark_id = json.dumps(last.get('id', ''))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        stats['batches'] += 1
+        stats['received'] += len(sources)
+        for name, value in counts.items():
+            stats[name] += value
+        if not has_more:
+            break
+
+    stats['has_more'] = has_more if stats['batches'] else False
+    elapsed = time.perf_counter() - started
+    stats['elapsed_seconds'] = round(elapsed, 3)
+    stats['records_per_second'] = int(stats['received'] / elapsed) if elapsed else stats['received']
+    stats['watermark'] = system.sync_watermark.isoformat() if system.sync_watermark else None
+    return stats
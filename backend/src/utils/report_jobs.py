@@ -0,0 +1,519 @@
+"""
+Geração assíncrona de relatórios
+
+Os relatórios rodam em um pool de threads próprio, fora dos workers HTTP. Cada job tem id,
+progresso (linhas gravadas sobre o total estimado) e pode ser cancelado. As linhas são lidas
+em lotes por chave primária (iter_keyset_rows), cada lote em uma transação curta, e gravadas
+direto no arquivo pelo escritor do formato. O arquivo final é servido com suporte a Range.
+
+O estado de cada job também é gravado em um arquivo JSON ao lado do relatório, para que
+qualquer worker HTTP que compartilhe o diretório de saída consulte, cancele e baixe jobs
+criados por outro worker.
+"""
+
+import json
+import os
+import re
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import case, func, select
+from src.database import db
+from src.models.patient import Patient, HealthSystem, DataQualityIssue
+from src.models.quality import IssueMetricsRollup, QualitySnapshot
+from src.utils.issue_listing import issue_listing_query
+from src.utils.pagination import iter_keyset_rows
+from src.utils.kpi_engine import ESTIMATED_SAVINGS_PER_ISSUE, compute_kpis
+from src.utils.quality_scoring import patient_completeness_expression
+from src.utils.report_writers import REPORT_WRITERS, normalize_format
+
+DEFAULT_REPORT_WORKERS = 2
+REPORT_BATCH_SIZE = 5000
+# Jobs (e arquivos) mantidos após o término
+REPORT_RETENTION = timedelta(hours=24)
+# Intervalo, em linhas, entre verificações de cancelamento e de progresso
+CANCEL_CHECK_INTERVAL = 1000
+
+_DATE_RANGE = re.compile(r'^(\d+)_days$')
+_JOB_ID = re.compile(r'^[0-9a-f]{32}$')
+
+# Campos do job gravados no arquivo de estado
+_STATE_FIELDS = (
+    'id', 'report_id', 'format', 'date_range', 'requested_by', 'status', 'section', 'rows_written',
+    'total_rows', 'path', 'file_size', 'error'
+)
+_STATE_DATES = ('created_at', 'started_at', 'finished_at')
+
+
+class ReportCancelled(Exception):
+    """Sinaliza o cancelamento de um job em andamento"""
+
+
+class ReportSection:
+    """Seção do relatório: colunas, iterador de linhas e contagem para o progresso"""
+
+    def __init__(self, title, columns, rows, count=None):
+        self.title = title
+        self.columns = columns
+        self.rows = rows
+        self.count = count
+
+
+def parse_date_range(value):
+    """'30_days' -> (início, fim) em datetime; 'all' -> sem limite inferior"""
+    value = value or '30_days'
+    now = datetime.utcnow()
+    if value == 'all':
+        return None, now
+    match = _DATE_RANGE.match(value)
+    if not match or not 1 <= int(match.group(1)) <= 3650:
+        raise ValueError(f'Intervalo inválido: {value} (use N_days ou all)')
+    start = (now - timedelta(days=int(match.group(1)) - 1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return start, now
+
+
+def _count(statement):
+    value = db.session.execute(select(func.count()).select_from(statement.subquery())).scalar()
+    db.session.rollback()
+    return value
+
+
+def _in_range(column, start, end):
+    return column.between(start, end) if start else column <= end
+
+
+def _issue_summary(start, end):
+    detected = _in_range(DataQualityIssue.detected_at, start, end)
+    resolved = (DataQualityIssue.status == 'resolved') & _in_range(DataQualityIssue.resolved_at, start, end)
+    row = db.session.execute(select(
+        func.sum(case((detected, 1), else_=0)),
+        func.sum(case((resolved, 1), else_=0)),
+        func.sum(case(((DataQualityIssue.status == 'open') & (DataQualityIssue.priority == 'high'), 1), else_=0)),
+        func.sum(case((DataQualityIssue.status == 'open', 1), else_=0))
+    )).one()
+    quality = db.session.query(func.avg(QualitySnapshot.quality_score)).filter(
+        QualitySnapshot.day >= (start or datetime.min).date()
+    ).scalar()
+    db.session.rollback()
+    return [
+        ('Problemas detectados no período', row[0] or 0),
+        ('Problemas resolvidos no período', row[1] or 0),
+        ('Problemas críticos em aberto', row[2] or 0),
+        ('Problemas em aberto', row[3] or 0),
+        ('Pontuação média de qualidade', round(quality, 1) if quality is not None else None)
+    ]
+
+
+def _issues_section(start, end):
+    statement = issue_listing_query().filter(_in_range(DataQualityIssue.detected_at, start, end)).statement
+    return ReportSection(
+        'Problemas',
+        ['ID', 'Tipo', 'Prioridade', 'Título', 'Status', 'Sistema', 'Paciente',
+         'Detectado em', 'Resolvido em', 'Tempo de resolução (min)'],
+        lambda: (
+            (row.id, row.issue_type, row.priority, row.title, row.status, row.system_name, row.patient_name,
+             row.detected_at, row.resolved_at, row.resolution_time)
+            for row in iter_keyset_rows(statement, DataQualityIssue.id, REPORT_BATCH_SIZE)
+        ),
+        lambda: _count(statement)
+    )
+
+
+def _patients_section():
+    open_issues = select(func.count(DataQualityIssue.id)).where(
+        DataQualityIssue.patient_id == Patient.id, DataQualityIssue.status == 'open'
+    ).scalar_subquery()
+    statement = select(
+        Patient.id, Patient.patient_id, Patient.name, Patient.cpf,
+        patient_completeness_expression(), open_issues
+    )
+    return ReportSection(
+        'Pacientes',
+        ['ID', 'Código', 'Nome', 'CPF', 'Completude (%)', 'Problemas em aberto'],
+        lambda: iter_keyset_rows(statement, Patient.id, REPORT_BATCH_SIZE),
+        lambda: _count(select(Patient.id))
+    )
+
+
+def quality_report(start, end):
+    summary = _issue_summary(start, end)
+    return [
+        ReportSection('Resumo', ['Indicador', 'Valor'], lambda: iter(summary), lambda: len(summary)),
+        _issues_section(start, end),
+        _patients_section()
+    ]
+
+
+def integration_report(start, end):
+    open_issues = select(func.count(DataQualityIssue.id)).where(
+        DataQualityIssue.system_id == HealthSystem.id, DataQualityIssue.status == 'open'
+    ).scalar_subquery()
+    systems = select(
+        HealthSystem.id, HealthSystem.name, HealthSystem.system_type, HealthSystem.status,
+        HealthSystem.last_sync, HealthSystem.sync_frequency, open_issues
+    )
+
+    # Movimento do período lido do rollup diário
+    detected = func.sum(case((IssueMetricsRollup.status == 'detected', IssueMetricsRollup.issue_count), else_=0))
+    resolved = func.sum(case((IssueMetricsRollup.status == 'resolved', IssueMetricsRollup.issue_count), else_=0))
+    movement = select(
+        IssueMetricsRollup.system_id, IssueMetricsRollup.issue_type, detected, resolved
+    ).where(
+        IssueMetricsRollup.status.in_(('detected', 'resolved')),
+        IssueMetricsRollup.day >= (start or datetime.min).date()
+    ).group_by(IssueMetricsRollup.system_id, IssueMetricsRollup.issue_type).order_by(
+        IssueMetricsRollup.system_id, IssueMetricsRollup.issue_type
+    )
+
+    def movement_rows():
+        rows = db.session.execute(movement).all()
+        db.session.rollback()
+        return (row for row in rows if row[2] or row[3])
+
+    return [
+        ReportSection(
+            'Sistemas',
+            ['ID', 'Sistema', 'Tipo', 'Status', 'Última sincronização', 'Frequência (min)', 'Problemas em aberto'],
+            lambda: iter_keyset_rows(systems, HealthSystem.id, REPORT_BATCH_SIZE),
+            lambda: _count(select(HealthSystem.id))
+        ),
+        ReportSection(
+            'Problemas por sistema',
+            ['Sistema', 'Tipo de problema', 'Detectados', 'Resolvidos'],
+            movement_rows
+        )
+    ]
+
+
+def _snapshot_rows(start):
+    return select(
+        QualitySnapshot.id, QualitySnapshot.day, QualitySnapshot.quality_score, QualitySnapshot.completeness_rate,
+        QualitySnapshot.system_availability, QualitySnapshot.open_issues, QualitySnapshot.detected_issues,
+        QualitySnapshot.resolved_issues
+    ).where(QualitySnapshot.day >= (start or datetime.min).date())
+
+
+def executive_report(start, end):
+    current_start = (start or datetime(1970, 1, 1)).date()
+    length = end.date() - current_start
+    previous = (current_start - timedelta(days=1) - length, current_start - timedelta(days=1))
+    kpis = compute_kpis((current_start, end.date()), previous)
+    db.session.rollback()
+    snapshots = _snapshot_rows(start)
+    return [
+        ReportSection(
+            'Indicadores',
+            ['Indicador', 'Atual', 'Anterior', 'Tendência', 'Unidade'],
+            lambda: ((name, kpi['current'], kpi['previous'], kpi['trend'], kpi['unit']) for name, kpi in kpis.items()),
+            lambda: len(kpis)
+        ),
+        ReportSection(
+            'Tendências',
+            ['Dia', 'Qualidade', 'Completude', 'Disponibilidade', 'Em aberto', 'Detectados', 'Resolvidos'],
+            lambda: (row[1:] for row in iter_keyset_rows(snapshots, QualitySnapshot.id, REPORT_BATCH_SIZE)),
+            lambda: _count(snapshots)
+        )
+    ]
+
+
+def roi_report(start, end):
+    month = func.strftime('%Y-%m', QualitySnapshot.day)
+    monthly = select(
+        month, func.sum(QualitySnapshot.resolved_issues)
+    ).where(QualitySnapshot.day >= (start or datetime.min).date()).group_by(month).order_by(month)
+
+    def monthly_rows():
+        rows = db.session.execute(monthly).all()
+        db.session.rollback()
+        return ((label, resolved or 0, (resolved or 0) * ESTIMATED_SAVINGS_PER_ISSUE) for label, resolved in rows)
+
+    return [
+        ReportSection(
+            'Economia mensal',
+            ['Mês', 'Problemas resolvidos', 'Economia estimada (BRL)'],
+            monthly_rows
+        )
+    ]
+
+
+REPORTS = {
+    'quality_report': quality_report,
+    'integration_report': integration_report,
+    'executive_report': executive_report,
+    'roi_report': roi_report
+}
+
+
+class ReportJob:
+    """Estado de um relatório em geração"""
+
+    def __init__(self, report_id, file_format, date_range, requested_by=None):
+        self.id = uuid.uuid4().hex
+        self.report_id = report_id
+        self.format = file_format
+        self.date_range = date_range
+        self.requested_by = requested_by
+        self.status = 'queued'  # queued, running, completed, failed, cancelled
+        self.section = None
+        self.rows_written = 0
+        self.total_rows = None
+        self.path = None
+        self.file_size = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def to_state(self):
+        state = {name: getattr(self, name) for name in _STATE_FIELDS}
+        for name in _STATE_DATES:
+            value = getattr(self, name)
+            state[name] = value.isoformat() if value else None
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        """Job lido do arquivo de estado (gravado por este ou por outro processo)"""
+        job = cls(state['report_id'], state['format'], state['date_range'], state.get('requested_by'))
+        for name in _STATE_FIELDS:
+            setattr(job, name, state.get(name))
+        for name in _STATE_DATES:
+            value = state.get(name)
+            setattr(job, name, datetime.fromisoformat(value) if value else None)
+        return job
+
+    @property
+    def filename(self):
+        extension = REPORT_WRITERS[self.format].extension
+        return f'{self.report_id}_{self.created_at:%Y%m%d_%H%M%S}.{extension}'
+
+    def progress(self):
+        if self.status == 'completed':
+            return 100.0
+        if not self.total_rows:
+            return 0.0
+        return round(min(self.rows_written / self.total_rows * 100, 99.9), 1)
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'report_id': self.report_id,
+            'format': self.format,
+            'date_range': self.date_range,
+            'status': self.status,
+            'progress': self.progress(),
+            'section': self.section,
+            'rows_written': self.rows_written,
+            'total_rows': self.total_rows,
+            'file_size': self.file_size,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'status_url': f'/api/analytics/reports/jobs/{self.id}',
+            'download_url': f'/api/analytics/reports/jobs/{self.id}/download' if self.status == 'completed' else None
+        }
+
+
+class ReportJobQueue:
+    """Fila de relatórios executada em um ThreadPoolExecutor dedicado"""
+
+    def __init__(self, app, max_workers=DEFAULT_REPORT_WORKERS, output_dir=None):
+        self.app = app
+        self.output_dir = output_dir or os.path.join(tempfile.gettempdir(), 'healthgraph_reports')
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._remove_orphans()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, report_id, file_format, date_range='30_days', requested_by=None):
+        if report_id not in REPORTS:
+            raise KeyError(report_id)
+        file_format = normalize_format(file_format)
+        parse_date_range(date_range)
+
+        self._purge()
+        job = ReportJob(report_id, file_format, date_range, requested_by)
+        with self.lock:
+            self.jobs[job.id] = job
+            self._save(job)
+        job.future = self.executor.submit(self._run, job)
+        return job
+
+    def _state_path(self, job_id):
+        return os.path.join(self.output_dir, f'{job_id}.json')
+
+    def _cancel_path(self, job_id):
+        return os.path.join(self.output_dir, f'{job_id}.cancel')
+
+    def _save(self, job):
+        """Grava o estado do job (substituição atômica; leitores nunca veem um arquivo parcial)"""
+        path = self._state_path(job.id)
+        with open(path + '.tmp', 'w', encoding='utf-8') as state_file:
+            json.dump(job.to_state(), state_file)
+        os.replace(path + '.tmp', path)
+
+    def _load(self, job_id):
+        try:
+            with open(self._state_path(job_id), encoding='utf-8') as state_file:
+                return ReportJob.from_state(json.load(state_file))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get(self, job_id):
+        """Job deste processo ou, pelo arquivo de estado, de outro worker"""
+        if not _JOB_ID.match(job_id or ''):
+            return None
+        with self.lock:
+            job = self.jobs.get(job_id)
+        return job if job is not None else self._load(job_id)
+
+    def list(self):
+        with self.lock:
+            jobs = {job.id: job for job in self.jobs.values()}
+        for name in os.listdir(self.output_dir):
+            job_id, extension = os.path.splitext(name)
+            if extension == '.json' and job_id not in jobs and _JOB_ID.match(job_id):
+                job = self._load(job_id)
+                if job is not None:
+                    jobs[job_id] = job
+        return sorted(jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        """Cancela um job na fila (imediato) ou em andamento (no próximo ponto de verificação)
+
+        Jobs de outro worker são cancelados por um arquivo de marcação que o worker dono verifica.
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+        with self.lock:
+            local = self.jobs.get(job.id) is job
+        if not local:
+            open(self._cancel_path(job.id), 'w').close()
+            return job
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, 'cancelled')
+        return job
+
+    def _finish(self, job, status):
+        """Marca o job como terminado: finished_at é gravado antes do status, sob a trava"""
+        with self.lock:
+            job.finished_at = datetime.utcnow()
+            job.status = status
+            self._save(job)
+        try:
+            os.remove(self._cancel_path(job.id))
+        except FileNotFoundError:
+            pass
+
+    def _remove_orphans(self):
+        """Apaga arquivos de execuções anteriores (relatórios e estados) após a retenção"""
+        limit = (datetime.utcnow() - REPORT_RETENTION).timestamp()
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if os.path.isfile(path) and os.path.getmtime(path) < limit:
+                os.remove(path)
+
+    def _purge(self):
+        """Remove jobs terminados (e seus arquivos) além do período de retenção"""
+        limit = datetime.utcnow() - REPORT_RETENTION
+        with self.lock:
+            expired = [job for job in self.jobs.values() if job.finished and job.finished_at < limit]
+            for job in expired:
+                del self.jobs[job.id]
+        for job in expired:
+            for path in (job.path, self._state_path(job.id), self._cancel_path(job.id)):
+                if path and os.path.exists(path):
+                    os.remove(path)
+
+    def _check_cancelled(self, job):
+        if job.cancel_event.is_set() or os.path.exists(self._cancel_path(job.id)):
+            raise ReportCancelled()
+
+    def _run(self, job):
+        try:
+            self._check_cancelled(job)
+        except ReportCancelled:
+            self._finish(job, 'cancelled')
+            return
+
+        with self.lock:
+            job.started_at = datetime.utcnow()
+            job.status = 'running'
+            self._save(job)
+        path = os.path.join(self.output_dir, f'{job.id}.{REPORT_WRITERS[job.format].extension}')
+        partial = path + '.part'
+        writer = None
+        status = 'failed'
+
+        try:
+            with self.app.app_context():
+                start, end = parse_date_range(job.date_range)
+                sections = REPORTS[job.report_id](start, end)
+                job.total_rows = 0
+                for section in sections:
+                    self._check_cancelled(job)
+                    job.total_rows += section.count() if section.count else 0
+
+                writer = REPORT_WRITERS[job.format](partial)
+                for section in sections:
+                    self._check_cancelled(job)
+                    job.section = section.title
+                    writer.start_section(section.title, section.columns)
+                    for row in section.rows():
+                        writer.write_row(row)
+                        job.rows_written += 1
+                        if job.rows_written % CANCEL_CHECK_INTERVAL == 0:
+                            self._check_cancelled(job)
+                            self._save(job)
+                    writer.end_section()
+                writer.close()
+                writer = None
+
+            os.replace(partial, path)
+            job.path = path
+            job.file_size = os.path.getsize(path)
+            job.section = None
+            status = 'completed'
+        except ReportCancelled:
+            status = 'cancelled'
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            if writer is not None:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            if os.path.exists(partial):
+                os.remove(partial)
+            self._finish(job, status)
+
+
+_queue_lock = threading.Lock()
+
+
+def get_report_queue(app):
+    """Fila de relatórios da aplicação (criada na primeira chamada)"""
+    with _queue_lock:
+        queue = app.extensions.get('report_jobs')
+        if queue is None:
+            queue = ReportJobQueue(
+                app,
+                max_workers=app.config.get('REPORT_WORKERS', DEFAULT_REPORT_WORKERS),
+                output_dir=app.config.get('REPORTS_DIR')
+            )
+            app.extensions['report_jobs'] = queue
+        return queue
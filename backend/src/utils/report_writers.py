@@ -0,0 +1,309 @@
+"""
+Escritores de relatório em fluxo (CSV, XLSX e PDF)
+
+Cada escritor recebe seções (título, colunas) e linhas uma a uma, gravando direto no arquivo:
+nenhum formato mantém o relatório inteiro em memória. XLSX e PDF são gerados sem bibliotecas
+externas — o XLSX é um zip com planilhas em XML (texto inline, sem tabela de strings
+compartilhadas) e o PDF usa a fonte Courier padrão, uma página por bloco de linhas.
+"""
+
+import csv
+import re
+import zipfile
+import zlib
+from datetime import date, datetime
+from xml.sax.saxutils import escape
+
+# Caracteres de controle não permitidos em XML 1.0
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+_SHEET_INVALID = re.compile(r'[\[\]:*?/\\]')
+
+
+def format_value(value):
+    """Representação textual de um valor de linha (datas em ISO, vazio para nulos)"""
+    if value is None:
+        return ''
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return f'{value:.2f}'.rstrip('0').rstrip('.')
+    return str(value)
+
+
+class CsvReportWriter:
+    """CSV com BOM (abre acentuado no Excel); seções separadas por título e linha em branco"""
+
+    extension = 'csv'
+    mimetype = 'text/csv'
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = csv.writer(self.file)
+        self.sections = 0
+
+    def start_section(self, title, columns):
+        if self.sections:
+            self.writer.writerow([])
+        self.sections += 1
+        self.writer.writerow([title])
+        self.writer.writerow(columns)
+
+    def write_row(self, values):
+        self.writer.writerow([format_value(value) for value in values])
+
+    def end_section(self):
+        pass
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class XlsxReportWriter:
+    """Pasta de trabalho Office Open XML com uma planilha por seção"""
+
+    extension = 'xlsx'
+    mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+    FLUSH_ROWS = 1000
+    # Limite de linhas de uma planilha no Excel (cabeçalho incluído)
+    MAX_SHEET_ROWS = 1048576
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        self.sheets = []
+        self.stream = None
+        self.buffer = []
+        self.row_number = 0
+        self.section = None  # (título, colunas, parte) da seção aberta
+
+    def _sheet_name(self, title, part=1):
+        # A parte ("Título (2)") é preservada mesmo quando o título precisa ser cortado
+        suffix = f' ({part})' if part > 1 else ''
+        name = (_SHEET_INVALID.sub(' ', title).strip()[:31 - len(suffix)] + suffix).strip() or 'Planilha'
+        candidate, suffix = name, 2
+        while candidate in self.sheets:
+            candidate = f'{name[:28]} {suffix}'
+            suffix += 1
+        return candidate
+
+    def start_section(self, title, columns, part=1):
+        self.sheets.append(self._sheet_name(title, part))
+        self.section = (title, columns, part)
+        # force_zip64: planilhas grandes podem passar de 2 GB descomprimidas
+        self.stream = self.zip.open(f'xl/worksheets/sheet{len(self.sheets)}.xml', 'w', force_zip64=True)
+        self.stream.write(
+            b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+        )
+        self.row_number = 0
+        self.write_row(columns)
+
+    def _cell(self, value):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return f'<c><v>{value}</v></c>'
+        text = escape(_XML_INVALID.sub('', format_value(value)))
+        return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+    def write_row(self, values):
+        if self.row_number >= self.MAX_SHEET_ROWS:
+            # Planilha cheia: a seção continua em "<título> (n)", com o cabeçalho repetido
+            title, columns, part = self.section
+            self.end_section()
+            self.start_section(title, columns, part + 1)
+        self.row_number += 1
+        self.buffer.append(f'<row r="{self.row_number}">{"".join(self._cell(v) for v in values)}</row>')
+        if len(self.buffer) >= self.FLUSH_ROWS:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.stream.write(''.join(self.buffer).encode('utf-8'))
+            self.buffer = []
+
+    def end_section(self):
+        self._flush()
+        self.stream.write(b'</sheetData></worksheet>')
+        self.stream.close()
+        self.stream = None
+
+    def close(self):
+        if self.zip.fp is None:
+            return
+        if self.stream is not None:
+            self.end_section()
+        if not self.sheets:
+            self.start_section('Relatório', [])
+            self.end_section()
+
+        count = len(self.sheets)
+        self.zip.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + ''.join(
+                f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                f'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for i in range(1, count + 1)
+            ) + '</Types>'
+        ))
+        self.zip.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/></Relationships>'
+        ))
+        self.zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + ''.join(
+                f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+                for i, name in enumerate(self.sheets, start=1)
+            ) + '</sheets></workbook>'
+        ))
+        self.zip.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(
+                f'<Relationship Id="rId{i}" '
+                f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{i}.xml"/>'
+                for i in range(1, count + 1)
+            ) + '</Relationships>'
+        ))
+        self.zip.close()
+
+
+class PdfReportWriter:
+    """PDF 1.4 em A4 paisagem com texto monoespaçado; cada página é gravada assim que enche"""
+
+    extension = 'pdf'
+    mimetype = 'application/pdf'
+
+    PAGE_WIDTH = 842
+    PAGE_HEIGHT = 595
+    MARGIN = 36
+    FONT_SIZE = 7
+    LEADING = 9
+    # Courier: cada caractere ocupa 0,6 do tamanho da fonte
+    LINE_CHARS = int((PAGE_WIDTH - 2 * MARGIN) / (FONT_SIZE * 0.6))
+    LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+
+    # Objetos fixos: 1 catálogo, 2 árvore de páginas, 3 fonte; páginas a partir do 4
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.offsets = {}
+        self.next_object = 4
+        self.page_objects = []
+        self.lines = []
+        self.widths = []
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def _write_object(self, number, body):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f'{number} 0 obj\n'.encode('ascii') + body + b'\nendobj\n')
+
+    def _line(self, text):
+        self.lines.append(text[:self.LINE_CHARS])
+        if len(self.lines) >= self.LINES_PER_PAGE:
+            self._flush_page()
+
+    @staticmethod
+    def _pdf_string(text):
+        raw = text.encode('cp1252', 'replace')
+        return b'(' + raw.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+    def _flush_page(self):
+        top = self.PAGE_HEIGHT - self.MARGIN - self.FONT_SIZE
+        content = [f'BT /F1 {self.FONT_SIZE} Tf {self.LEADING} TL {self.MARGIN} {top} Td'.encode('ascii')]
+        content.extend(self._pdf_string(line) + b' Tj T*' for line in self.lines)
+        content.append(b'ET')
+        stream = zlib.compress(b'\n'.join(content))
+
+        contents_number, page_number = self.next_object, self.next_object + 1
+        self.next_object += 2
+        self._write_object(
+            contents_number,
+            f'<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n'.encode('ascii') + stream + b'\nendstream'
+        )
+        self._write_object(page_number, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R /MediaBox [0 0 {self.PAGE_WIDTH} {self.PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {self.FONT} 0 R >> >> /Contents {contents_number} 0 R >>'
+        ).encode('ascii'))
+        self.page_objects.append(page_number)
+        self.lines = []
+
+    def _columns_line(self, values):
+        return ' '.join(
+            format_value(value)[:width].ljust(width) for value, width in zip(values, self.widths)
+        ).rstrip()
+
+    def start_section(self, title, columns):
+        if self.lines:
+            self._line('')
+        # Largura das colunas proporcional ao cabeçalho (mínimo de 10 caracteres)
+        natural = [max(len(column), 10) for column in columns] or [self.LINE_CHARS]
+        available = self.LINE_CHARS - (len(natural) - 1)
+        scale = min(1.0, available / sum(natural))
+        self.widths = [max(int(width * scale), 3) for width in natural]
+
+        self._line(title.upper())
+        self._line(self._columns_line(columns))
+        self._line('-' * min(self.LINE_CHARS, sum(self.widths) + len(self.widths) - 1))
+
+    def write_row(self, values):
+        self._line(self._columns_line(values))
+
+    def end_section(self):
+        pass
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.lines or not self.page_objects:
+            self._flush_page()
+
+        self._write_object(
+            self.FONT,
+            b'<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>'
+        )
+        kids = ' '.join(f'{number} 0 R' for number in self.page_objects)
+        self._write_object(
+            self.PAGES, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_objects)} >>'.encode('ascii')
+        )
+        self._write_object(self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode('ascii'))
+
+        xref_offset = self.file.tell()
+        size = self.next_object
+        entries = [b'0000000000 65535 f \n']
+        entries.extend(f'{self.offsets[number]:010d} 00000 n \n'.encode('ascii') for number in range(1, size))
+        self.file.write(f'xref\n0 {size}\n'.encode('ascii') + b''.join(entries))
+        self.file.write(
+            f'trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n'.encode('ascii')
+        )
+        self.file.close()
+
+
+REPORT_WRITERS = {
+    'CSV': CsvReportWriter,
+    'XLSX': XlsxReportWriter,
+    'PDF': PdfReportWriter
+}
+
+# Nomes aceitos na API -> formato
+FORMAT_ALIASES = {'CSV': 'CSV', 'EXCEL': 'XLSX', 'XLSX': 'XLSX', 'PDF': 'PDF'}
+
+
+def normalize_format(name):
+    """Formato interno a partir do nome informado (PDF, Excel/XLSX ou CSV)"""
+    file_format = FORMAT_ALIASES.get(str(name or '').strip().upper())
+    if file_format is None:
+        raise ValueError(f'Formato não suportado: {name} (use PDF, Excel ou CSV)')
+    return file_format
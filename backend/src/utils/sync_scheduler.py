@@ -0,0 +1,264 @@
+"""
+Agendador de sincronizações dos sistemas de saúde
+
+Uma única thread despachante mantém um heap com o próximo horário de cada sistema
+(last_sync + sync_frequency) e entrega os vencidos a um pool limitado de workers: o número de
+threads não depende do número de sistemas. Os intervalos têm jitter para espalhar as
+sincronizações; falhas seguidas são repetidas com backoff exponencial. A lista de sistemas é
+relida periodicamente (sistemas novos, removidos ou com outra frequência). Sistemas sem
+endpoint de integração ficam fora da agenda até serem configurados.
+
+Habilitado com SYNC_SCHEDULER_ENABLED=1. Com vários processos (gunicorn), habilite em apenas um.
+"""
+
+import heapq
+import itertools
+import random
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from src.database import db
+from src.models.patient import HealthSystem
+from src.utils.connection_probe import percentiles
+from src.utils.dashboard_snapshot import invalidate_dashboard_snapshot
+from src.utils.sync_service import compact_sync_logs_if_due, run_system_sync
+
+DEFAULT_SYNC_WORKERS = 4
+DEFAULT_SYNC_FREQUENCY = 60  # minutos, para sistemas sem frequência
+SYNC_JITTER = 0.1  # ±10% do intervalo
+BACKOFF_BASE = timedelta(minutes=1)
+BACKOFF_MAX = timedelta(hours=1)
+REFRESH_INTERVAL = timedelta(minutes=1)
+# Atrasos de despacho guardados para os percentis de atraso
+LAG_SAMPLES = 500
+
+
+class SyncScheduler:
+    """Heap de próximos horários por sistema, despachados em um ThreadPoolExecutor limitado"""
+
+    def __init__(self, app, max_workers=DEFAULT_SYNC_WORKERS, jitter=SYNC_JITTER,
+                 refresh_interval=REFRESH_INTERVAL):
+        self.app = app
+        self.max_workers = max_workers
+        self.jitter = jitter
+        self.refresh_interval = refresh_interval
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sync')
+        self.condition = threading.Condition()
+        self.random = random.Random()
+        self.heap = []
+        self.entries = {}
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.runs = 0
+        self.failed_runs = 0
+        self.lags = deque(maxlen=LAG_SAMPLES)
+        self.next_refresh = None
+        self.thread = None
+        self.stopping = False
+
+    # Agenda
+
+    def _push(self, entry, due):
+        # Entradas antigas no heap são descartadas pela versão ao saírem
+        entry['due'] = due
+        entry['version'] += 1
+        heapq.heappush(self.heap, (due, next(self.sequence), entry['system_id'], entry['version']))
+
+    def _with_jitter(self, interval):
+        return interval * (1 + self.random.uniform(-self.jitter, self.jitter))
+
+    def _next_due(self, entry, now):
+        if entry['failures']:
+            backoff = BACKOFF_BASE * 2 ** (entry['failures'] - 1)
+            return now + self._with_jitter(min(backoff, max(BACKOFF_MAX, entry['interval'])))
+        return now + self._with_jitter(entry['interval'])
+
+    def _refresh_systems(self, now):
+        """Sincroniza o heap com a tabela de sistemas (só os que têm endpoint configurado)"""
+        with self.app.app_context():
+            rows = db.session.execute(
+                select(HealthSystem.id, HealthSystem.sync_frequency, HealthSystem.last_sync)
+                .where(HealthSystem.endpoint_url.isnot(None), HealthSystem.endpoint_url != '')
+            ).all()
+
+        with self.condition:
+            current = set()
+            for system_id, frequency, last_sync in rows:
+                current.add(system_id)
+                interval = timedelta(minutes=frequency or DEFAULT_SYNC_FREQUENCY)
+                entry = self.entries.get(system_id)
+                if entry is None:
+                    entry = {'system_id': system_id, 'interval': interval, 'failures': 0,
+                             'running': False, 'version': 0, 'last_run': None, 'last_result': None}
+                    self.entries[system_id] = entry
+                    due = last_sync + interval if last_sync else now
+                    if due <= now:
+                        # Atrasados na partida: espalhados no primeiro minuto em vez de todos juntos
+                        due = now + self.random.random() * min(interval, REFRESH_INTERVAL)
+                    self._push(entry, due)
+                elif entry['interval'] != interval:
+                    entry['interval'] = interval
+                    if not entry['running'] and not entry['failures']:
+                        self._push(entry, min(entry['due'], now + interval))
+
+            for system_id in set(self.entries) - current:
+                # Removido: a versão nova invalida a entrada no heap
+                self.entries.pop(system_id)['version'] += 1
+
+        self.next_refresh = now + self.refresh_interval
+
+    # Execução
+
+    def _dispatch(self, now):
+        """Entrega os sistemas vencidos ao pool, sem passar do número de workers"""
+        while self.heap and self.heap[0][0] <= now and self.in_flight < self.max_workers:
+            due, _, system_id, version = heapq.heappop(self.heap)
+            entry = self.entries.get(system_id)
+            if entry is None or entry['version'] != version or entry['running']:
+                continue
+            entry['running'] = True
+            self.in_flight += 1
+            self.lags.append((now - due).total_seconds())
+            self.executor.submit(self._run, entry, due)
+
+    def _run(self, entry, due):
+        success = False
+        skipped = False
+        error = None
+        try:
+            with self.app.app_context():
+                try:
+                    system = db.session.get(HealthSystem, entry['system_id'])
+                    if system is not None:
+                        result = run_system_sync(system, entry['failures'])
+                        db.session.commit()
+                        success = result['sync_success']
+                        # Sem endpoint não é falha: segue o intervalo normal, sem backoff
+                        skipped = not result['configured']
+                        invalidate_dashboard_snapshot()
+                        compact_sync_logs_if_due()
+                except Exception as e:
+                    db.session.rollback()
+                    error = str(e)
+        finally:
+            now = datetime.utcnow()
+            with self.condition:
+                self.runs += 1
+                entry['running'] = False
+                entry['last_run'] = now
+                if skipped:
+                    entry['last_result'] = 'not_configured'
+                else:
+                    entry['last_result'] = 'success' if success else (error or 'failed')
+                    entry['failures'] = 0 if success else entry['failures'] + 1
+                    if not success:
+                        self.failed_runs += 1
+                if self.entries.get(entry['system_id']) is entry:
+                    self._push(entry, self._next_due(entry, now))
+                self.in_flight -= 1
+                self.condition.notify()
+
+    def _loop(self):
+        while True:
+            now = datetime.utcnow()
+            if self.next_refresh is None or now >= self.next_refresh:
+                try:
+                    self._refresh_systems(now)
+                except Exception:
+                    # Banco indisponível: tenta de novo no próximo ciclo
+                    self.next_refresh = now + self.refresh_interval
+
+            with self.condition:
+                if self.stopping:
+                    return
+                self._dispatch(now)
+                wake = self.next_refresh
+                if self.heap and self.in_flight < self.max_workers:
+                    wake = min(wake, self.heap[0][0])
+                # Acordado antes por término de worker, reagendamento ou parada
+                self.condition.wait(max((wake - datetime.utcnow()).total_seconds(), 0.05))
+
+    # Controle
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._loop, name='sync-scheduler', daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, wait=True):
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+        self.executor.shutdown(wait=wait)
+
+    def record_manual_sync(self, system_id, success):
+        """Reagenda um sistema sincronizado fora do agendador (sincronização forçada)"""
+        with self.condition:
+            entry = self.entries.get(system_id)
+            if entry is None or entry['running']:
+                return
+            entry['failures'] = 0 if success else entry['failures'] + 1
+            self._push(entry, self._next_due(entry, datetime.utcnow()))
+            self.condition.notify()
+
+    def status(self):
+        """Profundidade da fila, atrasos e próximos horários"""
+        now = datetime.utcnow()
+        with self.condition:
+            overdue = [
+                (now - entry['due']).total_seconds()
+                for entry in self.entries.values() if not entry['running'] and entry['due'] <= now
+            ]
+            lags = percentiles(self.lags, (50, 95, 99))
+            systems = sorted(
+                (
+                    {
+                        'system_id': entry['system_id'],
+                        'next_due': entry['due'].isoformat(),
+                        'running': entry['running'],
+                        'consecutive_failures': entry['failures'],
+                        'last_run': entry['last_run'].isoformat() if entry['last_run'] else None,
+                        'last_result': entry['last_result']
+                    }
+                    for entry in self.entries.values()
+                ),
+                key=lambda item: item['next_due']
+            )
+            return {
+                'running': self.thread is not None and self.thread.is_alive(),
+                'workers': self.max_workers,
+                'in_flight': self.in_flight,
+                'scheduled_systems': len(self.entries),
+                # Vencidos aguardando um worker livre
+                'queue_depth': len(overdue),
+                'max_lag_seconds': round(max(overdue), 1) if overdue else 0.0,
+                'dispatch_lag_seconds': {name: round(value, 2) if value is not None else None
+                                         for name, value in lags.items()},
+                'backing_off': sum(1 for entry in self.entries.values() if entry['failures']),
+                'runs': self.runs,
+                'failed_runs': self.failed_runs,
+                'systems': systems
+            }
+
+
+_scheduler_lock = threading.Lock()
+
+
+def start_sync_scheduler(app):
+    """Cria e inicia o agendador da aplicação (uma vez por processo)"""
+    with _scheduler_lock:
+        scheduler = app.extensions.get('sync_scheduler')
+        if scheduler is None:
+            scheduler = SyncScheduler(app, max_workers=app.config.get('SYNC_WORKERS', DEFAULT_SYNC_WORKERS))
+            app.extensions['sync_scheduler'] = scheduler.start()
+        return scheduler
+
+
+def get_sync_scheduler(app):
+    """Agendador em execução, ou None quando desabilitado"""
+    return app.extensions.get('sync_scheduler')
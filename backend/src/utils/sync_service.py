@@ -0,0 +1,346 @@
+"""
+Sincronização dos sistemas de saúde e histórico persistente de sincronizações (sync_logs)
+
+Cada sincronização ou teste de conectividade grava uma linha em sync_logs (somente inserção),
+indexada por (system_id, timestamp); as consultas filtram a janela de tempo e aplicam o limite
+no SQL. A política de retenção mantém a tabela limitada: logs mais antigos que a retenção, ou
+além do máximo por sistema, são compactados em totais diários (sync_log_daily) e removidos.
+
+Uso: python src/utils/sync_service.py [caminho/para/healthgraph.db]
+"""
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+from flask import current_app, has_app_context
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.sqlite import insert
+from src.database import db
+from src.models.integration import SyncLog, SyncLogDaily
+from src.models.patient import HealthSystem
+from src.utils.connection_probe import percentiles
+from src.utils.record_ingestion import IngestionError, ingest_system_records
+
+SYNC_LOG_RETENTION_DAYS = 30
+SYNC_SUMMARY_RETENTION_DAYS = 365
+SYNC_LOG_MAX_PER_SYSTEM = 10000
+MAX_LOG_LIMIT = 500
+
+# Falhas consecutivas de sincronização até o sistema ser considerado offline
+SYNC_FAILURES_OFFLINE = 3
+
+# Intervalo mínimo entre compactações disparadas pelas gravações
+COMPACTION_INTERVAL = timedelta(hours=1)
+
+_compaction_lock = threading.Lock()
+_last_compaction = None
+
+SUMMARY_COLUMNS = ('success_count', 'warning_count', 'error_count', 'records_synced',
+                   'duration_sum', 'duration_count')
+
+
+def _setting(name, default):
+    return current_app.config.get(name, default) if has_app_context() else default
+
+
+def record_sync_log(system, event, status, message, details=None, records_synced=0,
+                    duration_ms=None, timestamp=None):
+    """Acrescenta um log na sessão atual (gravado no commit de quem chamou)"""
+    log = SyncLog(
+        system_id=system.id,
+        timestamp=timestamp or datetime.utcnow(),
+        event=event,
+        status=status,
+        message=message,
+        details=details,
+        records_synced=records_synced,
+        duration_ms=duration_ms
+    )
+    db.session.add(log)
+    return log
+
+
+def run_system_sync(system, consecutive_failures=0):
+    """Sincroniza o sistema pela ingestão incremental, atualiza seu status e registra o resultado
+
+    consecutive_failures: falhas anteriores seguidas (agendador); a partir de
+    SYNC_FAILURES_OFFLINE o sistema passa a offline em vez de warning. Sistemas sem endpoint
+    não são sincronizados e mantêm o status (configured=False).
+    """
+    if not system.endpoint_url:
+        record_sync_log(system, 'sync', 'warning', f"{system.name} - Endpoint de integração não configurado")
+        return {
+            'sync_success': False,
+            'configured': False,
+            'records_synced': 0,
+            'message': 'Endpoint de integração não configurado'
+        }
+
+    started = time.perf_counter()
+    try:
+        stats = ingest_system_records(system)
+    except IngestionError as e:
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        system.status = 'offline' if consecutive_failures + 1 >= SYNC_FAILURES_OFFLINE else 'warning'
+        record_sync_log(system, 'sync', 'error', f"{system.name} - Falha na sincronização", str(e), 0, duration_ms)
+        return {
+            'sync_success': False,
+            'configured': True,
+            'records_synced': 0,
+            'message': f"Falha na sincronização: {e}"
+        }
+
+    now = datetime.utcnow()
+    system.last_sync = now
+    system.status = 'online'
+    records_synced = stats['inserted'] + stats['updated']
+    details = (
+        f"{stats['inserted']} novos, {stats['updated']} atualizados, {stats['rejected']} rejeitados, "
+        f"{stats['issues']} problemas detectados ({stats['records_per_second']} registros/s)"
+    )
+    if stats['waiting']:
+        details += f" - {stats['waiting']} aguardando o cadastro do paciente"
+    if stats['has_more'] or stats['waiting']:
+        details += " - restante na próxima sincronização"
+    # Registros rejeitados ou retidos não são uma sincronização limpa
+    if stats['rejected'] or stats['waiting']:
+        status, message = 'warning', f"{system.name} - Sincronização concluída com registros pendentes"
+    else:
+        status, message = 'success', f"{system.name} - Sincronização completa"
+    record_sync_log(system, 'sync', status, message, details,
+                    records_synced, int(stats['elapsed_seconds'] * 1000), now)
+
+    return {
+        'sync_success': True,
+        'configured': True,
+        'records_synced': records_synced,
+        'message': f"Sincronização concluída com sucesso. {records_synced} registros processados.",
+        'ingestion': stats
+    }
+
+
+def apply_probe_result(system, result, now=None):
+    """Atualiza o status do sistema com o resultado do teste de conectividade e registra o log"""
+    now = now or datetime.utcnow()
+    checks = ('connection_test', 'authentication_test', 'data_access_test')
+    overall_success = all(result[name] for name in checks)
+
+    if not result['configured']:
+        # Sem endpoint não há o que testar: o status atual é mantido
+        status, message = 'warning', f"{system.name} - Endpoint de integração não configurado"
+    elif overall_success:
+        system.status = 'online'
+        system.last_sync = now
+        status, message = 'success', f"{system.name} - Teste de conectividade concluído"
+    else:
+        system.status = 'warning' if result['connection_test'] else 'offline'
+        status = 'warning' if result['connection_test'] else 'error'
+        message = f"{system.name} - Problemas detectados na conectividade"
+
+    details = result['error']
+    if result['response_time_ms'] is not None:
+        details = f"Tempo de resposta: {result['response_time_ms']:g}ms" + (f" ({details})" if details else '')
+    duration_ms = round(result['response_time_ms']) if result['response_time_ms'] is not None else None
+    record_sync_log(system, 'test', status, message, details, 0, duration_ms, now)
+    return overall_success
+
+
+def query_sync_logs(since, system_id=None, limit=50):
+    """Logs a partir de `since` (mais recentes primeiro) e o total na janela"""
+    conditions = [SyncLog.timestamp >= since]
+    if system_id is not None:
+        conditions.append(SyncLog.system_id == system_id)
+
+    rows = db.session.execute(
+        select(SyncLog, HealthSystem.name, HealthSystem.system_type)
+        .join(HealthSystem, HealthSystem.id == SyncLog.system_id)
+        .where(*conditions)
+        .order_by(SyncLog.timestamp.desc(), SyncLog.id.desc())
+        .limit(min(limit, MAX_LOG_LIMIT))
+    ).all()
+    total = db.session.execute(select(func.count(SyncLog.id)).where(*conditions)).scalar()
+
+    logs = []
+    for log, system_name, system_type in rows:
+        log_data = log.to_dict()
+        log_data.update({'system_name': system_name, 'system_type': system_type})
+        logs.append(log_data)
+    return logs, total
+
+
+def recent_system_logs(system_id, limit=10):
+    """Últimos logs de um sistema (percorre o índice system_id + timestamp)"""
+    logs = SyncLog.query.filter_by(system_id=system_id).order_by(
+        SyncLog.timestamp.desc(), SyncLog.id.desc()
+    ).limit(limit).all()
+    return [log.to_dict() for log in logs]
+
+
+def system_sync_metrics(system_id, now=None):
+    """Métricas do sistema a partir dos logs: últimas 24h e disponibilidade em 30 dias"""
+    now = now or datetime.utcnow()
+    since_day = now - timedelta(hours=24)
+    since_month = now - timedelta(days=30)
+
+    syncs, failed, average_duration = db.session.execute(
+        select(
+            func.sum(case((SyncLog.event == 'sync', 1), else_=0)),
+            func.sum(case(((SyncLog.event == 'sync') & (SyncLog.status == 'error'), 1), else_=0)),
+            func.avg(SyncLog.duration_ms)
+        ).where(SyncLog.system_id == system_id, SyncLog.timestamp >= since_day)
+    ).one()
+
+    # Disponibilidade só sobre tentativas reais de sincronização: os avisos de endpoint não
+    # configurado não têm duração, e os testes de conectividade ficam de fora. Logs brutos e
+    # totais compactados são disjuntos: a soma cobre a janela inteira
+    attempt = (SyncLog.event == 'sync') & SyncLog.duration_ms.isnot(None)
+    raw_attempts, raw_success, raw_records = db.session.execute(
+        select(
+            func.sum(case((attempt, 1), else_=0)),
+            func.sum(case((attempt & (SyncLog.status == 'success'), 1), else_=0)),
+            func.sum(SyncLog.records_synced)
+        ).where(SyncLog.system_id == system_id, SyncLog.timestamp >= since_month)
+    ).one()
+    summary_attempts, summary_success, summary_records = db.session.execute(
+        select(
+            func.sum(case((SyncLogDaily.event == 'sync', SyncLogDaily.duration_count), else_=0)),
+            func.sum(case((SyncLogDaily.event == 'sync', SyncLogDaily.success_count), else_=0)),
+            func.sum(SyncLogDaily.records_synced)
+        ).where(SyncLogDaily.system_id == system_id, SyncLogDaily.day >= since_month.date())
+    ).one()
+
+    total = (raw_attempts or 0) + (summary_attempts or 0)
+    success = (raw_success or 0) + (summary_success or 0)
+
+    # Percentis dos testes de conectividade (poucas linhas por sistema em 24h)
+    probe_times = db.session.execute(
+        select(SyncLog.duration_ms).where(
+            SyncLog.system_id == system_id, SyncLog.event == 'test', SyncLog.timestamp >= since_day
+        )
+    ).scalars().all()
+
+    return {
+        'uptime_percentage': round(success * 100.0 / total, 1) if total else None,
+        'average_response_time': round(average_duration, 1) if average_duration is not None else None,
+        'probe_response_time_ms': percentiles(probe_times, (50, 95)),
+        'total_records': (raw_records or 0) + (summary_records or 0),
+        'last_24h_syncs': syncs or 0,
+        'failed_syncs_24h': failed or 0
+    }
+
+
+def _compaction_boundary(system_id, retention_cutoff, max_per_system):
+    """Instante antes do qual os logs do sistema são compactados"""
+    nth_newest = db.session.execute(
+        select(SyncLog.timestamp)
+        .where(SyncLog.system_id == system_id)
+        .order_by(SyncLog.timestamp.desc())
+        .limit(1).offset(max_per_system - 1)
+    ).scalar()
+    if nth_newest is not None and nth_newest > retention_cutoff:
+        return nth_newest
+    return retention_cutoff
+
+
+def _compact_system(system_id, boundary):
+    """Soma os logs anteriores ao limite em sync_log_daily e os remove (uma transação)"""
+    old_logs = (SyncLog.system_id == system_id) & (SyncLog.timestamp < boundary)
+    day = func.date(SyncLog.timestamp)
+    grouped = db.session.execute(
+        select(
+            day,
+            SyncLog.event,
+            func.sum(case((SyncLog.status == 'success', 1), else_=0)),
+            func.sum(case((SyncLog.status == 'warning', 1), else_=0)),
+            func.sum(case((SyncLog.status == 'error', 1), else_=0)),
+            func.sum(SyncLog.records_synced),
+            func.coalesce(func.sum(SyncLog.duration_ms), 0),
+            func.count(SyncLog.duration_ms)
+        ).where(old_logs).group_by(day, SyncLog.event)
+    ).all()
+    if not grouped:
+        return 0
+
+    rows = [
+        dict(zip(SUMMARY_COLUMNS, values), system_id=system_id, day=date.fromisoformat(day_value), event=event)
+        for day_value, event, *values in grouped
+    ]
+    statement = insert(SyncLogDaily)
+    columns = SyncLogDaily.__table__.c
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[SyncLogDaily.system_id, SyncLogDaily.day, SyncLogDaily.event],
+        set_={name: columns[name] + statement.excluded[name] for name in SUMMARY_COLUMNS}
+    ), rows)
+
+    removed = db.session.execute(SyncLog.__table__.delete().where(old_logs)).rowcount
+    db.session.commit()
+    return removed
+
+
+def compact_sync_logs(now=None, retention_days=None, max_per_system=None, summary_retention_days=None):
+    """Aplica a política de retenção a todos os sistemas"""
+    global _last_compaction
+    now = now or datetime.utcnow()
+    retention_days = retention_days or _setting('SYNC_LOG_RETENTION_DAYS', SYNC_LOG_RETENTION_DAYS)
+    max_per_system = max_per_system or _setting('SYNC_LOG_MAX_PER_SYSTEM', SYNC_LOG_MAX_PER_SYSTEM)
+    summary_retention_days = summary_retention_days or _setting(
+        'SYNC_SUMMARY_RETENTION_DAYS', SYNC_SUMMARY_RETENTION_DAYS
+    )
+    retention_cutoff = now - timedelta(days=retention_days)
+
+    compacted = 0
+    system_ids = db.session.execute(select(SyncLog.system_id).distinct()).scalars().all()
+    for system_id in system_ids:
+        boundary = _compaction_boundary(system_id, retention_cutoff, max_per_system)
+        compacted += _compact_system(system_id, boundary)
+
+    expired = db.session.execute(
+        SyncLogDaily.__table__.delete().where(
+            SyncLogDaily.day < (now - timedelta(days=summary_retention_days)).date()
+        )
+    ).rowcount
+    db.session.commit()
+
+    _last_compaction = now
+    return {'compacted_logs': compacted, 'expired_summaries': expired, 'systems': len(system_ids)}
+
+
+def compact_sync_logs_if_due(now=None):
+    """Compacta se a última compactação deste processo foi há mais de COMPACTION_INTERVAL"""
+    now = now or datetime.utcnow()
+    if _last_compaction is not None and now - _last_compaction < COMPACTION_INTERVAL:
+        return None
+    # Outra requisição já está compactando: não espera
+    if not _compaction_lock.acquire(blocking=False):
+        return None
+    try:
+        return compact_sync_logs(now)
+    finally:
+        _compaction_lock.release()
+
+
+if __name__ == "__main__":
+    from flask import Flask
+    from src.models.auth import User, UserSession
+    from src.models.patient import Patient, MedicalRecord, DataQualityIssue, DashboardMetrics
+    from src.utils.migrations import apply_migrations
+
+    default_path = os.path.join(os.path.dirname(__file__), "..", "..", "healthgraph.db")
+    db_path = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else default_path)
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        result = compact_sync_logs()
+
+    print(f"✓ {result['compacted_logs']} logs compactados em {result['systems']} sistemas, "
+          f"{result['expired_summaries']} totais diários expirados")
@@ -0,0 +1,233 @@
+"""
+Busca textual sobre os índices FTS5 criados pelas migrações
+
+Os termos são extraídos do texto, descartando palavras vazias, e enviados ao FTS5 entre aspas
+para que pontuação e operadores digitados pelo usuário não sejam interpretados como sintaxe.
+"""
+
+import re
+import unicodedata
+from sqlalchemy import Integer, column, table, text
+from src.models.patient import Patient, DataQualityIssue, db
+from src.utils.migrations import fts_tables
+
+ISSUES_FTS = 'data_quality_issues_fts'
+ISSUES_VOCAB = 'data_quality_issues_fts_vocab'
+PATIENTS_FTS = 'patients_fts'
+
+_WORDS = re.compile(r'\w+', re.UNICODE)
+_NON_DIGITS = re.compile(r'\D')
+# Entrada só com dígitos e pontuação de CPF é buscada pelos dígitos (123.456 -> 123456*)
+_CPF_INPUT = re.compile(r'^[\d.\-\s]+$')
+
+# Palavras frequentes em português que não ajudam a distinguir documentos
+STOPWORDS = {
+    'a', 'as', 'o', 'os', 'de', 'da', 'das', 'do', 'dos', 'e', 'em', 'na', 'nas', 'no', 'nos',
+    'um', 'uma', 'para', 'por', 'com', 'sem', 'que', 'se', 'ao', 'aos', 'entre', 'ou'
+}
+
+MAX_QUERY_TERMS = 16
+
+# Problemas semelhantes: só os termos mais raros entram no MATCH; termos presentes em mais
+# problemas que o limite não restringem os candidatos e fariam o BM25 pontuar quase o índice todo
+SIMILAR_QUERY_TERMS = 4
+COMMON_TERM_DOCUMENTS = 50000
+
+# Frequência dos termos (problemas que contêm o termo) já consultada; aproximada por processo
+TERM_CACHE_SIZE = 10000
+_term_documents = {}
+
+# Candidatos lidos do índice antes de aplicar a afinidade (sistema, paciente, tipo)
+SIMILAR_CANDIDATE_POOL = 50
+
+# Pesos do BM25 por coluna (title, description) e bônus multiplicativos de afinidade
+ISSUE_COLUMN_WEIGHTS = (2.0, 1.0)
+AFFINITY_BONUS = {'same_patient': 0.5, 'same_system': 0.25, 'same_type': 0.25}
+
+
+def search_terms(value, min_length=2):
+    """Termos distintos do texto, em minúsculas, sem palavras vazias"""
+    terms = []
+    for word in _WORDS.findall((value or '').lower()):
+        if len(word) >= min_length and word not in STOPWORDS and word not in terms:
+            terms.append(word)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def fts_any_query(terms):
+    """Expressão MATCH que aceita documentos com qualquer um dos termos (ranqueados pelo BM25)"""
+    return ' OR '.join(_quote(term) for term in terms)
+
+
+def fts_prefix_query(terms):
+    """Expressão MATCH em que todos os termos precisam aparecer, o último como prefixo"""
+    if not terms:
+        return ''
+    quoted = [_quote(term) for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def fts_available(name):
+    """Indica se a tabela FTS existe (bancos ainda não migrados ou outros dialetos não têm)
+
+    A verificação fica em cache por banco e é refeita ao final de apply_migrations.
+    """
+    return name in fts_tables(db.engine)
+
+
+def _index_term(term):
+    """Termo como o tokenizador do índice o armazena (sem acentos)"""
+    decomposed = unicodedata.normalize('NFKD', term)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def term_documents(terms):
+    """Quantos problemas contêm cada termo, pela tabela fts5vocab ({termo: quantidade})"""
+    counts = {}
+    for term in terms:
+        key = _index_term(term)
+        if key not in _term_documents:
+            documents = db.session.execute(
+                text(f"SELECT doc FROM {ISSUES_VOCAB} WHERE term = :term"), {'term': key}
+            ).scalar()
+            if not documents:
+                # Termo ausente do índice: não entra no cache, pode aparecer em problemas novos
+                counts[term] = 0
+                continue
+            if len(_term_documents) >= TERM_CACHE_SIZE:
+                _term_documents.clear()
+            _term_documents[key] = documents
+        counts[term] = _term_documents[key]
+    return counts
+
+
+def selective_terms(terms, counts):
+    """Termos mais raros para o MATCH de problemas semelhantes, dada a frequência de cada um
+
+    Retorna (termos, ranquear): ranquear é False quando só restam termos comuns; nesse caso
+    usa-se apenas o mais raro e os candidatos saem pela ordem do índice, sem BM25.
+    """
+    # Um termo presente em um único problema (o próprio) não traz candidatos
+    present = sorted((term for term in terms if counts.get(term, 0) > 1), key=lambda term: counts[term])
+    if not present:
+        return [], True
+
+    selective = [term for term in present if counts[term] <= COMMON_TERM_DOCUMENTS]
+    if not selective:
+        return present[:1], False
+    return selective[:SIMILAR_QUERY_TERMS], True
+
+
+def find_similar_issues(issue, limit=5, open_only=True):
+    """Problemas semelhantes pelo BM25 sobre título/descrição, com bônus de mesmo sistema/paciente
+
+    Retorna lista de (DataQualityIssue, pontuação); usa o critério antigo (mesmo tipo)
+    quando o índice FTS não existe.
+    """
+    terms = search_terms(f'{issue.title} {issue.description}')
+    if not terms or not fts_available(ISSUES_FTS):
+        query = DataQualityIssue.query.filter(
+            DataQualityIssue.issue_type == issue.issue_type,
+            DataQualityIssue.id != issue.id
+        )
+        if open_only:
+            query = query.filter(DataQualityIssue.status == 'open')
+        return [(similar, None) for similar in query.limit(limit).all()]
+
+    if fts_available(ISSUES_VOCAB):
+        terms, ranked = selective_terms(terms, term_documents(terms))
+    else:
+        terms, ranked = terms[:SIMILAR_QUERY_TERMS], True
+    if not terms:
+        return []
+
+    # O FTS5 devolve os melhores candidatos pelo rank; a afinidade reordena apenas esse conjunto.
+    # Só com termos comuns, os candidatos são os mais recentes (ordem do rowid, sem pontuar todos)
+    status_filter = "AND i.status = 'open'" if open_only else ''
+    candidate_order = 'score' if ranked else 'rowid DESC'
+    rows = db.session.execute(text(f"""
+        SELECT i.id, -c.score
+               * (1 + CASE WHEN i.patient_id IS NOT NULL AND i.patient_id = :patient_id THEN :same_patient ELSE 0 END
+                    + CASE WHEN i.system_id = :system_id THEN :same_system ELSE 0 END
+                    + CASE WHEN i.issue_type = :issue_type THEN :same_type ELSE 0 END) AS similarity
+        FROM (
+            SELECT rowid AS id, bm25({ISSUES_FTS}, :title_weight, :description_weight) AS score
+            FROM {ISSUES_FTS}
+            WHERE {ISSUES_FTS} MATCH :match AND rowid != :issue_id
+            ORDER BY {candidate_order}
+            LIMIT :pool
+        ) AS c
+        JOIN data_quality_issues AS i ON i.id = c.id
+        WHERE 1 = 1 {status_filter}
+        ORDER BY similarity DESC, i.id DESC
+        LIMIT :limit
+    """), {
+        'match': fts_any_query(terms),
+        'issue_id': issue.id,
+        'patient_id': issue.patient_id,
+        'system_id': issue.system_id,
+        'issue_type': issue.issue_type,
+        'title_weight': ISSUE_COLUMN_WEIGHTS[0],
+        'description_weight': ISSUE_COLUMN_WEIGHTS[1],
+        'pool': SIMILAR_CANDIDATE_POOL,
+        'limit': limit,
+        **AFFINITY_BONUS
+    }).all()
+
+    if not rows:
+        return []
+
+    issues = {
+        similar.id: similar
+        for similar in DataQualityIssue.query.filter(DataQualityIssue.id.in_([row.id for row in rows]))
+    }
+    return [(issues[row.id], round(row.similarity, 4)) for row in rows if row.id in issues]
+
+
+def patient_match_query(search):
+    """Expressão MATCH da busca de pacientes: todos os termos, o último como prefixo"""
+    search = (search or '').strip()
+    if _CPF_INPUT.match(search):
+        digits = _NON_DIGITS.sub('', search)
+        return f'{_quote(digits)}*' if digits else ''
+    return fts_prefix_query(search_terms(search, min_length=1))
+
+
+def patient_search_condition(search):
+    """Filtro de pacientes pelo índice FTS (nome, código, CPF e e-mail, sem acentos)
+
+    Sem o índice, mantém a busca por substring (LIKE) nas colunas originais.
+    """
+    match = patient_match_query(search)
+    if not match or not fts_available(PATIENTS_FTS):
+        return (
+            Patient.name.contains(search) |
+            Patient.cpf.contains(search) |
+            Patient.patient_id.contains(search)
+        )
+
+    matching_ids = text(
+        f"SELECT rowid FROM {PATIENTS_FTS} WHERE {PATIENTS_FTS} MATCH :patient_match"
+    ).bindparams(patient_match=match).columns(column('rowid', Integer))
+    return Patient.id.in_(matching_ids)
+
+
+def patient_search_join(query, search):
+    """Une a consulta de pacientes ao índice FTS, ordenada pelo rowid do índice
+
+    O FTS5 entrega as correspondências já em ordem de rowid, então com LIMIT o SQLite para
+    nas primeiras linhas sem ler todas (usado na busca incremental da tela de pacientes).
+    """
+    match = patient_match_query(search)
+    if not match or not fts_available(PATIENTS_FTS):
+        return query.filter(patient_search_condition(search)).order_by(Patient.id)
+
+    fts = table(PATIENTS_FTS, column('rowid', Integer))
+    return query.join(fts, fts.c.rowid == Patient.id).filter(
+        text(f"{PATIENTS_FTS} MATCH :patient_match").bindparams(patient_match=match)
+    ).order_by(fts.c.rowid)
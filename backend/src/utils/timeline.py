@@ -0,0 +1,210 @@
+"""
+Timeline do paciente em streaming
+
+Registros médicos e problemas de qualidade são lidos como dois fluxos já ordenados pelo SQL
+(mais recentes primeiro) e intercalados com heapq.merge; apenas a janela pedida é lida do banco
+e serializada em partes.
+"""
+
+import heapq
+import json
+from datetime import datetime
+from itertools import chain, islice
+from sqlalchemy import and_, or_, select
+from src.models.patient import MedicalRecord, DataQualityIssue, db
+from src.utils.pagination import encode_cursor, decode_cursor
+
+DEFAULT_TIMELINE_LIMIT = 100
+MAX_TIMELINE_LIMIT = 1000
+TIMELINE_TYPES = ('medical_record', 'quality_issue')
+
+# Desempate entre fluxos com a mesma data: registros antes de problemas (ordem decrescente)
+_SOURCE_RANK = {'medical_record': 1, 'quality_issue': 0}
+
+# Eventos serializados por parte da resposta
+_STREAM_BATCH = 50
+
+
+def parse_timeline_datetime(value, name):
+    """Converte um limite da janela (ISO 8601); lança ValueError se for inválido"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f'Parâmetro {name} inválido')
+
+
+def _window_filters(date_column, id_column, source, before, after, cursor_values):
+    filters = []
+    if before is not None:
+        filters.append(date_column < before)
+    if after is not None:
+        filters.append(date_column > after)
+    if cursor_values is not None:
+        # Continua estritamente depois do último evento entregue na ordem (data, fonte, id) decrescente
+        cursor_date, cursor_rank, cursor_id = cursor_values
+        rank = _SOURCE_RANK[source]
+        if rank < cursor_rank:
+            filters.append(date_column <= cursor_date)
+        elif rank > cursor_rank:
+            filters.append(date_column < cursor_date)
+        else:
+            filters.append(or_(
+                date_column < cursor_date,
+                and_(date_column == cursor_date, id_column < cursor_id)
+            ))
+    return filters
+
+
+def _record_stream(patient_id, filters, categories, limit):
+    statement = select(
+        MedicalRecord.id, MedicalRecord.record_date, MedicalRecord.record_type,
+        MedicalRecord.department, MedicalRecord.description, MedicalRecord.doctor_name,
+        MedicalRecord.system_source
+    ).where(MedicalRecord.patient_id == patient_id, *filters)
+    if categories:
+        statement = statement.where(MedicalRecord.record_type.in_(categories))
+    statement = statement.order_by(
+        MedicalRecord.record_date.desc(), MedicalRecord.id.desc()
+    ).limit(limit)
+
+    rank = _SOURCE_RANK['medical_record']
+    for row in db.session.execute(statement, execution_options={'yield_per': _STREAM_BATCH * 4}):
+        yield (row.record_date, rank, row.id), {
+            'id': f'record_{row.id}',
+            'type': 'medical_record',
+            'date': row.record_date.isoformat(),
+            'title': f'{row.record_type.title()} - {row.department or "Departamento não especificado"}',
+            'description': row.description,
+            'doctor': row.doctor_name,
+            'system_source': row.system_source,
+            'category': row.record_type
+        }
+
+
+def _issue_stream(patient_id, filters, categories, limit):
+    statement = select(
+        DataQualityIssue.id, DataQualityIssue.detected_at, DataQualityIssue.title,
+        DataQualityIssue.description, DataQualityIssue.priority, DataQualityIssue.status,
+        DataQualityIssue.issue_type
+    ).where(DataQualityIssue.patient_id == patient_id, *filters)
+    if categories:
+        statement = statement.where(DataQualityIssue.issue_type.in_(categories))
+    statement = statement.order_by(
+        DataQualityIssue.detected_at.desc(), DataQualityIssue.id.desc()
+    ).limit(limit)
+
+    rank = _SOURCE_RANK['quality_issue']
+    for row in db.session.execute(statement, execution_options={'yield_per': _STREAM_BATCH * 4}):
+        yield (row.detected_at, rank, row.id), {
+            'id': f'issue_{row.id}',
+            'type': 'quality_issue',
+            'date': row.detected_at.isoformat(),
+            'title': row.title,
+            'description': row.description,
+            'priority': row.priority,
+            'status': row.status,
+            'issue_type': row.issue_type
+        }
+
+
+class TimelineWindow:
+    """Parâmetros de uma janela da timeline (limites de data, cursor, tipos e categorias)"""
+
+    def __init__(self, before=None, after=None, limit=DEFAULT_TIMELINE_LIMIT, cursor=None,
+                 types=None, categories=None):
+        if limit < 1:
+            raise ValueError('Parâmetro limit deve ser positivo')
+        types = list(types or TIMELINE_TYPES)
+        unknown = [event_type for event_type in types if event_type not in TIMELINE_TYPES]
+        if unknown:
+            raise ValueError(f'Tipo de evento inválido: {unknown[0]}')
+
+        if before is not None and after is not None and after >= before:
+            raise ValueError('Parâmetro after deve ser anterior a before')
+
+        self.before = before
+        self.after = after
+        self.limit = min(limit, MAX_TIMELINE_LIMIT)
+        self.cursor = cursor
+        self.cursor_values = decode_cursor(cursor, [datetime, int, int]) if cursor else None
+        if self.cursor_values is not None and self.cursor_values[1] not in _SOURCE_RANK.values():
+            raise ValueError('Cursor inválido')
+        self.types = types
+        self.categories = list(categories or [])
+
+    def events(self, patient_id):
+        """Itera (chave, evento) em ordem decrescente, lendo no máximo limit + 1 eventos por fluxo"""
+        # O evento extra indica se existe uma próxima janela
+        per_stream = self.limit + 1
+        streams = []
+        if 'medical_record' in self.types:
+            filters = _window_filters(MedicalRecord.record_date, MedicalRecord.id, 'medical_record',
+                                      self.before, self.after, self.cursor_values)
+            streams.append(_record_stream(patient_id, filters, self.categories, per_stream))
+        if 'quality_issue' in self.types:
+            filters = _window_filters(DataQualityIssue.detected_at, DataQualityIssue.id, 'quality_issue',
+                                      self.before, self.after, self.cursor_values)
+            streams.append(_issue_stream(patient_id, filters, self.categories, per_stream))
+
+        merged = heapq.merge(*streams, key=lambda item: item[0], reverse=True)
+        return islice(merged, per_stream)
+
+    def open(self, patient_id):
+        """Eventos com as consultas já executadas: falhas aparecem antes do início da resposta"""
+        events = self.events(patient_id)
+        first = next(events, None)
+        return chain([first], events) if first is not None else iter(())
+
+
+def stream_timeline_json(patient_id, patient_name, window, events=None):
+    """Gera o corpo JSON da timeline em partes, mantendo o formato da resposta original
+
+    events: iterador de window.open(); sem ele as consultas só rodam no primeiro evento. Uma
+    falha depois do início da resposta (status já enviado) fecha o JSON com o campo "error" e um
+    next_cursor a partir do último evento entregue.
+    """
+    if events is None:
+        events = window.events(patient_id)
+
+    yield json.dumps({'patient_id': patient_id, 'patient_name': patient_name})[:-1]
+    yield ', "timeline": ['
+
+    sent = 0
+    sent_key = None
+    has_more = False
+    error = None
+    batch = []
+    batch_key = None
+    try:
+        for key, event in events:
+            if sent + len(batch) == window.limit:
+                has_more = True
+                break
+            batch.append(json.dumps(event))
+            batch_key = key
+            if len(batch) >= _STREAM_BATCH:
+                yield (', ' if sent else '') + ', '.join(batch)
+                sent, sent_key, batch = sent + len(batch), batch_key, []
+    except Exception as e:
+        db.session.rollback()
+        # O lote pendente é descartado: a continuação parte do último evento entregue
+        error = f'Erro interno: {str(e)}'
+        batch = []
+        has_more = True
+    if batch:
+        yield (', ' if sent else '') + ', '.join(batch)
+        sent, sent_key = sent + len(batch), batch_key
+
+    if has_more and sent_key is not None:
+        next_cursor, next_before = encode_cursor(list(sent_key)), sent_key[0].isoformat()
+    else:
+        next_cursor, next_before = (window.cursor, None) if has_more else (None, None)
+    yield '], ' + ('"error": ' + json.dumps(error) + ', ' if error else '') + '"window": ' + json.dumps({
+        'limit': window.limit,
+        'returned': sent,
+        'has_more': has_more,
+        'next_cursor': next_cursor,
+        'next_before': next_before
+    }) + '}'
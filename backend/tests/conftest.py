@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+from aiohttp import web
+from flask import Flask
+
+# Permite importar o pacote src a partir de backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class ServerThread:
+    """Servidor aiohttp em uma thread com loop próprio (o código testado usa asyncio.run)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.runner = None
+        self.url = None
+
+    async def _start(self):
+        # Handlers presos (servidor travado) são cancelados ao encerrar, sem esperar
+        self.runner = web.AppRunner(self.app, handler_cancellation=True, shutdown_timeout=0.1)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://127.0.0.1:{port}'
+
+    def start(self):
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(timeout=10)
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=10)
+        self.loop.close()
+
+
+@pytest.fixture
+def serve():
+    """Sobe uma aplicação aiohttp e devolve a URL base; encerrada ao fim do teste"""
+    servers = []
+
+    def _serve(app):
+        server = ServerThread(app)
+        servers.append(server)
+        return server.start()
+
+    yield _serve
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Aplicação com os modelos registrados sobre um banco SQLite temporário já migrado"""
+    from src.database import db
+    from src.models.auth import User, UserSession
+    from src.models.patient import Patient, MedicalRecord, HealthSystem, DataQualityIssue, DashboardMetrics
+    from src.models.quality import (
+        PatientBlockingKey, DuplicateCandidate, IssueMetricsRollup, QualitySnapshot, DepartmentSnapshot
+    )
+    from src.models.integration import SyncLog, SyncLogDaily
+    from src.utils.migrations import apply_migrations
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'healthgraph.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """Cliente de teste com os blueprints da API e um token JWT válido"""
+    from flask_jwt_extended import JWTManager, create_access_token
+    from src.routes.issues import issues_bp
+    from src.routes.exports import exports_bp
+    from src.routes.integrations import integrations_bp
+
+    app.config['JWT_SECRET_KEY'] = 'chave-de-teste-com-tamanho-suficiente'
+    JWTManager(app)
+    app.register_blueprint(issues_bp, url_prefix='/api/issues')
+    app.register_blueprint(exports_bp, url_prefix='/api/exports')
+    app.register_blueprint(integrations_bp, url_prefix='/api/integrations')
+
+    token = create_access_token(identity='1')
+    client = app.test_client()
+    client.environ_base['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return client
@@ -0,0 +1,141 @@
+"""
+Ingestão de Bundles FHIR: pacientes sem CPF e horário de gravação
+"""
+
+import io
+import json
+import time
+from datetime import date, datetime
+
+from src.database import db
+from src.models.patient import HealthSystem, MedicalRecord, Patient
+from src.utils.bundle_ingestion import ingest_bundle
+
+
+def fhir_patient(code, name, cpf=None, phone=None, email=None, address=None, gender='female'):
+    identifiers = [{'use': 'usual', 'value': code}]
+    if cpf:
+        identifiers.append({'system': 'urn:oid:cpf', 'value': cpf})
+    resource = {
+        'resourceType': 'Patient', 'id': code, 'identifier': identifiers,
+        'name': [{'text': name}], 'birthDate': '1980-02-03'
+    }
+    if gender:
+        resource['gender'] = gender
+    telecom = [{'system': 'phone', 'value': phone}] if phone else []
+    telecom += [{'system': 'email', 'value': email}] if email else []
+    if telecom:
+        resource['telecom'] = telecom
+    if address:
+        resource['address'] = [{'text': address}]
+    return {'fullUrl': f'urn:uuid:{code}', 'resource': resource}
+
+
+def fhir_encounter(encounter_id, code):
+    return {'resource': {
+        'resourceType': 'Encounter', 'id': encounter_id, 'subject': {'reference': f'Patient/{code}'},
+        'type': [{'text': 'Consulta de rotina'}], 'participant': [{'individual': {'display': 'Dr. Rui Lima'}}],
+        'serviceType': {'text': 'Clínica Geral'}, 'period': {'start': '2024-03-01T10:00:00Z'}
+    }}
+
+
+def bundle(*entries):
+    return io.BytesIO(json.dumps({'resourceType': 'Bundle', 'type': 'batch', 'entry': list(entries)}).encode())
+
+
+def add_system():
+    system = HealthSystem(name='HIS Norte', system_type='HIS')
+    db.session.add(system)
+    db.session.commit()
+    return system
+
+
+def test_patient_without_cpf_updates_existing_patient(app):
+    system = add_system()
+    db.session.add(Patient(patient_id='P100', name='Nome Antigo', cpf='123.456.789-09',
+                           birth_date=date(1980, 2, 3), gender='F'))
+    db.session.commit()
+
+    report = ingest_bundle(system, bundle(
+        fhir_patient('P100', 'Maria Clara Souza', phone='11 98888-7777'),
+        fhir_patient('P200', 'Sem Cadastro'),
+        fhir_encounter('E1', 'P100')
+    ), 'fhir')
+
+    assert report['patients'] == {'inserted': 0, 'updated': 1, 'rejected': 1}
+    patient = Patient.query.filter_by(patient_id='P100').one()
+    assert patient.name == 'Maria Clara Souza'
+    assert patient.phone == '11 98888-7777'
+    assert patient.cpf == '123.456.789-09'
+    assert report['records']['inserted'] == 1
+    assert MedicalRecord.query.one().patient_id == patient.id
+
+
+def test_reingest_without_contact_fields_keeps_stored_values(app):
+    system = add_system()
+    ingest_bundle(system, bundle(fhir_patient(
+        'P300', 'Joana Prado', cpf='111.444.777-35', phone='11 97777-6666',
+        email='joana@example.com', address='Rua das Flores, 10'
+    )), 'fhir')
+
+    report = ingest_bundle(system, bundle(fhir_patient('P300', 'Joana Prado Lima', cpf='111.444.777-35', gender=None)),
+                           'fhir')
+
+    assert report['patients'] == {'inserted': 0, 'updated': 1, 'rejected': 0}
+    patient = Patient.query.filter_by(patient_id='P300').one()
+    assert patient.name == 'Joana Prado Lima'
+    assert (patient.phone, patient.email, patient.address, patient.gender) == (
+        '11 97777-6666', 'joana@example.com', 'Rua das Flores, 10', 'F'
+    )
+
+
+def test_partial_patient_with_another_patients_cpf_is_rejected(app):
+    system = add_system()
+    db.session.add_all([
+        Patient(patient_id='P400', name='Dono do CPF', cpf='111.444.777-35', birth_date=date(1970, 1, 1), gender='M'),
+        Patient(patient_id='P401', name='Outro Paciente', cpf='529.982.247-25', birth_date=date(1975, 5, 5), gender='F')
+    ])
+    db.session.commit()
+
+    # P401 sem data de nascimento (linha parcial) com o CPF de P400; P402 é um paciente novo válido
+    conflicting = fhir_patient('P401', 'Outro Paciente Atualizado', cpf='111.444.777-35')
+    del conflicting['resource']['birthDate']
+    report = ingest_bundle(system, bundle(
+        conflicting, fhir_patient('P402', 'Paciente Novo', cpf='390.533.447-05')
+    ), 'fhir')
+
+    assert report['patients'] == {'inserted': 1, 'updated': 0, 'rejected': 1}
+    assert Patient.query.filter_by(patient_id='P401').one().name == 'Outro Paciente'
+    assert Patient.query.filter_by(patient_id='P402').count() == 1
+
+
+class SlowStream:
+    """Fluxo que entrega o corpo em duas partes, com uma pausa entre elas (upload lento)"""
+
+    def __init__(self, body, split, pause):
+        self.parts = [body[:split], body[split:]]
+        self.pause = pause
+
+    def read(self, size=-1):
+        if not self.parts:
+            return b''
+        if len(self.parts) == 1:
+            time.sleep(self.pause)
+        return self.parts.pop(0)
+
+
+def test_rows_are_stamped_when_each_batch_is_written(app):
+    system = add_system()
+    body = bundle(
+        fhir_patient('P001', 'Primeira Paciente', cpf='111.444.777-35'),
+        fhir_patient('P002', 'Segunda Paciente', cpf='529.982.247-25')
+    ).getvalue()
+    # A primeira parte termina logo depois da primeira entrada
+    split = body.index(b'}}, {') + 3
+
+    report = ingest_bundle(system, SlowStream(body, split, pause=0.3), 'fhir', patient_batch_size=1)
+
+    assert report['patients']['inserted'] == 2
+    first, second = Patient.query.order_by(Patient.patient_id).all()
+    assert (second.updated_at - first.updated_at).total_seconds() >= 0.25
+    assert second.created_at == second.updated_at
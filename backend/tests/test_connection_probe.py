@@ -0,0 +1,108 @@
+"""
+Teste de conectividade das integrações contra um servidor FHIR de teste
+"""
+
+import asyncio
+import socket
+import time
+
+from aiohttp import web
+
+from src.utils.connection_probe import probe_systems
+
+TOKEN = 'token-valido'
+
+
+def fhir_app(metadata_status=200, patient_body=None, hang=False):
+    """Servidor FHIR mínimo: /metadata e /Patient exigindo o token"""
+
+    async def metadata(request):
+        if hang:
+            await asyncio.sleep(30)
+        return web.json_response({'resourceType': 'CapabilityStatement'}, status=metadata_status)
+
+    async def patients(request):
+        if request.headers.get('Authorization') != f'Bearer {TOKEN}':
+            return web.json_response({'resourceType': 'OperationOutcome'}, status=401)
+        if patient_body is not None:
+            return web.Response(text=patient_body, content_type='text/html')
+        return web.json_response({'resourceType': 'Bundle', 'total': 1, 'entry': []})
+
+    app = web.Application()
+    app.router.add_get('/fhir/metadata', metadata)
+    app.router.add_get('/fhir/Patient', patients)
+    return app
+
+
+def target(url, token=TOKEN, system_id=1):
+    return {'system_id': system_id, 'endpoint_url': f'{url}/fhir' if url else '', 'auth_token': token}
+
+
+def closed_port_url():
+    """URL de uma porta sem servidor escutando (conexão recusada)"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f'http://127.0.0.1:{port}'
+
+
+def test_probe_passes_all_checks(serve):
+    result = probe_systems([target(serve(fhir_app()))])[0]
+
+    assert result['connection_test'] and result['authentication_test'] and result['data_access_test']
+    assert result['error'] is None
+    assert result['response_time_ms'] is not None
+
+
+def test_probe_reports_rejected_token(serve):
+    result = probe_systems([target(serve(fhir_app()), token='expirado')])[0]
+
+    assert result['connection_test'] is True
+    assert result['authentication_test'] is False
+    assert result['data_access_test'] is False
+    assert result['error'] == 'Leitura de dados respondeu 401'
+
+
+def test_probe_reports_non_json_data(serve):
+    result = probe_systems([target(serve(fhir_app(patient_body='<html>manutenção</html>')))])[0]
+
+    assert result['connection_test'] is True
+    assert result['authentication_test'] is True
+    assert result['data_access_test'] is False
+    assert result['error'] == 'Resposta de dados não é JSON válido'
+
+
+def test_probe_reports_server_error(serve):
+    result = probe_systems([target(serve(fhir_app(metadata_status=503)))])[0]
+
+    assert result['connection_test'] is False
+    assert result['error'] == 'Servidor respondeu 503'
+
+
+def test_probe_times_out_hung_server_without_delaying_others(serve):
+    hung_url = serve(fhir_app(hang=True))
+    healthy_url = serve(fhir_app())
+
+    started = time.perf_counter()
+    hung, healthy = probe_systems([target(hung_url, system_id=1), target(healthy_url, system_id=2)], timeout=0.5)
+    elapsed = time.perf_counter() - started
+
+    assert hung['connection_test'] is False
+    assert hung['error'] == 'Tempo limite de 0.5s excedido'
+    assert healthy['data_access_test'] is True
+    assert elapsed < 2
+
+
+def test_probe_reports_refused_connection():
+    result = probe_systems([target(closed_port_url())])[0]
+
+    assert result['connection_test'] is False
+    assert result['error'].startswith('Falha na conexão')
+
+
+def test_probe_skips_unconfigured_system():
+    result = probe_systems([target(None)])[0]
+
+    assert result['configured'] is False
+    assert result['response_time_ms'] is None
+    assert result['error'] == 'Endpoint de integração não configurado'
@@ -0,0 +1,67 @@
+"""
+Exportação em massa: falhas antes e depois do início da resposta
+"""
+
+import json
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+from src.database import db
+from src.models.patient import Patient
+from src.utils import data_export
+
+
+@pytest.fixture
+def patients(app):
+    db.session.add_all([
+        Patient(patient_id=f'P{number}', name=f'Paciente {number}', cpf=f'000.000.000-0{number}',
+                birth_date=date(1980, 1, number), gender='F')
+        for number in range(1, 4)
+    ])
+    db.session.commit()
+
+
+def test_failure_in_first_batch_returns_500(client, patients):
+    db.session.execute(text('DROP TABLE medical_records'))
+    db.session.commit()
+
+    response = client.get('/api/exports/records')
+
+    assert response.status_code == 500
+    assert 'Erro interno' in response.get_json()['error']
+
+
+def test_failure_after_first_batch_ends_ndjson_with_error(client, patients, monkeypatch):
+    monkeypatch.setattr(data_export, 'EXPORT_BATCH_SIZE', 1)
+    batches = data_export.iter_keyset_batches
+
+    def failing_batches(*args):
+        iterator = batches(*args)
+        yield next(iterator)
+        raise RuntimeError('banco indisponível')
+
+    monkeypatch.setattr(data_export, 'iter_keyset_batches', failing_batches)
+    response = client.get('/api/exports/patients', buffered=False)
+    assert response.status_code == 200
+
+    body = []
+    with pytest.raises(RuntimeError):
+        for chunk in response.response:
+            body.append(chunk.decode() if isinstance(chunk, bytes) else chunk)
+
+    lines = [json.loads(line) for line in ''.join(body).splitlines()]
+    assert lines[0]['patient_id'] == 'P1'
+    assert lines[-1] == {'error': 'Exportação interrompida: banco indisponível'}
+
+
+def test_export_streams_every_batch(client, patients, monkeypatch):
+    monkeypatch.setattr(data_export, 'EXPORT_BATCH_SIZE', 2)
+
+    response = client.get('/api/exports/patients?format=csv')
+
+    assert response.status_code == 200
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 4
+    assert [line.split(',')[1] for line in lines[1:]] == ['P1', 'P2', 'P3']
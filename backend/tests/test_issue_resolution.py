@@ -0,0 +1,51 @@
+"""
+Resolução em massa: validação dos IDs e dos filtros enviados à API
+"""
+
+import pytest
+
+from src.database import db
+from src.models.patient import DataQualityIssue, HealthSystem
+
+
+@pytest.fixture
+def issues(app):
+    system = HealthSystem(name='HIS Sul', system_type='HIS')
+    db.session.add(system)
+    db.session.flush()
+    rows = [DataQualityIssue(system_id=system.id, issue_type='missing', priority='high',
+                             title=f'Problema {number}', description='Campo ausente', status='open')
+            for number in range(1, 4)]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+@pytest.mark.parametrize('ids', ['123', 12, [1, '2'], [True], {'id': 1}])
+def test_bulk_resolve_rejects_ids_that_are_not_a_list_of_ints(client, issues, ids):
+    response = client.post('/api/issues/bulk-resolve', json={'ids': ids})
+
+    assert response.status_code == 400
+    assert DataQualityIssue.query.filter_by(status='resolved').count() == 0
+
+
+@pytest.mark.parametrize('filters', [
+    {'system_id': '1'}, {'system_id': True}, {'priority': ['high']}, {'type': 3}, ['missing']
+])
+def test_bulk_resolve_rejects_badly_typed_filters(client, issues, filters):
+    response = client.post('/api/issues/bulk-resolve', json={'filter': filters})
+
+    assert response.status_code == 400
+    assert DataQualityIssue.query.filter_by(status='resolved').count() == 0
+
+
+def test_bulk_resolve_accepts_ids_and_typed_filters(client, issues):
+    response = client.post('/api/issues/bulk-resolve', json={'ids': [issues[0].id, 999]})
+    assert response.status_code == 200
+    assert response.get_json()['resolved'] == 1
+    assert response.get_json()['failed_ids'] == [999]
+
+    response = client.post('/api/issues/bulk-resolve',
+                           json={'filter': {'system_id': issues[0].system_id, 'priority': 'high'}})
+    assert response.status_code == 200
+    assert response.get_json()['resolved'] == 2
@@ -0,0 +1,42 @@
+"""
+Paginação por cursor: limites do tamanho da página
+"""
+
+import pytest
+
+from src.database import db
+from src.models.patient import DataQualityIssue, HealthSystem
+from src.utils import pagination
+
+
+@pytest.fixture
+def issues(app):
+    system = HealthSystem(name='HIS Sul', system_type='HIS')
+    db.session.add(system)
+    db.session.flush()
+    db.session.add_all([
+        DataQualityIssue(system_id=system.id, issue_type='missing', priority='high',
+                         title=f'Problema {number}', description='Campo ausente', status='open')
+        for number in range(1, 6)
+    ])
+    db.session.commit()
+
+
+@pytest.mark.parametrize('per_page', [0, -5])
+def test_cursor_listing_rejects_non_positive_per_page(client, issues, per_page):
+    response = client.get(f'/api/issues/?cursor=&per_page={per_page}')
+
+    assert response.status_code == 400
+    assert 'per_page' in response.get_json()['error']
+
+
+def test_cursor_listing_caps_per_page(client, issues, monkeypatch):
+    monkeypatch.setattr(pagination, 'MAX_PER_PAGE', 2)
+
+    response = client.get('/api/issues/?cursor=&per_page=1000')
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert len(data['issues']) == 2
+    assert data['pagination']['per_page'] == 2
+    assert data['pagination']['has_next'] is True
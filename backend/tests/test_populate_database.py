@@ -0,0 +1,57 @@
+"""
+Recarga do banco fictício: o rollup de problemas precisa continuar igual às contagens reais
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# populate_database define suas próprias cópias dos modelos, então roda em outro processo
+RELOAD_SCRIPT = """
+import json, sys
+from flask import Flask
+from sqlalchemy import text
+from src.database import db
+from src.utils.populate_database import populate_database
+from src.utils.migrations import apply_migrations
+
+app = Flask(__name__)
+app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + sys.argv[1]
+app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+db.init_app(app)
+
+populate_database(app, num_patients=40, num_records_per_patient=2, seed=7)
+with app.app_context():
+    apply_migrations(db.engine)
+populate_database(app, num_patients=30, num_records_per_patient=2, seed=8)
+
+with app.app_context():
+    rollup = dict(db.session.execute(text(
+        "SELECT status, SUM(issue_count) FROM issue_metrics_rollup GROUP BY status"
+    )).all())
+    issues = dict(db.session.execute(text(
+        "SELECT status, COUNT(*) FROM data_quality_issues GROUP BY status"
+    )).all())
+    issues['detected'] = db.session.execute(text("SELECT COUNT(*) FROM data_quality_issues")).scalar()
+    negative = db.session.execute(text(
+        "SELECT COUNT(*) FROM issue_metrics_rollup WHERE issue_count < 0"
+    )).scalar()
+print(json.dumps({'rollup': rollup, 'issues': issues, 'negative': negative}))
+"""
+
+
+def test_reload_keeps_issue_rollup_consistent(tmp_path):
+    result = subprocess.run(
+        [sys.executable, '-c', RELOAD_SCRIPT, str(tmp_path / 'reload.db')],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=300
+    )
+    assert result.returncode == 0, result.stderr
+    counts = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert counts['negative'] == 0
+    assert counts['issues']['detected'] > 0
+    for status, count in counts['issues'].items():
+        assert counts['rollup'].get(status, 0) == count, status
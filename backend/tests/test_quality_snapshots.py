@@ -0,0 +1,45 @@
+"""
+Job de snapshots: a marcação do dia é confirmada antes do recálculo das pontuações
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import select
+
+from src.database import db
+from src.models.quality import QualitySnapshot
+from src.utils import quality_snapshots
+
+
+def test_claim_is_committed_before_scores_are_refreshed(app, monkeypatch):
+    now = datetime(2026, 3, 10, 8, 0)
+    seen = []
+
+    def refresh():
+        # Outra conexão só enxerga a marcação se ela já foi confirmada (e a trava liberada)
+        with db.engine.connect() as connection:
+            seen.append(connection.execute(
+                select(QualitySnapshot.calculated_at).where(QualitySnapshot.day == now.date())
+            ).scalar())
+        seen.append(quality_snapshots._claim_snapshot(now))
+
+    monkeypatch.setattr(quality_snapshots, 'refresh_quality_scores', refresh)
+    result = quality_snapshots.run_snapshot_job(now=now, claim=True)
+
+    assert seen == [now, False]
+    assert result['snapshot']['day'] == '2026-03-10'
+    assert quality_snapshots.run_snapshot_job(now=now, claim=True) is None
+
+
+def test_failed_job_releases_claim(app, monkeypatch):
+    now = datetime(2026, 3, 10, 8, 0)
+
+    def refresh():
+        raise RuntimeError('falha no cálculo')
+
+    monkeypatch.setattr(quality_snapshots, 'refresh_quality_scores', refresh)
+    with pytest.raises(RuntimeError):
+        quality_snapshots.run_snapshot_job(now=now, claim=True)
+
+    assert quality_snapshots._claim_snapshot(now) is True
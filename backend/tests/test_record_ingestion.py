@@ -0,0 +1,157 @@
+"""
+Ingestão incremental contra um sistema de origem de teste (GET /records paginado)
+"""
+
+import json
+from datetime import date, datetime, timedelta
+
+import pytest
+from aiohttp import web
+
+from src.database import db
+from src.models.integration import SyncLog
+from src.models.patient import HealthSystem, MedicalRecord, Patient
+from src.utils.record_ingestion import IngestionError, ingest_system_records
+from src.utils.sync_service import run_system_sync
+
+
+def source_app(records, truncate=False):
+    """Origem que pagina os registros por (updated_at, id) a partir de since/after_id"""
+    requests = []
+
+    async def list_records(request):
+        requests.append(dict(request.query))
+        if truncate:
+            # Content-Length maior que o corpo: o cliente recebe uma leitura incompleta
+            response = web.StreamResponse(headers={'Content-Type': 'application/json'})
+            response.content_length = 1000
+            await response.prepare(request)
+            await response.write(b'{"records": [')
+            request.transport.close()
+            return response
+
+        pending = sorted(records, key=lambda record: (record['updated_at'], record['id']))
+        since = request.query.get('since')
+        if since is not None:
+            after = (since, json.loads(request.query['after_id']))
+            pending = [record for record in pending if (record['updated_at'], record['id']) > after]
+        count = int(request.query['_count'])
+        return web.json_response({'records': pending[:count], 'has_more': len(pending) > count})
+
+    app = web.Application()
+    app.router.add_get('/api/records', list_records)
+    return app, requests
+
+
+def source_record(number, patient_id='P001', updated_at=None):
+    updated_at = updated_at or datetime.utcnow() - timedelta(hours=2) + timedelta(minutes=number)
+    return {
+        'id': f'R{number:03d}',
+        'updated_at': updated_at.isoformat(),
+        'patient_id': patient_id,
+        'record_type': 'exam',
+        'description': f'Exame {number}',
+        'doctor_name': 'Dra. Ana Souza',
+        'department': 'Cardiologia',
+        'record_date': '2024-05-10T09:00:00'
+    }
+
+
+def add_patient(patient_id, cpf):
+    db.session.add(Patient(patient_id=patient_id, name=f'Paciente {patient_id}', cpf=cpf,
+                           birth_date=date(1980, 1, 1), gender='F'))
+    db.session.commit()
+
+
+def add_system(url):
+    system = HealthSystem(name='LIS Central', system_type='LIS', endpoint_url=f'{url}/api')
+    db.session.add(system)
+    db.session.commit()
+    return system
+
+
+def test_ingestion_resumes_from_watermark(app, serve):
+    add_patient('P001', '111.111.111-11')
+    records = [source_record(number) for number in range(1, 8)]
+    source, requests = source_app(records)
+    system = add_system(serve(source))
+
+    first = ingest_system_records(system, batch_size=3, max_batches=1)
+    assert first['inserted'] == 3 and first['has_more'] is True
+    assert system.sync_watermark_id == '"R003"'
+
+    second = ingest_system_records(system, batch_size=3)
+    assert second['inserted'] == 4 and second['updated'] == 0 and second['has_more'] is False
+    assert system.sync_watermark_id == '"R007"'
+    assert MedicalRecord.query.count() == 7
+
+    # A segunda execução começou exatamente depois do último registro gravado
+    resumed = requests[1]
+    assert resumed['after_id'] == '"R003"'
+    assert datetime.fromisoformat(resumed['since']) == datetime.fromisoformat(records[2]['updated_at'])
+
+
+def test_numeric_ids_keep_their_type_in_the_watermark(app, serve):
+    add_patient('P001', '111.111.111-11')
+    updated_at = datetime.utcnow() - timedelta(hours=1)
+    records = [dict(source_record(number, updated_at=updated_at), id=number) for number in (8, 9, 10, 11)]
+    source, requests = source_app(records)
+    system = add_system(serve(source))
+
+    result = ingest_system_records(system, batch_size=3)
+
+    # Comparado como texto, "10" viria antes de "9" e a segunda página repetiria os registros
+    assert result['inserted'] == 4 and result['updated'] == 0
+    assert requests[1]['after_id'] == '10'
+    assert system.sync_watermark_id == '11'
+
+
+def test_record_for_unknown_patient_holds_the_watermark(app, serve):
+    add_patient('P001', '111.111.111-11')
+    records = [source_record(1), source_record(2, patient_id='P002'), source_record(3)]
+    system = add_system(serve(source_app(records)[0]))
+
+    held = ingest_system_records(system)
+    assert held['inserted'] == 1 and held['waiting'] == 2
+    assert system.sync_watermark_id == '"R001"'
+
+    # O paciente chega depois: a próxima sincronização grava o registro retido e os seguintes
+    add_patient('P002', '222.222.222-22')
+    resumed = ingest_system_records(system)
+    assert resumed['inserted'] == 2 and resumed['waiting'] == 0 and resumed['rejected'] == 0
+    assert system.sync_watermark_id == '"R003"'
+    assert MedicalRecord.query.count() == 3
+
+
+def test_old_record_for_unknown_patient_is_rejected_with_a_warning(app, serve):
+    add_patient('P001', '111.111.111-11')
+    stale = datetime.utcnow() - timedelta(days=3)
+    records = [source_record(1, patient_id='P404', updated_at=stale), source_record(2)]
+    system = add_system(serve(source_app(records)[0]))
+
+    result = run_system_sync(system)
+    db.session.commit()
+
+    assert result['ingestion']['rejected'] == 1 and result['ingestion']['inserted'] == 1
+    assert system.sync_watermark_id == '"R002"'
+    log = SyncLog.query.filter_by(system_id=system.id, event='sync').one()
+    assert log.status == 'warning'
+    assert '1 rejeitados' in log.details
+
+
+def test_clean_sync_is_logged_as_success(app, serve):
+    add_patient('P001', '111.111.111-11')
+    system = add_system(serve(source_app([source_record(1), source_record(2)])[0]))
+
+    run_system_sync(system)
+    db.session.commit()
+
+    assert SyncLog.query.filter_by(system_id=system.id, event='sync').one().status == 'success'
+
+
+def test_truncated_response_raises_ingestion_error(app, serve):
+    system = add_system(serve(source_app([], truncate=True)[0]))
+
+    with pytest.raises(IngestionError, match='Resposta incompleta'):
+        ingest_system_records(system)
+    assert system.sync_watermark is None
@@ -0,0 +1,53 @@
+"""
+Escritor XLSX: seções maiores que o limite de linhas do Excel continuam em outra planilha
+"""
+
+import re
+import zipfile
+
+from src.utils.report_writers import XlsxReportWriter
+
+
+def sheet_rows(archive, number):
+    xml = archive.read(f'xl/worksheets/sheet{number}.xml').decode('utf-8')
+    return [re.findall(r'<t xml:space="preserve">([^<]*)</t>|<v>([^<]*)</v>', row)
+            for row in re.findall(r'<row r="\d+">(.*?)</row>', xml)]
+
+
+def test_section_over_the_row_limit_continues_in_a_new_sheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(XlsxReportWriter, 'MAX_SHEET_ROWS', 4)
+    path = tmp_path / 'relatorio.xlsx'
+
+    writer = XlsxReportWriter(str(path))
+    writer.start_section('Problemas', ['ID', 'Título'])
+    for number in range(1, 8):
+        writer.write_row([number, f'Problema {number}'])
+    writer.end_section()
+    writer.start_section('Pacientes', ['ID'])
+    writer.write_row([1])
+    writer.end_section()
+    writer.close()
+
+    with zipfile.ZipFile(path) as archive:
+        workbook = archive.read('xl/workbook.xml').decode('utf-8')
+        names = re.findall(r'<sheet name="([^"]+)"', workbook)
+        rows = [sheet_rows(archive, number) for number in range(1, len(names) + 1)]
+
+    assert names == ['Problemas', 'Problemas (2)', 'Problemas (3)', 'Pacientes']
+    assert [len(sheet) for sheet in rows] == [4, 4, 2, 2]
+    # Cada parte repete o cabeçalho e nenhuma linha se perde ou repete
+    for sheet in rows[:3]:
+        assert [text for text, _ in sheet[0]] == ['ID', 'Título']
+    ids = [int(cells[0][1]) for sheet in rows[:3] for cells in sheet[1:]]
+    assert ids == list(range(1, 8))
+
+
+def test_continuation_sheet_name_keeps_the_part_number(tmp_path, monkeypatch):
+    monkeypatch.setattr(XlsxReportWriter, 'MAX_SHEET_ROWS', 2)
+    writer = XlsxReportWriter(str(tmp_path / 'longo.xlsx'))
+    writer.start_section('Problemas por sistema de integração', ['ID'])
+    for number in range(3):
+        writer.write_row([number])
+    writer.close()
+
+    assert writer.sheets[1].endswith(' (2)') and len(writer.sheets[1]) <= 31
@@ -0,0 +1,32 @@
+"""
+Agendador de sincronizações: quais sistemas entram na agenda
+"""
+
+from datetime import datetime
+
+from src.database import db
+from src.models.patient import HealthSystem
+from src.utils.sync_scheduler import SyncScheduler
+
+
+def test_systems_without_endpoint_are_not_scheduled(app):
+    configured = HealthSystem(name='HIS Norte', system_type='HIS', endpoint_url='http://127.0.0.1:1/api')
+    db.session.add_all([
+        configured,
+        HealthSystem(name='LIS Sul', system_type='LIS'),
+        HealthSystem(name='RIS Leste', system_type='RIS', endpoint_url='')
+    ])
+    db.session.commit()
+
+    scheduler = SyncScheduler(app)
+    try:
+        scheduler._refresh_systems(datetime.utcnow())
+        assert list(scheduler.entries) == [configured.id]
+
+        # Endpoint removido: o sistema sai da agenda na releitura seguinte
+        configured.endpoint_url = None
+        db.session.commit()
+        scheduler._refresh_systems(datetime.utcnow())
+        assert scheduler.entries == {}
+    finally:
+        scheduler.executor.shutdown()
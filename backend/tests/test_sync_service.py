@@ -0,0 +1,44 @@
+"""
+Métricas de sincronização: disponibilidade calculada só sobre tentativas reais
+"""
+
+from datetime import datetime, timedelta
+
+from src.database import db
+from src.models.integration import SyncLogDaily
+from src.models.patient import HealthSystem
+from src.utils.sync_service import record_sync_log, run_system_sync, system_sync_metrics
+
+
+def test_uptime_ignores_not_configured_warnings_and_probes(app):
+    now = datetime(2026, 3, 10, 12, 0)
+    system = HealthSystem(name='HIS Norte', system_type='HIS', endpoint_url='http://127.0.0.1:1/api')
+    db.session.add(system)
+    db.session.flush()
+
+    record_sync_log(system, 'sync', 'warning', 'Endpoint de integração não configurado', timestamp=now - timedelta(hours=3))
+    record_sync_log(system, 'sync', 'success', 'Sincronização completa', records_synced=10, duration_ms=120,
+                    timestamp=now - timedelta(hours=2))
+    record_sync_log(system, 'sync', 'error', 'Falha na sincronização', duration_ms=3000, timestamp=now - timedelta(hours=1))
+    record_sync_log(system, 'test', 'success', 'Teste de conectividade concluído', duration_ms=40, timestamp=now)
+    # Compactados: 1 sucesso, 1 falha e 1 aviso de endpoint não configurado (sem duração)
+    db.session.add(SyncLogDaily(system_id=system.id, day=(now - timedelta(days=10)).date(), event='sync',
+                                success_count=1, warning_count=1, error_count=1, records_synced=5,
+                                duration_sum=500, duration_count=2))
+    db.session.commit()
+
+    metrics = system_sync_metrics(system.id, now)
+
+    assert metrics['uptime_percentage'] == 50.0
+    assert metrics['total_records'] == 15
+
+
+def test_unconfigured_system_has_no_uptime(app):
+    system = HealthSystem(name='LIS Sul', system_type='LIS')
+    db.session.add(system)
+    db.session.flush()
+    for _ in range(3):
+        run_system_sync(system)
+    db.session.commit()
+
+    assert system_sync_metrics(system.id)['uptime_percentage'] is None